@@ -171,3 +171,16 @@ def relaunch_refinery(dependencies=False, migrations=False):
         run("supervisorctl restart all")
     with cd(env.refinery_project_dir):
         run("touch {refinery_app_dir}/config/wsgi_*.py".format(**env))
+
+
+@task(alias="reindex")
+@with_settings(user=env.project_user)
+def rebuild_solr_index(core="data_set_manager"):
+    """Rebuild a Solr core from the database after its schema was changed
+    core: name of the Haystack connection to rebuild (core or data_set_manager)
+    Enable REFINERY_SOLR_EXACT_UUID_FIELDS once data_set_manager was rebuilt
+    """
+    puts("Rebuilding Solr core '{}'".format(core))
+    with prefix("workon {refinery_virtualenv_name}".format(**env)):
+        run("{refinery_app_dir}/manage.py update_index --using {core} "
+            "--batch-size 25 --remove".format(core=core, **env))
@@ -345,6 +345,20 @@ CELERYBEAT_SCHEDULE = {
             'expires': 30,  # seconds
         }
     },
+    'refresh_resource_statistics': {
+        'task': 'core.tasks.refresh_resource_statistics',
+        'schedule': timedelta(minutes=5),
+        'options': {
+            'expires': 60,  # seconds
+        }
+    },
+    'process_pending_updates': {
+        'task': 'core.tasks.process_pending_updates',
+        'schedule': timedelta(seconds=10),
+        'options': {
+            'expires': 10,  # seconds
+        }
+    },
 }
 
 CHUNKED_UPLOAD_ABSTRACT_MODEL = False
@@ -376,6 +390,11 @@ AE_BASE_QUERY = 'http://www.ebi.ac.uk/arrayexpress/xml/v2/experiments?'
 AE_BASE_URL = "http://www.ebi.ac.uk/arrayexpress/experiments"
 
 ISA_TAB_DIR = get_setting("ISA_TAB_DIR")
+# number of processes used to read and validate the study and assay files of
+# an ISA-Tab archive in parallel, which is also the number of files that are
+# read ahead of the parser (files are read one by one if 0 or 1)
+REFINERY_ISA_TAB_PARSER_PROCESSES = get_setting(
+    "REFINERY_ISA_TAB_PARSER_PROCESSES", default=2)
 
 # relative to MEDIA_ROOT
 FILE_STORE_DIR = get_setting('FILE_STORE_DIR', default='file_store')
@@ -402,11 +421,74 @@ REFINERY_DATA_IMPORT_DIR = get_setting("REFINERY_DATA_IMPORT_DIR")
 
 # location of the Solr server (must be accessible from the web browser)
 REFINERY_SOLR_BASE_URL = get_setting("REFINERY_SOLR_BASE_URL")
+# Solr client: seconds to wait for a response, number of retries and initial
+# backoff in seconds for requests that fail, number of consecutive failures
+# after which requests are paused for a number of seconds (circuit breaker)
+# and number of kept-alive connections per core
+REFINERY_SOLR_TIMEOUT = get_setting("REFINERY_SOLR_TIMEOUT", default=30)
+REFINERY_SOLR_MAX_RETRIES = get_setting("REFINERY_SOLR_MAX_RETRIES",
+                                        default=2)
+REFINERY_SOLR_RETRY_BACKOFF = get_setting("REFINERY_SOLR_RETRY_BACKOFF",
+                                          default=0.5)
+REFINERY_SOLR_CIRCUIT_BREAKER_THRESHOLD = get_setting(
+    "REFINERY_SOLR_CIRCUIT_BREAKER_THRESHOLD", default=5)
+REFINERY_SOLR_CIRCUIT_BREAKER_RESET_TIMEOUT = get_setting(
+    "REFINERY_SOLR_CIRCUIT_BREAKER_RESET_TIMEOUT", default=30)
+REFINERY_SOLR_POOL_SIZE = get_setting("REFINERY_SOLR_POOL_SIZE", default=10)
+# number of documents per request when iterating over all search results
+REFINERY_SOLR_CURSOR_PAGE_SIZE = get_setting(
+    "REFINERY_SOLR_CURSOR_PAGE_SIZE", default=1000)
+# lookups of more UUIDs are split into chunks that are requested in parallel,
+# also the max number of UUIDs per OR query group (see create_uuid_query())
+REFINERY_SOLR_TERMS_CHUNK_SIZE = get_setting(
+    "REFINERY_SOLR_TERMS_CHUNK_SIZE", default=1000)
+REFINERY_SOLR_TERMS_THREADS = get_setting(
+    "REFINERY_SOLR_TERMS_THREADS", default=4)
+# look up UUIDs with terms queries on the uuid_exact and assay_uuid_exact
+# fields, only enable after the data_set_manager core was reindexed (see
+# the rebuild_solr_index fab task)
+REFINERY_SOLR_EXACT_UUID_FIELDS = get_setting(
+    "REFINERY_SOLR_EXACT_UUID_FIELDS", default=False)
+# seconds to cache file browser (AssaysFiles) responses, cached responses are
+# also invalidated when an assay is reindexed or its attribute order changes
+REFINERY_ASSAY_FILES_CACHE_TIMEOUT = get_setting(
+    "REFINERY_ASSAY_FILES_CACHE_TIMEOUT", default=3600)
+# seconds to cache the assays accessible to a user (invalidated on changes to
+# data set permissions, group memberships and investigations)
+REFINERY_ACCESSIBLE_ASSAYS_CACHE_TIMEOUT = get_setting(
+    "REFINERY_ACCESSIBLE_ASSAYS_CACHE_TIMEOUT", default=3600)
+# seconds to cache the ids of all data sets matching a search
+REFINERY_SOLR_SEARCH_IDS_CACHE_TIMEOUT = get_setting(
+    "REFINERY_SOLR_SEARCH_IDS_CACHE_TIMEOUT", default=300)
+# seconds to cache the site-wide resource statistics, has to be longer than
+# the 5 minute schedule of the refresh_resource_statistics task
+REFINERY_STATISTICS_CACHE_TIMEOUT = get_setting(
+    "REFINERY_STATISTICS_CACHE_TIMEOUT", default=900)
+# max number of queued Solr index and Neo4J updates that are coalesced and
+# applied together
+REFINERY_PENDING_UPDATES_BATCH_SIZE = get_setting(
+    "REFINERY_PENDING_UPDATES_BATCH_SIZE", default=5000)
+# queued updates that failed are retried after a delay in seconds that
+# doubles with each attempt, up to the max delay and max number of attempts
+REFINERY_PENDING_UPDATES_RETRY_DELAY = get_setting(
+    "REFINERY_PENDING_UPDATES_RETRY_DELAY", default=30)
+REFINERY_PENDING_UPDATES_MAX_RETRY_DELAY = get_setting(
+    "REFINERY_PENDING_UPDATES_MAX_RETRY_DELAY", default=3600)
+REFINERY_PENDING_UPDATES_MAX_ATTEMPTS = get_setting(
+    "REFINERY_PENDING_UPDATES_MAX_ATTEMPTS", default=20)
 
 # used to replaces spaces in the names of dynamic fields in Solr indexing
 REFINERY_SOLR_SPACE_DYNAMIC_FIELDS = get_setting(
     "REFINERY_SOLR_SPACE_DYNAMIC_FIELDS")
 
+# number of Node documents sent to Solr per request when indexing the nodes of
+# a study/assay and number of threads used to prepare the documents (no
+# threads if 0)
+REFINERY_SOLR_INDEXING_BATCH_SIZE = get_setting(
+    "REFINERY_SOLR_INDEXING_BATCH_SIZE", default=500)
+REFINERY_SOLR_INDEXING_THREADS = get_setting(
+    "REFINERY_SOLR_INDEXING_THREADS", default=0)
+
 HAYSTACK_CONNECTIONS = {
     'default': {
         # Haystack requires a default, but there's less risk of confusion
@@ -540,6 +622,8 @@ except (ValueError, subprocess.CalledProcessError) as exc:
 
 # Neo4J Settings
 NEO4J_BASE_URL = "http://localhost:7474"
+# Number of rows sent to Neo4J with a single UNWIND statement
+NEO4J_SYNC_BATCH_SIZE = get_setting("NEO4J_SYNC_BATCH_SIZE", default=1000)
 NEO4J_CONSTRAINTS = [
     {
         "label": "Class",
@@ -32,10 +32,13 @@ class AnalysisResultAdmin(ForeignKeyAutocompleteAdmin):
 
 
 class ProjectAdmin(GuardedModelAdmin):
+    # ownership is managed with the "share" permission
+    readonly_fields = ('owner',)
     list_display = ['__unicode__', 'id', 'is_catch_all']
 
 
 class WorkflowAdmin(GuardedModelAdmin, ForeignKeyAutocompleteAdmin):
+    readonly_fields = ('owner',)
     list_display = ['__unicode__', 'id', 'internal_id', 'workflow_engine',
                     'show_in_repository_mode', 'is_active', 'type']
 
@@ -65,7 +68,7 @@ class WorkflowEngineAdmin(GuardedModelAdmin, ForeignKeyAutocompleteAdmin):
 
 
 class DataSetAdmin(GuardedModelAdmin):
-    readonly_fields = ('uuid',)
+    readonly_fields = ('uuid', 'owner')
     list_display = ['__unicode__', 'id', 'name', 'file_count', 'file_size',
                     'accession', 'accession_source', 'title']
 
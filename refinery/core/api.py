@@ -8,16 +8,15 @@ import ast
 from datetime import timedelta
 import json
 import logging
-from sets import Set
 import uuid
 
 from django.conf import settings
 from django.conf.urls import url
 from django.contrib.auth.models import Group, User
-from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import get_current_site
 from django.core.cache import cache
 from django.core.mail import EmailMessage
+from django.db.models.query import QuerySet
 from django.forms import ValidationError
 from django.template import loader
 from django.utils import timezone
@@ -41,12 +40,12 @@ from tastypie.utils import trailing_slash
 from data_set_manager.api import (AssayResource, InvestigationResource,
                                   StudyResource)
 from data_set_manager.models import Study
-from file_store.models import FileStoreItem
 from .models import (Analysis, DataSet, ExtendedGroup, GroupManagement,
                      Invitation, Project, ResourceStatistics, Tutorials,
                      UserAuthentication, UserProfile, Workflow)
-from .utils import (get_data_sets_annotations, get_resources_for_user,
-                    which_default_read_perm)
+from .utils import (PermissionSnapshot, filter_by_group_perm,
+                    get_data_sets_annotations, get_resource_statistics,
+                    get_resources_for_user)
 
 logger = logging.getLogger(__name__)
 
@@ -85,25 +84,33 @@ class SharableResourceAPIInterface(object):
 
         return perms
 
-    def get_share_list(self, user, res):
+    def get_share_groups(self, user):
+        """Returns the groups (except manager groups) of a user that
+        resources can be shared with
+        """
         # Handle anonymousUsers seperatly due to request.users
         # SimpleLazyObjects loading Users vs AnonymousUsers. Can't compare
         # SLO-AnonymousUsers directly with user models
         if user.is_anonymous():
             user = get_anonymous_user()
 
-        groups_in = filter(
-            lambda g:
-            not self.is_manager_group(g) and user in g.user_set.all(),
-            Group.objects.all())
+        return list(ExtendedGroup.objects.filter(
+            user=user, manager_group__isnull=False
+        ).order_by('id'))
+
+    def get_share_list(self, user, res, snapshot=None, groups=None):
+        if snapshot is None:
+            snapshot = PermissionSnapshot(self.res_type, [res.id])
+        if groups is None:
+            groups = self.get_share_groups(user)
 
         return map(
             lambda g: {
                 'group_id': g.id,
                 'group_name': g.name,
-                'group_uuid': g.extendedgroup.uuid,
-                'perms': self.get_perms(res, g)},
-            groups_in)
+                'group_uuid': g.uuid,
+                'perms': snapshot.get_group_perms(res.id, g.id)},
+            groups)
 
     def groups_with_user(self, user):
         return filter(lambda g: user in g.user_set.all(), Group.objects.all())
@@ -126,7 +133,44 @@ class SharableResourceAPIInterface(object):
         return res_list
 
     def _build_res_list(self, user):
-        return get_resources_for_user(user, self.res_type._meta.verbose_name)
+        return get_resources_for_user(
+            user, self.res_type._meta.verbose_name
+        ).select_related('owner__profile')
+
+    def get_owned_res_list(self, user):
+        """Resources that a user can share (owned resources or all resources
+        for superusers)
+        """
+        # for ownership, don't check group perms
+        return get_objects_for_user(
+            user, 'core.share_%s' % self.res_type._meta.verbose_name,
+            use_groups=False
+        )
+
+    def set_res_attributes(self, user, res_list, **kwargs):
+        """Sets the ownership and sharing attributes that are serialized on
+        resources, with a constant number of queries
+        """
+        res_ids = [res.id for res in res_list]
+        owned_res_set = set(self.get_owned_res_list(user).filter(
+            id__in=res_ids
+        ).values_list('id', flat=True))
+        # owners and group permissions of all resources at once
+        snapshot = PermissionSnapshot(self.res_type, res_ids)
+        if 'sharing' in kwargs and kwargs['sharing']:
+            share_groups = self.get_share_groups(user)
+
+        # instantiate owner and public fields
+        for res in res_list:
+            setattr(res, 'is_owner', res.id in owned_res_set)
+            setattr(res, 'owner_uuid', snapshot.get_owner_uuid(res.id))
+            setattr(res, 'public', snapshot.is_public(res.id))
+            setattr(res, 'is_shared', snapshot.is_shared(res.id))
+
+            if 'sharing' in kwargs and kwargs['sharing']:
+                setattr(res, 'share_list', self.get_share_list(
+                    user, res, snapshot=snapshot, groups=share_groups
+                ))
 
     # Turns on certain things depending on flags
     def transform_res_list(self, user, res_list, request, **kwargs):
@@ -161,53 +205,7 @@ class SharableResourceAPIInterface(object):
                 )
 
         if cache_check is None:
-            # for ownership, don't check group perms
-            owned_res_set = Set(
-                get_objects_for_user(
-                    user,
-                    'core.share_%s' %
-                    self.res_type._meta.verbose_name,
-                    use_groups=False
-                ).values_list("id", flat=True))
-
-            public_res_set = Set(
-                get_objects_for_group(
-                    ExtendedGroup.objects.public_group(),
-                    which_default_read_perm(self.res_type._meta.verbose_name)
-                ).values_list("id", flat=True))
-
-            # Get content type, needed to map Guardian group permission.
-            content_type = ContentType.objects.get(model='dataset')
-
-            shared_res_dict = {res.id: GroupObjectPermission.objects.filter(
-                content_type_id=content_type.id,
-                object_pk=res.id
-            ).count() for res in res_list}
-
-            # instantiate owner and public fields
-            for res in res_list:
-                is_owner = res.id in owned_res_set
-                setattr(res, 'is_owner', is_owner)
-                owner = res.get_owner()
-                setattr(
-                    res,
-                    'owner',
-                    owner.profile.uuid if owner is not None else owner
-                )
-                setattr(
-                    res,
-                    'public',
-                    True if res.id in public_res_set else False
-                )
-                setattr(
-                    res,
-                    'is_shared',
-                    shared_res_dict[res.id] > 0
-                )
-
-                if 'sharing' in kwargs and kwargs['sharing']:
-                    setattr(res, 'share_list', self.get_share_list(user, res))
-
+            self.set_res_attributes(user, res_list, **kwargs)
             if user_uuid and res_list_unique:
                 cache.add('{}-{}'.format(user.id, res_list_unique), res_list)
         else:
@@ -332,7 +330,7 @@ class SharableResourceAPIInterface(object):
                 user_perms = 'none'
 
             perm_obj = {
-                'owner': mod_res[0].owner,
+                'owner': mod_res[0].owner_uuid,
                 'is_owner': mod_res[0].is_owner,
                 'share_list': mod_res[0].share_list,
                 'user_perms': user_perms
@@ -441,7 +439,7 @@ class DataSetResource(SharableResourceAPIInterface, ModelResource):
     share_list = fields.ListField(attribute='share_list', null=True)
     public = fields.BooleanField(attribute='public', null=True)
     is_owner = fields.BooleanField(attribute='is_owner', null=True)
-    owner = fields.CharField(attribute='owner', null=True)
+    owner = fields.CharField(attribute='owner_uuid', null=True)
     is_shared = fields.BooleanField(attribute='is_shared', null=True)
     file_size = fields.IntegerField(attribute='file_size')
 
@@ -527,8 +525,17 @@ class DataSetResource(SharableResourceAPIInterface, ModelResource):
             sorting = 'modification_date'
             reverse = True
 
+        if isinstance(obj_list, QuerySet):
+            if sorting in [field.name for field in
+                           self.res_type._meta.concrete_fields]:
+                # sort in the database so that only one page is loaded
+                return obj_list.order_by(
+                    '-' + sorting if reverse else sorting, '-id'
+                )
+            obj_list = list(obj_list)
+
         obj_list.sort(
-            key=lambda x: getattr(x, sorting),
+            key=lambda x: getattr(x, sorting, None),
             reverse=reverse
         )
 
@@ -621,17 +628,41 @@ class DataSetResource(SharableResourceAPIInterface, ModelResource):
                 group = None
 
             if group:
-                filtered_obj_list = []
-                group_obj_list = list(get_objects_for_group(
-                    group, 'core.read_meta_dataset'
-                ))
-                # The order of checking obj_list instead of
-                # group_obj_list matters. Possible reason is obj_list is
-                # referenced in the bundle data from parent method.
-                for obj in obj_list:
-                    if obj in group_obj_list:
-                        filtered_obj_list.append(obj)
-                return filtered_obj_list
+                return filter_by_group_perm(obj_list, group.id,
+                                            'read_meta_dataset')
+
+        return obj_list
+
+    def filter_by_flags(self, request, obj_list):
+        """Applies the is_owner and public query flags in the database"""
+        user = request.user
+        if not user.is_authenticated():
+            user = get_anonymous_user()
+
+        is_owner = request.GET.get('is_owner')
+        if is_owner == 'True':
+            obj_list = obj_list.filter(
+                id__in=self.get_owned_res_list(user).values('id')
+            )
+        elif is_owner == 'False':
+            obj_list = obj_list.exclude(
+                id__in=self.get_owned_res_list(user).values('id')
+            )
+
+        public = request.GET.get('public')
+        if public == 'True':
+            obj_list = filter_by_group_perm(
+                obj_list, settings.REFINERY_PUBLIC_GROUP_ID,
+                'read_meta_dataset'
+            )
+        elif public == 'False':
+            obj_list = obj_list.exclude(id__in=filter_by_group_perm(
+                self.res_type.objects.all(),
+                settings.REFINERY_PUBLIC_GROUP_ID, 'read_meta_dataset'
+            ).values('id'))
+
+        if 'uuid' in request.GET:
+            obj_list = obj_list.filter(uuid=request.GET['uuid'])
 
         return obj_list
 
@@ -651,25 +682,50 @@ class DataSetResource(SharableResourceAPIInterface, ModelResource):
         return super(DataSetResource, self).obj_get(bundle, **kwargs)
 
     def obj_get_list(self, bundle, **kwargs):
-        datasets = super(DataSetResource, self).obj_get_list(bundle, **kwargs)
-
-        valid_datasets = []
-        for dataset in datasets:
-            if dataset.is_valid:
-                valid_datasets.append(dataset)
-            else:
-                logger.error(
-                    "DataSet with UUID: {} is invalid, and most likely is "
-                    "still being created".format(dataset.uuid)
-                )
-        return valid_datasets
+        return self.get_object_list(bundle.request)
 
     def get_object_list(self, request):
-        obj_list = SharableResourceAPIInterface.get_object_list(self, request)
+        """Filtered queryset of the data sets that a user can read, which is
+        only evaluated for the requested page in get_list()
+        """
+        # data sets without a summary are still being created
+        obj_list = self._build_res_list(request.user).filter(
+            summary__isnull=False
+        )
+        obj_list = self.filter_by_flags(request, obj_list)
         obj_list = self.filter_by_group(request, obj_list)
 
         return obj_list
 
+    def get_list(self, request, **kwargs):
+        """Same as ModelResource.get_list() but sets the ownership and sharing
+        attributes only on the data sets of the requested page
+        """
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle,
+                                    **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+
+        paginator = self._meta.paginator_class(
+            request.GET, sorted_objects,
+            resource_uri=self.get_resource_uri(), limit=self._meta.limit,
+            max_limit=self._meta.max_limit,
+            collection_name=self._meta.collection_name
+        )
+        to_be_serialized = paginator.page()
+
+        page = list(to_be_serialized[self._meta.collection_name])
+        self.set_res_attributes(request.user, page)
+        to_be_serialized[self._meta.collection_name] = [
+            self.full_dehydrate(self.build_bundle(obj=obj, request=request),
+                                for_list=True)
+            for obj in page
+        ]
+        to_be_serialized = self.alter_list_data_to_serialize(
+            request, to_be_serialized
+        )
+        return self.create_response(request, to_be_serialized)
+
     def obj_create(self, bundle, **kwargs):
         return SharableResourceAPIInterface.obj_create(self, bundle, **kwargs)
 
@@ -1020,28 +1076,6 @@ class StatisticsResource(Resource):
         resource_name = 'statistics'
         object_class = ResourceStatistics
 
-    def stat_summary(self, model, unique_workflows=False):
-
-        if not unique_workflows:
-            model_list = model.objects.all()
-        else:
-            # Filter out inactive workflows
-            model_list = model.objects.filter(is_active=True)
-
-        total = len(model_list)
-
-        public = len(filter(lambda x: x.is_public(), model_list))
-
-        private_shared = len(filter(
-            lambda x: not x.is_public() and len(x.get_groups()) > 1,
-            model_list))
-
-        private = total - public - private_shared
-        return {
-            'total': total, 'public': public,
-            'private': private, 'private_shared': private_shared
-        }
-
     def detail_uri_kwargs(self, bundle_or_obj):
         kwargs = {}
         kwargs['pk'] = uuid.uuid1()
@@ -1051,34 +1085,25 @@ class StatisticsResource(Resource):
         return self.get_object_list(bundle.request)
 
     def get_object_list(self, request):
-
-        user_count = User.objects.count()
-        group_count = Group.objects.count()
-        files_count = FileStoreItem.objects.count()
-        dataset_summary = {}
-        workflow_summary = {}
-        project_summary = {}
-
-        if 'dataset' in request.GET:
-            dataset_summary = self.stat_summary(DataSet)
-        if 'workflow' in request.GET:
-            workflow_summary = self.stat_summary(Workflow, True)
-        if 'project' in request.GET:
-            project_summary = self.stat_summary(Project)
-
-        request_string = request.GET.get('type')
-
-        if request_string is not None:
-            if 'dataset' in request_string:
-                dataset_summary = self.stat_summary(DataSet)
-            if 'workflow' in request_string:
-                workflow_summary = self.stat_summary(Workflow)
-            if 'project' in request_string:
-                project_summary = self.stat_summary(Project)
+        # computed with aggregate queries and cached, see
+        # core.tasks.refresh_resource_statistics
+        statistics = get_resource_statistics()
+        request_string = request.GET.get('type') or ''
+        summaries = {}
+        for res_type in ['dataset', 'workflow', 'project']:
+            summaries[res_type] = {}
+            # inactive workflows are only excluded by the workflow parameter
+            if res_type in request.GET:
+                summaries[res_type] = statistics[
+                    'active_workflow' if res_type == 'workflow' else res_type
+                ]
+            if res_type in request_string:
+                summaries[res_type] = statistics[res_type]
 
         return [ResourceStatistics(
-            user_count, group_count, files_count,
-            dataset_summary, workflow_summary, project_summary)]
+            statistics['user'], statistics['group'], statistics['files'],
+            summaries['dataset'], summaries['workflow'],
+            summaries['project'])]
 
 
 class GroupManagementResource(Resource):
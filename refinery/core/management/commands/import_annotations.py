@@ -12,6 +12,7 @@ import py2neo
 import requests
 
 from core.models import DataSet, ExtendedGroup
+from core.neo4j_sync import Neo4jSync
 from core.utils import (get_data_set_annotations, normalize_annotation_ont_ids,
                         normalize_annotation_uris)
 
@@ -31,111 +32,30 @@ class Command(BaseCommand):
             dest='clear',
             help='Clear annotations before import'
         )
-
-    def push_annotations_to_neo4j(self, annotations):
-        # We currently disabled authentication as Neo4J is only accessible
-        # locally.
-        # py2neo.authenticate(settings.NEO4J_BASE_URL)
-
-        # Connects to `http://localhost:7474/db/data/` by default.
-        graph = py2neo.Graph(
-            urlparse.urljoin(settings.NEO4J_BASE_URL, 'db/data')
-        )
-
-        # Begin transaction
-        tx = graph.cypher.begin()
-
-        counter = 1
-
-        statement_name = (
-            "MATCH (term:Class {name:{ont_id}}) "
-            "MERGE (ds:DataSet {id:{ds_id},uuid:{ds_uuid}}) "
-            "MERGE ds-[r:`annotated_with`]->term "
-            "SET r.count = {count}"
-        )
-        statement_uri = (
-            "MATCH (term:Class {uri:{uri}}) "
-            "MERGE (ds:DataSet {id:{ds_id},uuid:{ds_uuid}}) "
-            "MERGE ds-[r:`annotated_with`]->term "
-            "SET r.count = {count}"
-        )
-
-        for annotation in annotations:
-            if ('value_uri' in annotation):
-                tx.append(
-                    statement_uri,
-                    {
-                        'uri': annotation['value_uri'],
-                        'ds_id': annotation['data_set_id'],
-                        'ds_uuid': annotation['data_set_uuid'],
-                        'count': annotation['value_count']
-                    }
-                )
-            elif (annotation['value_accession'].startswith('http://')):
-                tx.append(
-                    statement_uri,
-                    {
-                        'uri': annotation['value_accession'],
-                        'ds_id': annotation['data_set_id'],
-                        'ds_uuid': annotation['data_set_uuid'],
-                        'count': annotation['value_count']
-                    }
-                )
-            else:
-                tx.append(
-                    statement_name,
-                    {
-                        'ont_id': (
-                            annotation['value_source'].upper() +
-                            ':' +
-                            annotation['value_accession']
-                        ),
-                        'ds_id': annotation['data_set_id'],
-                        'ds_uuid': annotation['data_set_uuid'],
-                        'count': annotation['value_count']
-                    }
-                )
-
-            # Send batches of 50 Cypher queries to Neo4J
-            if (counter % 50 == 0):
-                tx.process()
-
-            # Increase counter
-            counter = counter + 1
-
-        # Commit transaction
-        tx.commit()
-
-    def push_users(self):
-        datasets = DataSet.objects.all()
-
-        graph = py2neo.Graph(
-            urlparse.urljoin(settings.NEO4J_BASE_URL, 'db/data')
+        parser.add_argument(
+            '-n',
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Only report the annotations and read access rules that '
+                 'would be added to Neo4J'
         )
 
-        tx = graph.cypher.begin()
-
-        statement_user = (
-            "MERGE (u:User {id:{user_id}, name:{user_name}}) WITH u "
-            "MATCH (ds:DataSet {uuid:{ds_uuid}}) "
-            "MERGE (ds)<-[:`read_access`]-(u)"
-        )
+    def push_users(self, sync):
+        datasets = DataSet.objects.select_related('owner')
 
         public_group_id = ExtendedGroup.objects.public_group().id
 
         for dataset in datasets:
             owner = dataset.get_owner()
-            users = [{
-                'id': owner.id,
-                'name': str(owner)
-            }]
+            users = [(owner.id, str(owner))]
             groups = dataset.get_groups()
 
             # Collect all users per group
             for group in groups:
 
                 users += map(
-                    lambda u: {'id': u.id, 'name': str(u)},
+                    lambda u: (u.id, str(u)),
                     group['group'].user_set.all()
                 )
 
@@ -149,24 +69,9 @@ class Command(BaseCommand):
                                        "AnonymousUser: {}".format(e))
 
                 if group['group'].id is public_group_id:
-                    users += [{
-                        'id': anon_user.id,
-                        'name': anon_user.username
-                    }]
-
-            for user in users:
-                tx.append(
-                    statement_user,
-                    {
-                        'user_id': user['id'],
-                        'user_name': user['name'],
-                        'ds_uuid': dataset.uuid
-                    }
-                )
+                    users += [(anon_user.id, anon_user.username)]
 
-            tx.process()
-
-        tx.commit()
+            sync.add_read_access([dataset.uuid], users)
 
     def handle(self, *args, **options):
         verbosity = int(options['verbosity'])
@@ -180,6 +85,9 @@ class Command(BaseCommand):
         if verbosity > 2:
             root_logger.setLevel(logging.DEBUG)
 
+        if options['dry_run'] and options['clear']:
+            raise CommandError("--clear can't be used with --dry-run")
+
         if options['clear']:
             self.stdout.write('Clear existing annotations and users...')
             start = time.time()
@@ -211,8 +119,21 @@ class Command(BaseCommand):
         annotations = get_data_set_annotations(None)
         annotations = normalize_annotation_uris(annotations)
         annotations = normalize_annotation_ont_ids(annotations)
-        self.push_annotations_to_neo4j(annotations)
-        self.push_users()
+        # We currently disabled authentication as Neo4J is only accessible
+        # locally.
+        # py2neo.authenticate(settings.NEO4J_BASE_URL)
+        sync = Neo4jSync()
+        sync.add_annotations(annotations)
+        self.push_users(sync)
+
+        if options['dry_run']:
+            for name, rows in sync.diff().iteritems():
+                self.stdout.write('{}: {} of {} rows would change'.format(
+                    name, len(rows), len(sync.rows[name])
+                ))
+            return
+
+        sync.apply()
 
         try:
             requests.post(
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+POPULATE_DATA_SET_ANNOTATIONS_SQL = """INSERT INTO core_datasetannotation
+    (data_set_id, value_source, value_accession, is_factor, count)
+  SELECT
+    investigation.data_set_id,
+    annotation.value_source,
+    annotation.value_accession,
+    annotation.is_factor,
+    COUNT(*)
+  FROM
+    core_investigationlink AS investigation
+    JOIN
+    data_set_manager_study AS study
+    ON
+    study.investigation_id = investigation.investigation_id
+    JOIN
+    (
+      SELECT
+        node.study_id,
+        attr.value_source,
+        attr.value_accession,
+        FALSE AS is_factor
+      FROM
+        data_set_manager_node AS node
+        JOIN
+        data_set_manager_attribute AS attr
+        ON
+        node.id = attr.node_id
+      WHERE
+        attr.value_source IS NOT NULL AND
+        attr.value_source NOT LIKE '' AND (
+            attr.value_unit IS NULL OR
+            attr.value_unit = ''
+        )
+
+      UNION ALL
+
+      SELECT
+        study_id,
+        measurement_source AS value_source,
+        measurement_accession AS value_accession,
+        FALSE AS is_factor
+      FROM
+        data_set_manager_assay
+      WHERE
+        measurement_accession IS NOT NULL AND
+        measurement_accession NOT LIKE ''
+
+      UNION ALL
+
+      SELECT
+        study_id,
+        technology_source AS value_source,
+        technology_accession AS value_accession,
+        FALSE AS is_factor
+      FROM
+        data_set_manager_assay
+      WHERE
+        technology_accession IS NOT NULL AND
+        technology_accession NOT LIKE ''
+
+      UNION ALL
+
+      SELECT
+        study_id,
+        type_source AS value_source,
+        type_accession AS value_accession,
+        TRUE AS is_factor
+      FROM
+        data_set_manager_factor
+      WHERE
+        type_accession IS NOT NULL AND
+        type_accession NOT LIKE ''
+    ) AS annotation
+    ON
+    annotation.study_id = study.nodecollection_ptr_id
+  GROUP BY
+    investigation.data_set_id,
+    annotation.value_source,
+    annotation.value_accession,
+    annotation.is_factor
+"""
+
+
+def populate_data_set_annotations(apps, schema_editor):
+    # a copy of the SQL run by DataSetAnnotationManager.refresh(), the live
+    # manager can't be used in migrations
+    DataSet = apps.get_model("core", "DataSet")
+    if DataSet.objects.exists():
+        schema_editor.execute(POPULATE_DATA_SET_ANNOTATIONS_SQL)
+
+
+def noop(apps, schema_editor):
+    return None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_set_manager', '0007_annotatednoderegistry_content_hash'),
+        ('core', '0028_auto_20180611_1640'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSetAnnotation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('value_source', models.TextField(null=True, blank=True)),
+                ('value_accession', models.TextField(null=True, blank=True)),
+                ('is_factor', models.BooleanField(default=False)),
+                ('count', models.IntegerField(default=0)),
+                ('data_set', models.ForeignKey(to='core.DataSet')),
+            ],
+        ),
+        migrations.RunPython(populate_data_set_annotations, noop),
+    ]
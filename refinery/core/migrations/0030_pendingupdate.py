@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_datasetannotation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUpdate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=20, choices=[
+                    ('index', 'Update data set index'),
+                    ('delete', 'Delete data set from index and Neo4J'),
+                    ('add_read_access', 'Add read access in Neo4J'),
+                    ('remove_read_access', 'Remove read access in Neo4J'),
+                    ('annotation_sets', 'Update annotation sets in Neo4J')
+                ])),
+                ('data_set_id', models.IntegerField(null=True, blank=True)),
+                ('data_set_uuid', models.CharField(max_length=36,
+                                                   blank=True)),
+                ('user_id', models.IntegerField(null=True, blank=True)),
+                ('username', models.CharField(max_length=30, blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
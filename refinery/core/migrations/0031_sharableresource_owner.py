@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_owners(apps, schema_editor):
+    """Copy the owner of every data set, project and workflow from its
+    "share" user object permission
+    """
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    UserObjectPermission = apps.get_model("guardian", "UserObjectPermission")
+
+    for model_name in ["dataset", "project", "workflow"]:
+        model = apps.get_model("core", model_name)
+        try:
+            content_type = ContentType.objects.get(app_label="core",
+                                                   model=model_name)
+        except ContentType.DoesNotExist:
+            # new database without any resources
+            continue
+        owners = {}
+        for object_pk, user_id in UserObjectPermission.objects.filter(
+                content_type=content_type,
+                permission__codename="share_%s" % model_name
+        ).order_by("id").values_list("object_pk", "user_id"):
+            owners.setdefault(int(object_pk), user_id)
+        for res_id, user_id in owners.iteritems():
+            model.objects.filter(id=res_id).update(owner_id=user_id)
+
+
+def noop(apps, schema_editor):
+    return None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('guardian', '0001_initial'),
+        ('core', '0030_pendingupdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='owner',
+            field=models.ForeignKey(
+                related_name='+', on_delete=django.db.models.deletion.SET_NULL,
+                blank=True, to=settings.AUTH_USER_MODEL, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='owner',
+            field=models.ForeignKey(
+                related_name='+', on_delete=django.db.models.deletion.SET_NULL,
+                blank=True, to=settings.AUTH_USER_MODEL, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='workflow',
+            name='owner',
+            field=models.ForeignKey(
+                related_name='+', on_delete=django.db.models.deletion.SET_NULL,
+                blank=True, to=settings.AUTH_USER_MODEL, null=True
+            ),
+        ),
+        migrations.RunPython(populate_owners, noop),
+    ]
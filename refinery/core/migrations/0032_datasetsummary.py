@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_data_set_summaries(apps, schema_editor):
+    # file sizes are not known yet, they are filled in by the queued summary
+    # refreshes (see DataSetSummaryManager.refresh)
+    DataSet = apps.get_model("core", "DataSet")
+    DataSetSummary = apps.get_model("core", "DataSetSummary")
+    InvestigationLink = apps.get_model("core", "InvestigationLink")
+    Analysis = apps.get_model("core", "Analysis")
+    PendingUpdate = apps.get_model("core", "PendingUpdate")
+    Node = apps.get_model("data_set_manager", "Node")
+    VisualizationTool = apps.get_model("tool_manager", "VisualizationTool")
+
+    summaries = []
+    for data_set in DataSet.objects.all():
+        link = InvestigationLink.objects.filter(
+            data_set=data_set
+        ).order_by('-date').first()
+        if link is None:
+            continue
+        analyses = Analysis.objects.filter(data_set=data_set)
+        summaries.append(DataSetSummary(
+            data_set=data_set,
+            latest_investigation_link=link,
+            version=link.version,
+            file_count=Node.objects.filter(
+                study__investigation_id=link.investigation_id,
+                file_uuid__isnull=False
+            ).count(),
+            analysis_count=analyses.count(),
+            is_clean=not (
+                analyses.exclude(status="FAILURE").exists() or
+                VisualizationTool.objects.filter(dataset=data_set).exists()
+            )
+        ))
+    DataSetSummary.objects.bulk_create(summaries)
+    PendingUpdate.objects.bulk_create([
+        PendingUpdate(kind='summary', data_set_id=summary.data_set_id)
+        for summary in summaries
+    ])
+
+
+def noop(apps, schema_editor):
+    return None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_store', '0009_xls_filetypes_and_fileextensions'),
+        ('tool_manager', '0028_tooldefinition_mem_reservation_mb'),
+        ('data_set_manager', '0007_annotatednoderegistry_content_hash'),
+        ('core', '0031_sharableresource_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSetSummary',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('version', models.IntegerField(null=True, blank=True)),
+                ('file_count', models.IntegerField(default=0)),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('analysis_count', models.IntegerField(default=0)),
+                ('is_clean', models.BooleanField(default=True)),
+                ('data_set', models.OneToOneField(related_name='summary',
+                                                  to='core.DataSet')),
+                ('latest_investigation_link', models.ForeignKey(
+                    related_name='+',
+                    on_delete=django.db.models.deletion.SET_NULL,
+                    blank=True, to='core.InvestigationLink', null=True
+                )),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='pendingupdate',
+            name='kind',
+            field=models.CharField(max_length=20, choices=[
+                ('index', 'Update data set index'),
+                ('delete', 'Delete data set from index and Neo4J'),
+                ('add_read_access', 'Add read access in Neo4J'),
+                ('remove_read_access', 'Remove read access in Neo4J'),
+                ('annotation_sets', 'Update annotation sets in Neo4J'),
+                ('summary', 'Refresh data set summary')
+            ]),
+        ),
+        migrations.RunPython(populate_data_set_summaries, noop),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_datasetsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingupdate',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pendingupdate',
+            name='next_attempt',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
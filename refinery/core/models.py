@@ -7,7 +7,7 @@ from __future__ import absolute_import
 
 import ast
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import logging
 import os
@@ -19,15 +19,17 @@ from django import forms
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth.models import Group, Permission, User
+from django.contrib.auth.models import Group, User
 from django.contrib.auth.signals import user_logged_in
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.messages import get_messages, info
 from django.contrib.sites.models import Site
 from django.core.mail import send_mail
-from django.db import models, transaction
+from django.db import connection, models, transaction
+from django.db.models import Q
 from django.db.models.fields import IntegerField
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.dispatch import receiver
 from django.forms import ValidationError
 from django.template import loader
@@ -39,12 +41,11 @@ from cuser.middleware import CuserMiddleware
 from django.utils.functional import cached_property
 from django_auth_ldap.backend import LDAPBackend
 from django_extensions.db.fields import UUIDField
-from guardian.models import UserObjectPermission
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from guardian.shortcuts import (
     assign_perm, get_groups_with_perms, get_objects_for_group,
     get_users_with_perms, remove_perm
 )
-import pysolr
 from registration.models import RegistrationManager, RegistrationProfile
 from registration.signals import user_activated, user_registered
 
@@ -56,17 +57,19 @@ from data_set_manager.search_indexes import NodeIndex
 from data_set_manager.utils import (
     add_annotated_nodes_selection, index_annotated_nodes_selection
 )
-from file_store.models import FileStoreItem, FileType
+from file_store.models import FileStoreItem, FileType, get_total_file_size
 from file_store.tasks import FileImportTask
 from galaxy_connector.models import Instance
 import tool_manager
 
+from .neo4j_sync import Neo4jSync
+from .solr_client import get_solr_client
 from .utils import (
-    add_or_update_user_to_neo4j, add_read_access_in_neo4j,
-    async_update_annotation_sets_neo4j, delete_data_set_index,
-    delete_data_set_neo4j, delete_ontology_from_neo4j, delete_user_in_neo4j,
-    email_admin, invalidate_cached_object, remove_read_access_in_neo4j,
-    skip_if_test_run, sync_update_annotation_sets_neo4j, update_data_set_index
+    DATA_SET_ACCESS_VERSION_KEY, add_or_update_user_to_neo4j,
+    bump_cache_version, delete_data_set_index, delete_data_set_neo4j,
+    delete_ontology_from_neo4j, delete_user_in_neo4j, email_admin,
+    invalidate_cached_object, invalidate_data_set_access, skip_if_test_run,
+    sync_update_annotation_sets_neo4j, update_data_set_index
 )
 
 logger = logging.getLogger(__name__)
@@ -363,39 +366,32 @@ class SharableResource(OwnableResource):
     permissions, where "xxx" is the simple_modelname
     """
     share_list = None
+    # copy of the user with the "share" permission for fast lookups, kept in
+    # sync by set_owner() and remove_owner()
+    owner = models.ForeignKey(User, blank=True, null=True, related_name='+',
+                              on_delete=models.SET_NULL)
 
     def __unicode__(self):
         return self.name
 
     def get_owner(self):
-        owner = None
-
-        content_type_id = ContentType.objects.get_for_model(self).id
-        permission_id = Permission.objects.filter(
-            codename='share_%s' % self._meta.verbose_name
-        )[0].id
-
-        perms = UserObjectPermission.objects.filter(
-            content_type_id=content_type_id,
-            permission_id=permission_id,
-            object_pk=self.id
-        )
-
-        if perms.count() > 0:
-            try:
-                owner = User.objects.get(id=perms[0].user_id)
-            except User.DoesNotExist:
-                pass
-
-        return owner
+        return self.owner
 
     def set_owner(self, user):
         super(SharableResource, self).set_owner(user)
         assign_perm("share_%s" % self._meta.verbose_name, user, self)
+        self._update_owner(user)
 
     def remove_owner(self, user):
         super(SharableResource, self).remove_owner(user)
         remove_perm("share_%s" % self._meta.verbose_name, user, self)
+        if self.owner_id == user.id:
+            self._update_owner(None)
+
+    def _update_owner(self, user):
+        self.owner = user
+        # avoid post_save handlers, only the owner column changes
+        type(self).objects.filter(id=self.id).update(owner=user)
 
     """
     Sharing something always grants read and add permission
@@ -573,7 +569,8 @@ class DataSet(SharableResource):
                 self.name)
 
     def get_analyses(self):
-        return Analysis.objects.filter(data_set=self)
+        # uses analyses loaded with prefetch_related('analysis_set')
+        return self.analysis_set.all()
 
     def get_investigation_links(self):
         return InvestigationLink.objects.filter(data_set=self)
@@ -663,6 +660,15 @@ class DataSet(SharableResource):
     def get_assays(self, version=None):
         return Assay.objects.filter(study=self.get_studies(version))
 
+    def get_summary(self):
+        """Returns the DataSetSummary or None for data sets that are still
+        being created
+        """
+        try:
+            return self.summary
+        except DataSetSummary.DoesNotExist:
+            return None
+
     def get_file_count(self):
         """Returns the number of files in the data set"""
         investigation = self.get_investigation()
@@ -682,8 +688,9 @@ class DataSet(SharableResource):
         file_uuids = Node.objects.filter(
             study__in=investigation.study_set.all(), file_uuid__isnull=False
         ).values_list('file_uuid', flat=True)
-        file_items = FileStoreItem.objects.filter(uuid__in=file_uuids)
-        return sum([item.get_file_size() for item in file_items])
+        return get_total_file_size(
+            FileStoreItem.objects.filter(uuid__in=file_uuids)
+        )
 
     def share(self, group, readonly=True, readmetaonly=False):
         # change: !readonly & !readmetaonly, read: readonly & !readmetaonly
@@ -697,7 +704,7 @@ class DataSet(SharableResource):
             remove_perm('add_%s' % self._meta.verbose_name, group, self)
             remove_perm('change_%s' % self._meta.verbose_name, group, self)
 
-        update_data_set_index(self)
+        PendingUpdate.objects.index_data_set(self)
         invalidate_cached_object(self)
         user_ids = map(lambda user: user.id, group.user_set.all())
 
@@ -705,16 +712,13 @@ class DataSet(SharableResource):
         if group.id == ExtendedGroup.objects.public_group().id:
             user_ids.append(-1)
 
-        add_read_access_in_neo4j(
-            [self.uuid],
-            user_ids
-        )
+        PendingUpdate.objects.add_read_access([self.uuid], user_ids)
 
     def unshare(self, group):
         super(DataSet, self).unshare(group)
         remove_perm('read_meta_%s' % self._meta.verbose_name, group, self)
 
-        update_data_set_index(self)
+        PendingUpdate.objects.index_data_set(self)
         # Need to check if the users of the group that is unshared still have
         # access via other groups or by ownership
         users = group.user_set.all()
@@ -728,10 +732,7 @@ class DataSet(SharableResource):
             user_ids.append(-1)
 
         if user_ids:
-            remove_read_access_in_neo4j(
-                [self.uuid],
-                user_ids
-            )
+            PendingUpdate.objects.remove_read_access([self.uuid], user_ids)
 
     def get_file_store_items(self):
         """Get a list of FileStoreItem instances corresponding to a
@@ -858,16 +859,15 @@ def _dataset_delete(sender, instance, *args, **kwargs):
         for investigation_link in instance.get_investigation_links():
             investigation_link.get_node_collection().delete()
 
-    delete_data_set_index(instance)
-    delete_data_set_neo4j(instance.uuid)
-    async_update_annotation_sets_neo4j()
+    PendingUpdate.objects.delete_data_set(instance)
+    PendingUpdate.objects.update_annotation_sets()
     invalidate_cached_object(instance)
 
 
 @receiver(post_save, sender=DataSet)
 def _dataset_saved(sender, instance, *args, **kwargs):
-    async_update_annotation_sets_neo4j()
-    update_data_set_index(instance)
+    PendingUpdate.objects.update_annotation_sets()
+    PendingUpdate.objects.index_data_set(instance)
     invalidate_cached_object(instance)
 
     # Invalidate cached properties on save
@@ -900,6 +900,499 @@ class InvestigationLink(models.Model):
         return NodeCollection.objects.get(uuid=self.investigation.uuid)
 
 
+class DataSetAnnotationManager(models.Manager):
+    def refresh(self, data_set_ids):
+        """Recounts the ontology annotations of all investigations of the
+        given data sets
+        """
+        data_set_ids = list(data_set_ids)
+        if not data_set_ids:
+            return
+        sql = """INSERT INTO core_datasetannotation
+            (data_set_id, value_source, value_accession, is_factor, count)
+          SELECT
+            investigation.data_set_id,
+            annotation.value_source,
+            annotation.value_accession,
+            annotation.is_factor,
+            COUNT(*)
+          FROM
+            core_investigationlink AS investigation
+            JOIN
+            data_set_manager_study AS study
+            ON
+            study.investigation_id = investigation.investigation_id
+            JOIN
+            (
+              SELECT
+                node.study_id,
+                attr.value_source,
+                attr.value_accession,
+                FALSE AS is_factor
+              FROM
+                data_set_manager_node AS node
+                JOIN
+                data_set_manager_attribute AS attr
+                ON
+                node.id = attr.node_id
+              WHERE
+                attr.value_source IS NOT NULL AND
+                attr.value_source NOT LIKE '' AND (
+                    attr.value_unit IS NULL OR
+                    attr.value_unit = ''
+                )
+
+              UNION ALL
+
+              SELECT
+                study_id,
+                measurement_source AS value_source,
+                measurement_accession AS value_accession,
+                FALSE AS is_factor
+              FROM
+                data_set_manager_assay
+              WHERE
+                measurement_accession IS NOT NULL AND
+                measurement_accession NOT LIKE ''
+
+              UNION ALL
+
+              SELECT
+                study_id,
+                technology_source AS value_source,
+                technology_accession AS value_accession,
+                FALSE AS is_factor
+              FROM
+                data_set_manager_assay
+              WHERE
+                technology_accession IS NOT NULL AND
+                technology_accession NOT LIKE ''
+
+              UNION ALL
+
+              SELECT
+                study_id,
+                type_source AS value_source,
+                type_accession AS value_accession,
+                TRUE AS is_factor
+              FROM
+                data_set_manager_factor
+              WHERE
+                type_accession IS NOT NULL AND
+                type_accession NOT LIKE ''
+            ) AS annotation
+            ON
+            annotation.study_id = study.nodecollection_ptr_id
+          WHERE
+            investigation.data_set_id IN ({})
+          GROUP BY
+            investigation.data_set_id,
+            annotation.value_source,
+            annotation.value_accession,
+            annotation.is_factor
+        """.format(", ".join(["%s"] * len(data_set_ids)))
+
+        with transaction.atomic():
+            self.filter(data_set_id__in=data_set_ids).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, data_set_ids)
+
+
+class DataSetAnnotation(models.Model):
+    """Materialized ontology annotation counts of a data set (across all of
+    its investigations) for fast annotation lookups in searches
+    """
+    data_set = models.ForeignKey(DataSet)
+    value_source = models.TextField(blank=True, null=True)
+    value_accession = models.TextField(blank=True, null=True)
+    # annotation of an experimental factor type (not a node or assay)
+    is_factor = models.BooleanField(default=False)
+    count = models.IntegerField(default=0)
+
+    objects = DataSetAnnotationManager()
+
+    def __unicode__(self):
+        return "{}: {} ({})".format(self.data_set_id, self.value_accession,
+                                    self.count)
+
+
+def _get_data_set_user_ids(data_set_id):
+    """Returns the IDs of the users with permissions on a data set, directly
+    or through their groups, and of all superusers
+    """
+    content_type = ContentType.objects.get_for_model(DataSet)
+    # guardian stores object primary keys as strings
+    object_pk = str(data_set_id)
+    return User.objects.filter(
+        Q(id__in=UserObjectPermission.objects.filter(
+            content_type=content_type, object_pk=object_pk
+        ).values('user_id')) |
+        Q(groups__in=GroupObjectPermission.objects.filter(
+            content_type=content_type, object_pk=object_pk
+        ).values('group_id')) |
+        Q(is_superuser=True)
+    ).values_list('id', flat=True).distinct()
+
+
+@receiver([post_save, post_delete], sender=InvestigationLink)
+def _investigation_link_changed(sender, instance, **kwargs):
+    # the latest investigation of a data set determines its assays
+    invalidate_data_set_access(_get_data_set_user_ids(instance.data_set_id))
+    # new or revised investigations change the annotations of the data set
+    DataSetAnnotation.objects.refresh([instance.data_set_id])
+    DataSetSummary.objects.refresh([instance.data_set_id])
+
+
+class DataSetSummaryManager(models.Manager):
+    def refresh(self, data_set_ids):
+        """Recomputes the summaries of the given data sets. Data sets without
+        an investigation (still being created) have no summary.
+        """
+        for data_set in DataSet.objects.filter(id__in=data_set_ids):
+            try:
+                link = InvestigationLink.objects.filter(
+                    data_set=data_set
+                ).latest('date')
+            except InvestigationLink.DoesNotExist:
+                self.filter(data_set=data_set).delete()
+                continue
+
+            file_uuids = list(Node.objects.filter(
+                study__investigation=link.investigation_id,
+                file_uuid__isnull=False
+            ).values_list('file_uuid', flat=True))
+            file_size = get_total_file_size(
+                FileStoreItem.objects.filter(uuid__in=file_uuids)
+            )
+
+            fields = {
+                'latest_investigation_link': link,
+                'version': link.version,
+                'file_count': len(file_uuids),
+                'file_size': file_size
+            }
+            fields.update(self._get_analysis_fields(data_set.id))
+            self.update_or_create(data_set=data_set, defaults=fields)
+
+    def refresh_analyses(self, data_set_ids):
+        """Recomputes only the analysis count and the clean flag"""
+        for data_set_id in set(data_set_ids):
+            self.filter(data_set_id=data_set_id).update(
+                **self._get_analysis_fields(data_set_id)
+            )
+
+    def _get_analysis_fields(self, data_set_id):
+        analyses = Analysis.objects.filter(data_set_id=data_set_id)
+        # failed analyses don't yield derived results (see DataSet.is_clean)
+        has_non_failed_analyses = analyses.exclude(
+            status=Analysis.FAILURE_STATUS
+        ).exists()
+        has_visualizations = \
+            tool_manager.models.VisualizationTool.objects.filter(
+                dataset_id=data_set_id
+            ).exists()
+        return {
+            'analysis_count': analyses.count(),
+            'is_clean': not (has_non_failed_analyses or has_visualizations)
+        }
+
+
+class DataSetSummary(models.Model):
+    """Precomputed properties of a data set for fast data set listings"""
+    data_set = models.OneToOneField(DataSet, related_name='summary')
+    latest_investigation_link = models.ForeignKey(
+        InvestigationLink, blank=True, null=True, related_name='+',
+        on_delete=models.SET_NULL
+    )
+    version = models.IntegerField(blank=True, null=True)
+    file_count = models.IntegerField(default=0)
+    # bytes used by all files of the latest investigation
+    file_size = models.BigIntegerField(default=0)
+    analysis_count = models.IntegerField(default=0)
+    is_clean = models.BooleanField(default=True)
+
+    objects = DataSetSummaryManager()
+
+    def __unicode__(self):
+        return "{}: version {}, {} files".format(self.data_set_id,
+                                                 self.version, self.file_count)
+
+
+@receiver(post_delete, sender=DataSet)
+def _data_set_deleted(sender, instance, **kwargs):
+    # handlers of related objects that are deleted along with the data set
+    # may have recreated its summary
+    DataSetSummary.objects.filter(data_set_id=instance.id).delete()
+
+
+@receiver(post_save, sender=FileStoreItem)
+def _file_store_item_saved(sender, instance, **kwargs):
+    # the size of a file is only known once it has been imported
+    if instance.datafile:
+        PendingUpdate.objects.refresh_data_set_summaries(
+            InvestigationLink.objects.filter(
+                investigation__study__node__file_uuid=instance.uuid
+            ).values_list('data_set_id', flat=True).distinct()
+        )
+
+
+class PendingUpdateManager(models.Manager):
+    def index_data_set(self, data_set):
+        self.create(kind=PendingUpdate.INDEX, data_set_id=data_set.id,
+                    data_set_uuid=data_set.uuid)
+
+    def delete_data_set(self, data_set):
+        self.create(kind=PendingUpdate.DELETE, data_set_id=data_set.id,
+                    data_set_uuid=data_set.uuid)
+
+    def add_read_access(self, dataset_uuids, user_ids):
+        self._create_read_access(PendingUpdate.ADD_READ_ACCESS,
+                                 dataset_uuids, user_ids)
+
+    def remove_read_access(self, dataset_uuids, user_ids):
+        self._create_read_access(PendingUpdate.REMOVE_READ_ACCESS,
+                                 dataset_uuids, user_ids)
+
+    def _create_read_access(self, kind, dataset_uuids, user_ids):
+        self.bulk_create([
+            PendingUpdate(kind=kind, data_set_uuid=dataset_uuid,
+                          user_id=user_id)
+            for dataset_uuid in dataset_uuids for user_id in user_ids
+        ])
+
+    def refresh_data_set_summaries(self, data_set_ids):
+        self.bulk_create([
+            PendingUpdate(kind=PendingUpdate.SUMMARY, data_set_id=data_set_id)
+            for data_set_id in data_set_ids
+        ])
+
+    def update_annotation_sets(self, username=''):
+        """Empty username: annotation sets of all users"""
+        self.create(kind=PendingUpdate.ANNOTATION_SETS, username=username)
+
+    def process(self, batch_size=None):
+        """Applies queued updates in order of creation, coalescing all updates
+        of a batch per data set and per (data set, user) pair. Updates that
+        could not be applied stay queued and are retried with an exponential
+        backoff.
+        :returns: number of processed updates
+        """
+        if batch_size is None:
+            batch_size = settings.REFINERY_PENDING_UPDATES_BATCH_SIZE
+        updates = list(self.filter(
+            Q(next_attempt__isnull=True) | Q(next_attempt__lte=timezone.now())
+        ).order_by('id')[:batch_size])
+
+        deleted_data_sets = {}
+        indexed_data_set_ids = set()
+        summary_data_set_ids = set()
+        # the latest update of a (data set, user) pair wins
+        read_access = {}
+        usernames = set()
+        for update in updates:
+            if update.kind == PendingUpdate.INDEX:
+                indexed_data_set_ids.add(update.data_set_id)
+            elif update.kind == PendingUpdate.DELETE:
+                deleted_data_sets[update.data_set_id] = update.data_set_uuid
+            elif update.kind == PendingUpdate.SUMMARY:
+                summary_data_set_ids.add(update.data_set_id)
+            elif update.kind == PendingUpdate.ANNOTATION_SETS:
+                usernames.add(update.username)
+            else:
+                read_access[(update.data_set_uuid, update.user_id)] = \
+                    update.kind
+
+        # the apply functions return False on failure (and None when they
+        # are skipped in test runs)
+        failed_deletes = set()
+        for data_set_id, data_set_uuid in deleted_data_sets.iteritems():
+            # only the identifiers are needed to remove the Solr document
+            index_result = delete_data_set_index(
+                DataSet(id=data_set_id, uuid=data_set_uuid)
+            )
+            neo4j_result = delete_data_set_neo4j(data_set_uuid)
+            if index_result is False or neo4j_result is False:
+                failed_deletes.add(data_set_id)
+
+        failed_indexes = set()
+        for data_set in DataSet.objects.filter(
+                id__in=indexed_data_set_ids - set(deleted_data_sets)
+        ).select_related('owner'):
+            if update_data_set_index(data_set) is False:
+                failed_indexes.add(data_set.id)
+
+        DataSetSummary.objects.refresh(
+            summary_data_set_ids - set(deleted_data_sets)
+        )
+
+        deleted_data_set_uuids = set(deleted_data_sets.itervalues())
+        read_access_failed = self._apply_read_access(
+            read_access, deleted_data_set_uuids
+        ) is False
+        if not read_access_failed and read_access:
+            self._delete_superseded_read_access(read_access,
+                                                updates[-1].id)
+
+        if '' in usernames:
+            usernames = {''}
+        failed_usernames = set(
+            username for username in usernames
+            if sync_update_annotation_sets_neo4j(username) is False
+        )
+
+        failed_updates = []
+        for update in updates:
+            if update.kind == PendingUpdate.INDEX:
+                failed = update.data_set_id in failed_indexes
+            elif update.kind == PendingUpdate.DELETE:
+                failed = update.data_set_id in failed_deletes
+            elif update.kind == PendingUpdate.SUMMARY:
+                failed = False
+            elif update.kind == PendingUpdate.ANNOTATION_SETS:
+                failed = bool(failed_usernames) and (
+                    '' in failed_usernames or
+                    update.username in failed_usernames
+                )
+            else:
+                failed = read_access_failed and \
+                    update.data_set_uuid not in deleted_data_set_uuids
+            if failed:
+                failed_updates.append(update)
+
+        self._retry_later(failed_updates)
+        failed_ids = set(update.id for update in failed_updates)
+        self.filter(id__in=[update.id for update in updates
+                            if update.id not in failed_ids]).delete()
+        return len(updates)
+
+    def _retry_later(self, updates):
+        """Reschedules updates that could not be applied, updates are
+        dropped after REFINERY_PENDING_UPDATES_MAX_ATTEMPTS attempts
+        """
+        for update in updates:
+            update.attempts += 1
+            if update.attempts >= \
+                    settings.REFINERY_PENDING_UPDATES_MAX_ATTEMPTS:
+                logger.error("Dropping %s after %s failed attempts", update,
+                             update.attempts)
+                update.delete()
+                continue
+            update.next_attempt = timezone.now() + timedelta(seconds=min(
+                settings.REFINERY_PENDING_UPDATES_RETRY_DELAY *
+                2 ** (update.attempts - 1),
+                settings.REFINERY_PENDING_UPDATES_MAX_RETRY_DELAY
+            ))
+            update.save(update_fields=['attempts', 'next_attempt'])
+
+    def _delete_superseded_read_access(self, read_access, last_id):
+        """Deletes older read access updates that are still waiting for a
+        retry, they would otherwise undo newer updates of the same pairs
+        """
+        pairs = Q()
+        for dataset_uuid, user_id in read_access:
+            pairs |= Q(data_set_uuid=dataset_uuid, user_id=user_id)
+        self.filter(
+            pairs, id__lte=last_id,
+            kind__in=[PendingUpdate.ADD_READ_ACCESS,
+                      PendingUpdate.REMOVE_READ_ACCESS]
+        ).delete()
+
+    @skip_if_test_run
+    def _apply_read_access(self, read_access, deleted_data_set_uuids):
+        """Returns False if the changes could not be applied"""
+        sync = Neo4jSync()
+        for (dataset_uuid, user_id), kind in read_access.iteritems():
+            if dataset_uuid in deleted_data_set_uuids:
+                continue
+            if kind == PendingUpdate.ADD_READ_ACCESS:
+                sync.add_read_access([dataset_uuid], [user_id])
+            else:
+                sync.remove_read_access([dataset_uuid], [user_id])
+        try:
+            sync.apply()
+        except Exception as e:
+            """ Cypher queries are expected to fail and raise an exception when
+            Neo4J is not running or when transactional queries are not
+            available (e.g. Travis CI doesn't support transactional queries
+            yet)
+            """
+            logger.error('Failed to update read access in Neo4J. '
+                         'Exception: %s', e)
+            return False
+        return True
+
+
+class PendingUpdate(models.Model):
+    """Change of a data set that still has to be applied to the Solr index,
+    to Neo4J or to its summary by the periodic process_pending_updates task,
+    so that requests and signal handlers don't wait for these writes
+    """
+    INDEX = 'index'
+    DELETE = 'delete'
+    ADD_READ_ACCESS = 'add_read_access'
+    REMOVE_READ_ACCESS = 'remove_read_access'
+    ANNOTATION_SETS = 'annotation_sets'
+    SUMMARY = 'summary'
+    KIND_CHOICES = (
+        (INDEX, 'Update data set index'),
+        (DELETE, 'Delete data set from index and Neo4J'),
+        (ADD_READ_ACCESS, 'Add read access in Neo4J'),
+        (REMOVE_READ_ACCESS, 'Remove read access in Neo4J'),
+        (ANNOTATION_SETS, 'Update annotation sets in Neo4J'),
+        (SUMMARY, 'Refresh data set summary'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # no foreign key, updates of deleted data sets have to be kept
+    data_set_id = models.IntegerField(blank=True, null=True)
+    data_set_uuid = models.CharField(max_length=36, blank=True)
+    user_id = models.IntegerField(blank=True, null=True)
+    username = models.CharField(max_length=30, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # failed attempts to apply the update and time of the next retry
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(blank=True, null=True)
+
+    objects = PendingUpdateManager()
+
+    def __unicode__(self):
+        return "{}: {} {}".format(self.kind, self.data_set_uuid,
+                                  self.user_id or self.username)
+
+
+@receiver([post_save, post_delete], sender=UserObjectPermission)
+@receiver([post_save, post_delete], sender=GroupObjectPermission)
+def _data_set_permission_changed(sender, instance, **kwargs):
+    """Invalidates cached data set searches and the cached data set access of
+    the affected user or group members on sharing, unsharing and ownership
+    changes
+    """
+    if instance.content_type_id == \
+            ContentType.objects.get_for_model(DataSet).id:
+        bump_cache_version(DATA_SET_ACCESS_VERSION_KEY)
+        if sender is UserObjectPermission:
+            invalidate_data_set_access([instance.user_id])
+        else:
+            invalidate_data_set_access(User.objects.filter(
+                groups=instance.group_id
+            ).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _group_membership_changed(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    # reverse changes are made through group.user_set with user IDs in pk_set
+    if action in ("post_add", "post_remove"):
+        user_ids = pk_set if reverse else [instance.id]
+    elif action == "pre_clear":
+        # members of a group are unknown once it has been cleared
+        user_ids = instance.user_set.values_list('id', flat=True) \
+            if reverse else [instance.id]
+    else:
+        return
+    invalidate_data_set_access(user_ids)
+
+
 class WorkflowEngine(OwnableResource, ManageableResource):
     # TODO: remove Galaxy dependency
     instance = models.ForeignKey(Instance, blank=True)
@@ -1166,14 +1659,13 @@ class Analysis(OwnableResource):
 
     @skip_if_test_run
     def optimize_solr_index(self):
-        solr = pysolr.Solr(urljoin(settings.REFINERY_SOLR_BASE_URL,
-                                   "data_set_manager"), timeout=10)
-
-        # solr.optimize() Tells Solr to streamline the number of segments
+        # optimize tells Solr to streamline the number of segments
         # used, essentially a defragmentation/ garbage collection
         # operation.
         try:
-            solr.optimize()
+            get_solr_client("data_set_manager").post(
+                "update", params={"optimize": "true", "wt": "json"}
+            ).raise_for_status()
         except Exception as e:
             logger.error("Could not optimize Solr's index: %s", e)
 
@@ -1725,6 +2217,13 @@ def _analysis_delete(sender, instance, *args, **kwargs):
     instance.optimize_solr_index()
 
 
+@receiver([post_save, post_delete], sender=Analysis)
+def _analysis_changed(sender, instance, **kwargs):
+    # new and failed analyses change the data set's cleanliness
+    if instance.data_set_id:
+        DataSetSummary.objects.refresh_analyses([instance.data_set_id])
+
+
 #: Defining available relationship types
 INPUT_CONNECTION = 'in'
 OUTPUT_CONNECTION = 'out'
@@ -2004,7 +2503,7 @@ def _add_user_to_neo4j(sender, **kwargs):
                      "Neo4J.", user.username)
         return
     add_or_update_user_to_neo4j(user.id, user.username)
-    add_read_access_in_neo4j(
+    PendingUpdate.objects.add_read_access(
         map(
             lambda ds: ds.uuid, get_objects_for_group(
                 ExtendedGroup.objects.public_group(),
@@ -2013,7 +2512,7 @@ def _add_user_to_neo4j(sender, **kwargs):
         ),
         [user.id]
     )
-    sync_update_annotation_sets_neo4j(user.username)
+    PendingUpdate.objects.update_annotation_sets(user.username)
 
 
 @receiver(pre_delete, sender=User)
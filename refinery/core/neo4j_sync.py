@@ -0,0 +1,209 @@
+"""
+Batched synchronization of data set annotations and read access with Neo4J
+"""
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import logging
+from urlparse import urljoin
+
+from django.conf import settings
+
+import py2neo
+
+logger = logging.getLogger(__name__)
+
+# Neo4J 2.x expects parameters in curly braces (`{rows}` instead of `$rows`)
+ANNOTATE_BY_URI = (
+    "UNWIND {rows} AS row "
+    "MATCH (term:Class {uri: row.uri}) "
+    "MERGE (ds:DataSet {id: row.ds_id, uuid: row.ds_uuid}) "
+    "MERGE (ds)-[r:`annotated_with`]->(term) "
+    "SET r.count = row.count"
+)
+ANNOTATE_BY_NAME = (
+    "UNWIND {rows} AS row "
+    "MATCH (term:Class {name: row.ont_id}) "
+    "MERGE (ds:DataSet {id: row.ds_id, uuid: row.ds_uuid}) "
+    "MERGE (ds)-[r:`annotated_with`]->(term) "
+    "SET r.count = row.count"
+)
+ADD_READ_ACCESS = (
+    "UNWIND {rows} AS row "
+    "MATCH (ds:DataSet {uuid: row.ds_uuid}) "
+    "MERGE (u:User {id: row.user_id}) "
+    "SET u.name = coalesce(row.user_name, u.name) "
+    "MERGE (ds)<-[:`read_access`]-(u)"
+)
+REMOVE_READ_ACCESS = (
+    "UNWIND {rows} AS row "
+    "MATCH (ds:DataSet {uuid: row.ds_uuid})<-[r:`read_access`]-"
+    "(u:User {id: row.user_id}) "
+    "DELETE r"
+)
+
+# statements that return the keys of rows that would not change the graph
+# when added (or would when removed), i.e. rows that are already in the
+# graph and rows that refer to ontology terms or data sets missing from it
+EXISTING_ANNOTATIONS_BY_URI = (
+    "UNWIND {rows} AS row "
+    "OPTIONAL MATCH (term:Class {uri: row.uri}) "
+    "OPTIONAL MATCH (:DataSet {uuid: row.ds_uuid})-[r:`annotated_with`]->"
+    "(term) "
+    "WITH row, term, r WHERE term IS NULL OR r.count = row.count "
+    "RETURN DISTINCT row.key"
+)
+EXISTING_ANNOTATIONS_BY_NAME = (
+    "UNWIND {rows} AS row "
+    "OPTIONAL MATCH (term:Class {name: row.ont_id}) "
+    "OPTIONAL MATCH (:DataSet {uuid: row.ds_uuid})-[r:`annotated_with`]->"
+    "(term) "
+    "WITH row, term, r WHERE term IS NULL OR r.count = row.count "
+    "RETURN DISTINCT row.key"
+)
+EXISTING_READ_ACCESS = (
+    "UNWIND {rows} AS row "
+    "MATCH (:DataSet {uuid: row.ds_uuid})<-[:`read_access`]-"
+    "(:User {id: row.user_id}) "
+    "RETURN DISTINCT row.key"
+)
+EXISTING_OR_UNMATCHED_READ_ACCESS = (
+    "UNWIND {rows} AS row "
+    "OPTIONAL MATCH (ds:DataSet {uuid: row.ds_uuid}) "
+    "OPTIONAL MATCH (ds)<-[r:`read_access`]-(:User {id: row.user_id}) "
+    "WITH row, ds, r WHERE ds IS NULL OR r IS NOT NULL "
+    "RETURN DISTINCT row.key"
+)
+
+# name: (statement, statement returning existing rows, True if only existing
+# rows change the graph), in the order the changes are applied
+CHANGES = OrderedDict([
+    ('annotations_by_uri',
+     (ANNOTATE_BY_URI, EXISTING_ANNOTATIONS_BY_URI, False)),
+    ('annotations_by_name',
+     (ANNOTATE_BY_NAME, EXISTING_ANNOTATIONS_BY_NAME, False)),
+    ('add_read_access',
+     (ADD_READ_ACCESS, EXISTING_OR_UNMATCHED_READ_ACCESS, False)),
+    ('remove_read_access', (REMOVE_READ_ACCESS, EXISTING_READ_ACCESS, True)),
+])
+
+
+class Neo4jSync(object):
+    """Collects changes to the Neo4J graph as lists of parameters and applies
+    them with one UNWIND statement per kind of change and batch of rows, all
+    in a single transaction
+    - dry_run: apply() doesn't contact Neo4J and only reports what would be
+    sent
+    - diff() returns the rows that would actually change the graph
+    """
+    def __init__(self, batch_size=None, dry_run=False, graph=None):
+        self.batch_size = settings.NEO4J_SYNC_BATCH_SIZE \
+            if batch_size is None else batch_size
+        self.dry_run = dry_run
+        self._graph = graph
+        self.rows = OrderedDict((name, []) for name in CHANGES)
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = py2neo.Graph(
+                urljoin(settings.NEO4J_BASE_URL, 'db/data')
+            )
+        return self._graph
+
+    def add_annotations(self, annotations):
+        """Link data sets to ontology terms
+        :param annotations: dicts with data_set_id, data_set_uuid,
+        value_source, value_accession, value_count and optionally value_uri
+        """
+        for annotation in annotations:
+            row = {
+                'ds_id': annotation['data_set_id'],
+                'ds_uuid': annotation['data_set_uuid'],
+                'count': annotation['value_count']
+            }
+            if 'value_uri' in annotation:
+                row['uri'] = annotation['value_uri']
+                self.rows['annotations_by_uri'].append(row)
+            elif annotation['value_accession'].startswith('http://'):
+                row['uri'] = annotation['value_accession']
+                self.rows['annotations_by_uri'].append(row)
+            else:
+                row['ont_id'] = '{}:{}'.format(
+                    annotation['value_source'].upper(),
+                    annotation['value_accession']
+                )
+                self.rows['annotations_by_name'].append(row)
+
+    def add_read_access(self, dataset_uuids, users):
+        """Give users read access to data sets
+        :param users: user IDs or (ID, name) tuples
+        """
+        self._add_user_rows('add_read_access', dataset_uuids, users)
+
+    def remove_read_access(self, dataset_uuids, users):
+        self._add_user_rows('remove_read_access', dataset_uuids, users)
+
+    def _add_user_rows(self, name, dataset_uuids, users):
+        for dataset_uuid in dataset_uuids:
+            for user in users:
+                user_id, user_name = \
+                    user if isinstance(user, tuple) else (user, None)
+                self.rows[name].append({
+                    'ds_uuid': dataset_uuid,
+                    'user_id': user_id,
+                    'user_name': user_name
+                })
+
+    def _batches(self, rows):
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+
+    def apply(self):
+        """Sends all collected changes to Neo4J and clears them
+        :returns: dict with the number of rows per kind of change
+        :raises: py2neo exceptions or requests.exceptions.RequestException if
+        the transaction fails
+        """
+        summary = OrderedDict(
+            (name, len(rows)) for name, rows in self.rows.iteritems()
+        )
+        if self.dry_run:
+            for name, count in summary.iteritems():
+                logger.info("Neo4J sync (dry run): %s rows of '%s'",
+                            count, name)
+            return summary
+
+        if any(summary.values()):
+            tx = self.graph.cypher.begin()
+            for name, rows in self.rows.iteritems():
+                statement = CHANGES[name][0]
+                for batch in self._batches(rows):
+                    tx.append(statement, {'rows': batch})
+                    tx.process()
+            tx.commit()
+            logger.debug("Neo4J sync: %s", dict(summary))
+
+        for rows in self.rows.itervalues():
+            del rows[:]
+        return summary
+
+    def diff(self):
+        """Queries Neo4J for the collected rows that would change the graph
+        :returns: dict with the list of changing rows per kind of change
+        """
+        changes = OrderedDict()
+        for name, rows in self.rows.iteritems():
+            statement, only_existing = CHANGES[name][1:]
+            keyed_rows = [dict(row, key=key) for key, row in enumerate(rows)]
+            existing = set()
+            for batch in self._batches(keyed_rows):
+                existing.update(
+                    record[0] for record in
+                    self.graph.cypher.execute(statement, {'rows': batch})
+                )
+            changes[name] = [
+                row for key, row in enumerate(rows)
+                if (key in existing) == only_existing
+            ]
+        return changes
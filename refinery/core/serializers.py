@@ -26,11 +26,23 @@ class DataSetSerializer(serializers.ModelSerializer):
     analyses = serializers.SerializerMethodField()
 
     def get_analyses(self, data_set):
-        return [dict(uuid=analysis.uuid,
-                     name=analysis.name,
-                     status=analysis.status,
-                     owner=analysis.get_owner().profile.uuid)
-                for analysis in data_set.get_analyses()]
+        summary = data_set.get_summary()
+        if summary is not None and not summary.analysis_count:
+            return []
+        # analysis ID -> owner profile UUID, loaded for a whole page of data
+        # sets by the view
+        owner_uuids = self.context.get('analysis_owner_uuids')
+        analyses = []
+        for analysis in data_set.get_analyses():
+            if owner_uuids is not None:
+                owner_uuid = owner_uuids.get(analysis.id)
+            else:
+                owner_uuid = analysis.get_owner().profile.uuid
+            analyses.append(dict(uuid=analysis.uuid,
+                                 name=analysis.name,
+                                 status=analysis.status,
+                                 owner=owner_uuid))
+        return analyses
 
     def get_is_owner(self, data_set):
         try:
@@ -52,9 +64,15 @@ class DataSetSerializer(serializers.ModelSerializer):
             return is_public
 
     def get_is_clean(self, data_set):
+        summary = data_set.get_summary()
+        if summary is not None:
+            return summary.is_clean
         return data_set.is_clean()
 
     def get_file_count(self, data_set):
+        summary = data_set.get_summary()
+        if summary is not None:
+            return summary.file_count
         return data_set.get_file_count()
 
     class Meta:
@@ -129,6 +147,7 @@ class WorkflowSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Workflow
+        exclude = ('owner',)
 
 
 class EventSerializer(serializers.ModelSerializer):
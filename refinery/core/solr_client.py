@@ -0,0 +1,210 @@
+"""
+Client for all HTTP requests to the Solr cores used by Refinery
+"""
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+from urlparse import urljoin
+
+from django.conf import settings
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# responses that indicate a Solr server that is (temporarily) unavailable
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class SolrUnavailableError(requests.exceptions.ConnectionError):
+    """Raised without contacting Solr while the circuit breaker is open"""
+
+
+class SolrClient(object):
+    """Sends requests to a single Solr core
+    - connections are kept alive and reused from a pool
+    - every request has a timeout
+    - requests that fail due to connection errors, timeouts or gateway errors
+    are retried a limited number of times with exponential backoff, except for
+    POST requests that timed out since Solr may have applied them already
+    (e.g. updates and optimize)
+    - after a number of consecutive failures no requests are sent to Solr
+    until a reset timeout has passed (circuit breaker)
+    - latency and payload sizes of every request are recorded in metrics
+    """
+    def __init__(self, core, base_url=None, timeout=None, max_retries=None,
+                 backoff=None, failure_threshold=None, reset_timeout=None,
+                 pool_size=None):
+        if base_url is None:
+            base_url = settings.REFINERY_SOLR_BASE_URL
+        self.core = core
+        self.url = urljoin(base_url, core + "/")
+        self.timeout = settings.REFINERY_SOLR_TIMEOUT \
+            if timeout is None else timeout
+        self.max_retries = settings.REFINERY_SOLR_MAX_RETRIES \
+            if max_retries is None else max_retries
+        self.backoff = settings.REFINERY_SOLR_RETRY_BACKOFF \
+            if backoff is None else backoff
+        self.failure_threshold = \
+            settings.REFINERY_SOLR_CIRCUIT_BREAKER_THRESHOLD \
+            if failure_threshold is None else failure_threshold
+        self.reset_timeout = \
+            settings.REFINERY_SOLR_CIRCUIT_BREAKER_RESET_TIMEOUT \
+            if reset_timeout is None else reset_timeout
+
+        self.session = requests.Session()
+        self.session.mount(self.url, HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.REFINERY_SOLR_POOL_SIZE
+            if pool_size is None else pool_size
+        ))
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        # True while a single request probes a core after the reset timeout
+        self._probing = False
+        # metrics by request handler
+        self.metrics = {}
+
+    def get(self, handler="select", **kwargs):
+        return self.request("GET", handler, **kwargs)
+
+    def post(self, handler="select", **kwargs):
+        return self.request("POST", handler, **kwargs)
+
+    def request(self, method, handler, timeout=None, **kwargs):
+        """Sends a request to a handler of the core
+        :param method: HTTP method
+        :param handler: request handler, e.g. "select"
+        :param timeout: seconds to wait for the response instead of the
+        client's default
+        :param kwargs: passed to requests.Session.request()
+        :returns: requests.Response (HTTP errors are not raised)
+        :raises: requests.exceptions.RequestException if Solr can't be
+        reached, SolrUnavailableError if the circuit breaker is open
+        """
+        probe = self._check_circuit()
+        try:
+            return self._send(method, handler, timeout, **kwargs)
+        finally:
+            if probe:
+                self._end_probe()
+
+    def _send(self, method, handler, timeout, **kwargs):
+        url = urljoin(self.url, handler)
+        if timeout is None:
+            timeout = self.timeout
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                response = self.session.request(method, url, timeout=timeout,
+                                                **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as exc:
+                self._record(handler, time.time() - start, None, error=True)
+                # a connect timeout is also a connection error, the request
+                # has not been sent then
+                retryable = method != "POST" or isinstance(
+                    exc, requests.exceptions.ConnectionError
+                )
+                if not retryable or attempt >= self.max_retries:
+                    self._record_failure()
+                    logger.error("Solr request to '%s' failed: %s", url, exc)
+                    raise
+            else:
+                failed = response.status_code in RETRY_STATUS_CODES
+                self._record(handler, time.time() - start, response,
+                             error=failed)
+                if not failed:
+                    self._record_success()
+                    return response
+                if attempt >= self.max_retries:
+                    self._record_failure()
+                    return response
+            attempt += 1
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+            logger.warn("Retrying Solr request to '%s' (attempt %s)",
+                        url, attempt + 1)
+
+    def get_metrics(self):
+        with self._lock:
+            return dict((handler, dict(metrics))
+                        for handler, metrics in self.metrics.iteritems())
+
+    def _check_circuit(self):
+        """Raises SolrUnavailableError while the circuit is open
+        :returns: True if the request is the single probe that is let through
+        after the reset timeout (half-open circuit)
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.time() - self._opened_at < self.reset_timeout or \
+                    self._probing:
+                raise SolrUnavailableError(
+                    "Solr core '{}' is unavailable after {} consecutive "
+                    "failures".format(self.core, self._failures)
+                )
+            # half-open: the circuit stays open for all other requests until
+            # the probe succeeds (closes it) or fails (restarts the timeout)
+            self._probing = True
+            return True
+
+    def _end_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                logger.error("Solr core '%s' failed %s times in a row, "
+                             "pausing requests for %s seconds", self.core,
+                             self._failures, self.reset_timeout)
+                self._opened_at = time.time()
+
+    def _record(self, handler, latency, response, error=False):
+        request_size = 0
+        response_size = 0
+        if response is not None:
+            request_size = len(response.request.body or "")
+            response_size = len(response.content)
+        logger.debug("Solr %s/%s: %.3f s, %s bytes sent, %s bytes received",
+                     self.core, handler, latency, request_size, response_size)
+        with self._lock:
+            metrics = self.metrics.setdefault(handler, {
+                "requests": 0,
+                "errors": 0,
+                "total_time": 0.0,
+                "max_time": 0.0,
+                "request_bytes": 0,
+                "response_bytes": 0
+            })
+            metrics["requests"] += 1
+            metrics["errors"] += int(error)
+            metrics["total_time"] += latency
+            metrics["max_time"] = max(metrics["max_time"], latency)
+            metrics["request_bytes"] += request_size
+            metrics["response_bytes"] += response_size
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_solr_client(core):
+    """Returns the shared SolrClient of a core (one per process)"""
+    with _clients_lock:
+        if core not in _clients:
+            _clients[core] = SolrClient(core)
+        return _clients[core]
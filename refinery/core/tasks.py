@@ -1,12 +1,40 @@
 import logging
 
+from django.core.cache import cache
+
 import celery
 
-from .models import SiteStatistics
+from .models import PendingUpdate, SiteStatistics
+from .utils import get_resource_statistics
 
 logger = logging.getLogger(__name__)
 
+PENDING_UPDATES_LOCK_KEY = "process-pending-updates-lock"
+PENDING_UPDATES_LOCK_TIMEOUT = 600  # seconds
+
 
 @celery.task.task()
 def collect_site_statistics():
     SiteStatistics.objects.create().collect()
+    get_resource_statistics(refresh=True)
+
+
+@celery.task.task()
+def refresh_resource_statistics():
+    # scheduled more often than REFINERY_STATISTICS_CACHE_TIMEOUT so that
+    # requests don't have to compute the statistics
+    get_resource_statistics(refresh=True)
+
+
+@celery.task.task(soft_time_limit=PENDING_UPDATES_LOCK_TIMEOUT)
+def process_pending_updates():
+    # only one worker at a time processes the queue
+    if not cache.add(PENDING_UPDATES_LOCK_KEY, True,
+                     PENDING_UPDATES_LOCK_TIMEOUT):
+        logger.debug("Pending updates are already being processed")
+        return
+    try:
+        while PendingUpdate.objects.process():
+            pass
+    finally:
+        cache.delete(PENDING_UPDATES_LOCK_KEY)
@@ -15,8 +15,8 @@ from data_set_manager.api import NodeResource
 from data_set_manager.models import Investigation, Study
 
 from .api import AnalysisResource, DataSetResource
-from .models import (Analysis, Node, Project, UserProfile, Workflow,
-                     WorkflowEngine)
+from .models import (Analysis, ExtendedGroup, Node, Project, UserProfile,
+                     Workflow, WorkflowEngine)
 
 
 def api_uri(resource, resource_id='', sharing=False):
@@ -347,6 +347,61 @@ class DataSetResourceTest(LoginResourceTestCase):
         self.assertEqual(data["meta"]["total_count"], 1)
         self.assertEqual(data["objects"][0]["name"], self.tabular_dataset.name)
 
+    def test_list_response_filtered_by_owner(self):
+        self.isatab_dataset.share(ExtendedGroup.objects.public_group())
+        resp = self.api_client.get(api_uri(DataSetResource), format='json',
+                                   data={'is_owner': 'True'})
+        data = json.loads(resp.content)
+        self.assertEqual(data["meta"]["total_count"], 1)
+        self.assertEqual(data["objects"][0]["uuid"], self.tabular_dataset.uuid)
+        self.assertTrue(data["objects"][0]["is_owner"])
+
+    def test_list_response_filtered_by_public(self):
+        self.isatab_dataset.share(ExtendedGroup.objects.public_group())
+        resp = self.api_client.get(api_uri(DataSetResource), format='json',
+                                   data={'public': 'True'})
+        data = json.loads(resp.content)
+        self.assertEqual(data["meta"]["total_count"], 1)
+        self.assertEqual(data["objects"][0]["uuid"], self.isatab_dataset.uuid)
+        self.assertTrue(data["objects"][0]["public"])
+        self.assertFalse(data["objects"][0]["is_owner"])
+
+    def test_list_response_sorted_and_paginated(self):
+        self.isatab_dataset.share(ExtendedGroup.objects.public_group())
+        self.tabular_dataset.name = 'a'
+        self.tabular_dataset.save()
+        self.isatab_dataset.name = 'b'
+        self.isatab_dataset.save()
+        resp = self.api_client.get(api_uri(DataSetResource), format='json',
+                                   data={'order_by': '-name', 'limit': 1})
+        data = json.loads(resp.content)
+        self.assertEqual(data["meta"]["total_count"], 2)
+        self.assertEqual([obj["uuid"] for obj in data["objects"]],
+                         [self.isatab_dataset.uuid])
+
+    def test_dataset_sharing_response(self):
+        group = ExtendedGroup.objects.create(name="Test Group")
+        group.user_set.add(self.user)
+        group.manager_group.user_set.add(self.user)
+        self.tabular_dataset.share(group)
+        response = self.api_client.get(
+            api_uri(DataSetResource, self.tabular_dataset.uuid, sharing=True),
+            format='json'
+        )
+        self.assertValidJSONResponse(response)
+        data = self.deserialize(response)
+        self.assertTrue(data['is_owner'])
+        self.assertEqual(data['owner'], self.user.profile.uuid)
+        self.assertIn({
+            'group_id': group.id,
+            'group_name': group.name,
+            'group_uuid': group.uuid,
+            'perms': {'read': True, 'change': False, 'read_meta': True}
+        }, data['share_list'])
+        # manager groups are not listed
+        self.assertNotIn(group.manager_group.id,
+                         [g['group_id'] for g in data['share_list']])
+
     def test_isatab_based_dataset_specifics_in_response(self):
         response = self.api_client.get(
             api_uri(DataSetResource, self.isatab_dataset.uuid), format='json'
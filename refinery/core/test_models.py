@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.utils import timezone
 
 from cuser.middleware import CuserMiddleware
 from guardian.shortcuts import get_perms
@@ -12,8 +13,9 @@ import mock
 from override_storage import override_storage
 
 from analysis_manager.models import AnalysisStatus
-from data_set_manager.models import (AnnotatedNode, Assay, Investigation,
-                                     Node, NodeCollection, Study)
+from data_set_manager.models import (AnnotatedNode, Assay, Attribute, Factor,
+                                     Investigation, Node, NodeCollection,
+                                     Study)
 from factory_boy.django_model_factories import (AnalysisNodeConnectionFactory,
                                                 FileRelationshipFactory,
                                                 FileStoreItemFactory,
@@ -31,10 +33,13 @@ from tool_manager.models import ToolDefinition
 from .management.commands.create_user import init_user
 from .models import (INPUT_CONNECTION, OUTPUT_CONNECTION, Analysis,
                      AnalysisNodeConnection, AnalysisResult, BaseResource,
-                     DataSet, Event, ExtendedGroup, InvestigationLink,
-                     Project, SiteStatistics, Tutorials, UserProfile,
-                     Workflow, WorkflowEngine)
-from .tasks import collect_site_statistics
+                     DataSet, DataSetAnnotation, DataSetSummary, Event,
+                     ExtendedGroup, InvestigationLink, PendingUpdate, Project,
+                     SiteStatistics, Tutorials, UserProfile, Workflow,
+                     WorkflowEngine)
+from .tasks import (collect_site_statistics, process_pending_updates,
+                    refresh_resource_statistics)
+from .utils import get_data_set_annotations, get_data_sets_annotations
 
 
 class AnalysisDeletionTest(TestCase):
@@ -560,6 +565,70 @@ class BaseResourceSlugTest(TestCase):
             name="project_no_slug_duplicate3"))
 
 
+class DataSetAnnotationTests(TestCase):
+    def setUp(self):
+        self.data_set = create_dataset_with_necessary_models()
+        study = self.data_set.get_latest_study()
+        Assay.objects.filter(study=study).update(
+            measurement_source="OBI",
+            measurement_accession="http://purl.obolibrary.org/obo/OBI_0000424"
+        )
+        Attribute.objects.filter(node__study=study).update(
+            value_source="NCBITAXON",
+            value_accession="http://purl.bioontology.org/ontology/NCBITAXON/"
+                            "9606"
+        )
+        Factor.objects.create(
+            study=study, type_source="EFO",
+            type_accession="http://www.ebi.ac.uk/efo/EFO_0000399"
+        )
+        DataSetAnnotation.objects.refresh([self.data_set.id])
+
+    def test_refresh(self):
+        annotations = DataSetAnnotation.objects.filter(data_set=self.data_set)
+        self.assertItemsEqual(
+            annotations.values_list("value_source", "count", "is_factor"),
+            [("NCBITAXON", 2, False), ("OBI", 1, False), ("EFO", 1, True)]
+        )
+
+    def test_refresh_replaces_previous_annotations(self):
+        DataSetAnnotation.objects.refresh([self.data_set.id])
+        self.assertEqual(
+            DataSetAnnotation.objects.filter(data_set=self.data_set).count(),
+            3
+        )
+
+    def test_refresh_on_new_investigation_version(self):
+        self.data_set.update_investigation(Investigation.objects.create(),
+                                           "new version")
+        # the annotations of the previous version still count
+        self.assertEqual(
+            DataSetAnnotation.objects.filter(data_set=self.data_set).count(),
+            3
+        )
+
+    def test_get_data_sets_annotations(self):
+        self.assertItemsEqual(
+            get_data_sets_annotations([self.data_set.id])[self.data_set.id],
+            [{"term": "http://purl.obolibrary.org/obo/NCBITaxon_9606",
+              "count": 2},
+             {"term": "http://purl.obolibrary.org/obo/OBI_0000424",
+              "count": 1}]
+        )
+
+    def test_get_data_set_annotations(self):
+        annotations = get_data_set_annotations(self.data_set.uuid)
+        self.assertEqual(len(annotations), 3)
+        self.assertIn(
+            {"data_set_id": self.data_set.id,
+             "data_set_uuid": self.data_set.uuid,
+             "value_source": "EFO",
+             "value_accession": "http://www.ebi.ac.uk/efo/EFO_0000399",
+             "value_count": 1},
+            annotations
+        )
+
+
 class DataSetDeletionTest(TestCase):
     """Testing for the deletion of Datasets"""
     def setUp(self):
@@ -636,6 +705,67 @@ class DataSetDeletionTest(TestCase):
             FileStoreItem.objects.get(uuid=tabular_file_store_item_uuid)
 
 
+class DataSetSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'password')
+        self.data_set = create_dataset_with_necessary_models(user=self.user)
+
+    def get_summary(self, data_set=None):
+        return DataSetSummary.objects.get(data_set=data_set or self.data_set)
+
+    def test_summary_of_new_data_set(self):
+        summary = self.get_summary()
+        self.assertEqual(summary.latest_investigation_link,
+                         self.data_set.get_latest_investigation_link())
+        self.assertEqual(summary.version, 1)
+        self.assertEqual(summary.file_count, self.data_set.get_file_count())
+        self.assertEqual(summary.file_size, self.data_set.get_file_size())
+        self.assertEqual(summary.analysis_count, 0)
+        self.assertTrue(summary.is_clean)
+
+    def test_summary_of_revised_data_set(self):
+        data_set = create_dataset_with_necessary_models(latest_version=2)
+        self.assertEqual(self.get_summary(data_set).version, 2)
+
+    def test_no_summary_without_investigation_link(self):
+        self.data_set.get_latest_investigation_link().delete()
+        self.assertIsNone(DataSet.objects.get(id=self.data_set.id)
+                          .get_summary())
+
+    def test_analyses_update_summary(self):
+        analyses, data_set = make_analyses_with_single_dataset(2, self.user)
+        summary = self.get_summary(data_set)
+        self.assertEqual(summary.analysis_count, 2)
+        self.assertFalse(summary.is_clean)
+
+    def test_failed_analyses_keep_data_set_clean(self):
+        analyses, data_set = make_analyses_with_single_dataset(1, self.user)
+        for analysis in analyses:
+            analysis.set_status(Analysis.FAILURE_STATUS)
+        self.assertTrue(self.get_summary(data_set).is_clean)
+
+    def test_visualizations_update_summary(self):
+        tool = create_tool_with_necessary_models("VISUALIZATION")
+        self.assertFalse(self.get_summary(tool.dataset).is_clean)
+
+    def test_imported_file_queues_summary_refresh(self):
+        PendingUpdate.objects.all().delete()
+        node = self.data_set.get_nodes().filter(file_uuid__isnull=False)[0]
+        file_store_item = FileStoreItem.objects.get(uuid=node.file_uuid)
+        file_store_item.datafile.name = 'test.txt'
+        file_store_item.save()
+        self.assertTrue(PendingUpdate.objects.filter(
+            kind=PendingUpdate.SUMMARY, data_set_id=self.data_set.id
+        ).exists())
+
+    def test_data_set_deletion_removes_summary(self):
+        analyses, data_set = make_analyses_with_single_dataset(1, self.user)
+        data_set.delete()
+        self.assertFalse(
+            DataSetSummary.objects.filter(data_set_id=data_set.id).exists()
+        )
+
+
 class DataSetTests(TestCase):
     """ Testing of the DataSet model"""
 
@@ -686,19 +816,19 @@ class DataSetTests(TestCase):
         dataset.save()
         self.assertFalse(dataset.is_valid)
 
-    def test_neo4j_called_on_post_save(self):
-        with mock.patch(
-            "core.models.async_update_annotation_sets_neo4j"
-        ) as neo4j_mock:
-            self.isa_tab_dataset.save()
-            self.assertTrue(neo4j_mock.called)
+    def test_neo4j_update_queued_on_post_save(self):
+        PendingUpdate.objects.all().delete()
+        self.isa_tab_dataset.save()
+        self.assertTrue(PendingUpdate.objects.filter(
+            kind=PendingUpdate.ANNOTATION_SETS, username=''
+        ).exists())
 
-    def test_solr_called_on_post_save(self):
-        with mock.patch(
-            "core.models.update_data_set_index"
-        ) as solr_mock:
-            self.isa_tab_dataset.save()
-            self.assertTrue(solr_mock.called)
+    def test_solr_update_queued_on_post_save(self):
+        PendingUpdate.objects.all().delete()
+        self.isa_tab_dataset.save()
+        self.assertTrue(PendingUpdate.objects.filter(
+            kind=PendingUpdate.INDEX, data_set_id=self.isa_tab_dataset.id
+        ).exists())
 
     def test_get_latest_investigation_link(self):
         self.assertEqual(
@@ -964,6 +1094,136 @@ class OwnableResourceTest(TestCase):
         self.assertTrue('read_meta_dataset' in user_perms)
 
 
+class PendingUpdateTests(TestCase):
+    def setUp(self):
+        self.data_set = create_dataset_with_necessary_models()
+        self.group = ExtendedGroup.objects.create(name="Test Group")
+        self.user = User.objects.create_user("user", "", "password")
+        self.group.user_set.add(self.user)
+        PendingUpdate.objects.all().delete()
+
+        self.index_mock = mock.patch(
+            "core.models.update_data_set_index"
+        ).start()
+        self.delete_index_mock = mock.patch(
+            "core.models.delete_data_set_index"
+        ).start()
+        self.delete_neo4j_mock = mock.patch(
+            "core.models.delete_data_set_neo4j"
+        ).start()
+        self.annotation_sets_mock = mock.patch(
+            "core.models.sync_update_annotation_sets_neo4j"
+        ).start()
+        self.read_access_mock = mock.patch.object(
+            PendingUpdate.objects, "_apply_read_access"
+        ).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_share_queues_updates(self):
+        self.data_set.share(self.group)
+        self.assertTrue(PendingUpdate.objects.filter(
+            kind=PendingUpdate.INDEX, data_set_id=self.data_set.id
+        ).exists())
+        self.assertEqual(
+            list(PendingUpdate.objects.filter(
+                kind=PendingUpdate.ADD_READ_ACCESS
+            ).values_list("data_set_uuid", "user_id")),
+            [(self.data_set.uuid, self.user.id)]
+        )
+
+    def test_process_indexes_data_set_once(self):
+        for i in range(3):
+            self.data_set.save()
+        self.assertEqual(PendingUpdate.objects.process(), 6)
+        self.index_mock.assert_called_once_with(self.data_set)
+        self.annotation_sets_mock.assert_called_once_with('')
+        self.assertFalse(PendingUpdate.objects.exists())
+
+    def test_process_annotation_sets_of_all_users_replace_single_users(self):
+        PendingUpdate.objects.update_annotation_sets(self.user.username)
+        PendingUpdate.objects.update_annotation_sets()
+        PendingUpdate.objects.process()
+        self.annotation_sets_mock.assert_called_once_with('')
+
+    def test_process_latest_read_access_update_wins(self):
+        self.data_set.share(self.group)
+        PendingUpdate.objects.remove_read_access([self.data_set.uuid],
+                                                 [self.user.id])
+        PendingUpdate.objects.add_read_access([self.data_set.uuid],
+                                              [self.user.id, 2])
+        PendingUpdate.objects.remove_read_access([self.data_set.uuid], [2])
+        PendingUpdate.objects.process()
+        self.read_access_mock.assert_called_once_with({
+            (self.data_set.uuid, self.user.id): PendingUpdate.ADD_READ_ACCESS,
+            (self.data_set.uuid, 2): PendingUpdate.REMOVE_READ_ACCESS
+        }, set())
+
+    def test_process_skips_index_of_deleted_data_set(self):
+        PendingUpdate.objects.index_data_set(self.data_set)
+        PendingUpdate.objects.delete_data_set(self.data_set)
+        PendingUpdate.objects.process()
+        self.assertFalse(self.index_mock.called)
+        self.delete_neo4j_mock.assert_called_once_with(self.data_set.uuid)
+        self.assertEqual(self.delete_index_mock.call_args[0][0].id,
+                         self.data_set.id)
+
+    def test_process_in_batches(self):
+        for i in range(3):
+            PendingUpdate.objects.update_annotation_sets()
+        self.assertEqual(PendingUpdate.objects.process(batch_size=2), 2)
+        self.assertEqual(PendingUpdate.objects.count(), 1)
+
+    def test_process_keeps_failed_updates_queued(self):
+        PendingUpdate.objects.index_data_set(self.data_set)
+        PendingUpdate.objects.update_annotation_sets()
+        self.index_mock.return_value = False
+        self.assertEqual(PendingUpdate.objects.process(), 2)
+        update = PendingUpdate.objects.get()
+        self.assertEqual(update.kind, PendingUpdate.INDEX)
+        self.assertEqual(update.attempts, 1)
+        self.assertGreater(update.next_attempt, timezone.now())
+
+    def test_process_retries_failed_updates_after_delay(self):
+        PendingUpdate.objects.index_data_set(self.data_set)
+        self.index_mock.return_value = False
+        PendingUpdate.objects.process()
+        self.assertEqual(PendingUpdate.objects.process(), 0)
+        PendingUpdate.objects.update(next_attempt=timezone.now())
+        self.index_mock.return_value = True
+        self.assertEqual(PendingUpdate.objects.process(), 1)
+        self.assertFalse(PendingUpdate.objects.exists())
+
+    def test_process_keeps_read_access_updates_if_neo4j_failed(self):
+        self.data_set.share(self.group)
+        self.read_access_mock.return_value = False
+        PendingUpdate.objects.process()
+        self.assertEqual(
+            list(PendingUpdate.objects.values_list("kind", flat=True)),
+            [PendingUpdate.ADD_READ_ACCESS]
+        )
+
+    def test_process_drops_failed_updates_after_max_attempts(self):
+        PendingUpdate.objects.index_data_set(self.data_set)
+        self.index_mock.return_value = False
+        with self.settings(REFINERY_PENDING_UPDATES_MAX_ATTEMPTS=1):
+            PendingUpdate.objects.process()
+        self.assertFalse(PendingUpdate.objects.exists())
+
+    def test_process_pending_updates_task_empties_queue(self):
+        for i in range(3):
+            PendingUpdate.objects.index_data_set(self.data_set)
+        with self.settings(REFINERY_PENDING_UPDATES_BATCH_SIZE=2, CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+            }
+        }):
+            process_pending_updates()
+        self.assertFalse(PendingUpdate.objects.exists())
+        self.assertEqual(self.index_mock.call_count, 2)
+
+
 class ShareableResourceTest(TestCase):
     def setUp(self):
         self.username = 'TestUser'
@@ -996,6 +1256,44 @@ class ShareableResourceTest(TestCase):
         user_perms = get_perms(self.user, self.data_set)
         self.assertTrue('share_dataset' in user_perms)
 
+    def test_set_owner_stores_owner(self):
+        self.data_set.set_owner(self.user)
+        self.assertEqual(DataSet.objects.get(id=self.data_set.id).owner,
+                         self.user)
+
+    def test_remove_owner_clears_stored_owner(self):
+        self.owned_data_set.remove_owner(self.user)
+        self.assertIsNone(
+            DataSet.objects.get(id=self.owned_data_set.id).owner
+        )
+
+    def test_remove_other_user_keeps_stored_owner(self):
+        other_user = User.objects.create_user('OtherUser', '', 'OtherUser')
+        self.owned_data_set.remove_owner(other_user)
+        self.assertEqual(
+            DataSet.objects.get(id=self.owned_data_set.id).owner, self.user
+        )
+
+    def test_transfer_ownership_updates_stored_owner(self):
+        new_owner = User.objects.create_user('NewOwner', '', 'NewOwner')
+        self.owned_data_set.transfer_ownership(self.user, new_owner)
+        data_set = DataSet.objects.get(id=self.owned_data_set.id)
+        self.assertEqual(data_set.get_owner(), new_owner)
+        self.assertFalse('share_dataset' in get_perms(self.user, data_set))
+
+    def test_get_owner_of_selected_related_owner(self):
+        data_set = DataSet.objects.select_related('owner').get(
+            id=self.owned_data_set.id
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(data_set.get_owner(), self.user)
+
+    def test_set_owner_project(self):
+        project = Project.objects.create(name='Test Project')
+        project.set_owner(self.user)
+        self.assertEqual(Project.objects.get(id=project.id).get_owner(),
+                         self.user)
+
 
 class SiteStatisticsUnitTests(TestCase):
     def setUp(self):
@@ -1184,6 +1482,18 @@ class SiteStatisticsIntegrationTests(TestCase):
             }
         )
 
+    def test_resource_statistics_are_refreshed_before_they_expire(self):
+        schedule = settings.CELERYBEAT_SCHEDULE["refresh_resource_statistics"]
+        self.assertEqual(schedule['task'],
+                         'core.tasks.refresh_resource_statistics')
+        self.assertLess(schedule['schedule'].total_seconds(),
+                        settings.REFINERY_STATISTICS_CACHE_TIMEOUT)
+
+    def test_refresh_resource_statistics_recomputes_statistics(self):
+        with mock.patch('core.tasks.get_resource_statistics') as mock_get:
+            refresh_resource_statistics()
+        mock_get.assert_called_once_with(refresh=True)
+
     def test_collect_site_statistics_creates_new_instance(self):
         initial_site_statistics_count = SiteStatistics.objects.count()
         collect_site_statistics()
@@ -0,0 +1,118 @@
+from django.test import SimpleTestCase
+
+import mock
+
+from .neo4j_sync import (ADD_READ_ACCESS, ANNOTATE_BY_NAME, ANNOTATE_BY_URI,
+                         EXISTING_ANNOTATIONS_BY_NAME,
+                         EXISTING_OR_UNMATCHED_READ_ACCESS,
+                         EXISTING_READ_ACCESS, REMOVE_READ_ACCESS, Neo4jSync)
+
+
+class Neo4jSyncTests(SimpleTestCase):
+    def setUp(self):
+        self.graph = mock.MagicMock()
+        self.tx = self.graph.cypher.begin.return_value
+        self.sync = Neo4jSync(batch_size=2, graph=self.graph)
+
+    def annotation(self, accession, source='CL', **kwargs):
+        annotation = {
+            'data_set_id': 1,
+            'data_set_uuid': 'ds1',
+            'value_source': source,
+            'value_accession': accession,
+            'value_count': 3
+        }
+        annotation.update(kwargs)
+        return annotation
+
+    def test_annotations_by_uri_and_name(self):
+        self.sync.add_annotations([
+            self.annotation('0000001', source='cl'),
+            self.annotation('http://purl.org/a'),
+            self.annotation('x', value_uri='http://purl.org/b')
+        ])
+        self.assertEqual(
+            [row['uri'] for row in self.sync.rows['annotations_by_uri']],
+            ['http://purl.org/a', 'http://purl.org/b']
+        )
+        self.assertEqual(self.sync.rows['annotations_by_name'], [{
+            'ds_id': 1, 'ds_uuid': 'ds1', 'count': 3, 'ont_id': 'CL:0000001'
+        }])
+
+    def test_apply_sends_one_statement_per_batch(self):
+        self.sync.add_annotations([self.annotation('http://purl.org/a')])
+        self.sync.add_annotations([self.annotation('1')])
+        self.sync.add_read_access(['ds1', 'ds2'], [1, (2, 'user2')])
+        self.sync.remove_read_access(['ds1'], [3])
+        self.sync.apply()
+        self.assertEqual(self.graph.cypher.begin.call_count, 1)
+        self.assertEqual(
+            [args[0] for args, kwargs in self.tx.append.call_args_list],
+            [ANNOTATE_BY_URI, ANNOTATE_BY_NAME, ADD_READ_ACCESS,
+             ADD_READ_ACCESS, REMOVE_READ_ACCESS]
+        )
+        self.assertEqual(self.tx.append.call_args_list[3][0][1], {'rows': [
+            {'ds_uuid': 'ds2', 'user_id': 1, 'user_name': None},
+            {'ds_uuid': 'ds2', 'user_id': 2, 'user_name': 'user2'}
+        ]})
+        self.tx.commit.assert_called_once_with()
+
+    def test_apply_clears_rows(self):
+        self.sync.add_read_access(['ds1'], [1])
+        self.assertEqual(self.sync.apply()['add_read_access'], 1)
+        self.assertEqual(self.sync.rows['add_read_access'], [])
+
+    def test_apply_without_changes(self):
+        self.sync.apply()
+        self.assertFalse(self.graph.cypher.begin.called)
+
+    def test_dry_run(self):
+        sync = Neo4jSync(dry_run=True, graph=self.graph)
+        sync.add_read_access(['ds1'], [1, 2])
+        self.assertEqual(sync.apply()['add_read_access'], 2)
+        self.assertFalse(self.graph.cypher.begin.called)
+        self.assertEqual(len(sync.rows['add_read_access']), 2)
+
+    def test_diff(self):
+        self.sync.add_read_access(['ds1'], [1, 2])
+        self.sync.remove_read_access(['ds1'], [1, 2])
+        # only access of user 1 exists in the graph
+        self.graph.cypher.execute.side_effect = \
+            lambda statement, params: [[0]]
+        diff = self.sync.diff()
+        self.assertEqual(diff['add_read_access'], [
+            {'ds_uuid': 'ds1', 'user_id': 2, 'user_name': None}
+        ])
+        self.assertEqual(diff['remove_read_access'], [
+            {'ds_uuid': 'ds1', 'user_id': 1, 'user_name': None}
+        ])
+        self.graph.cypher.execute.assert_called_with(
+            EXISTING_READ_ACCESS, {'rows': [
+                {'ds_uuid': 'ds1', 'user_id': 1, 'user_name': None, 'key': 0},
+                {'ds_uuid': 'ds1', 'user_id': 2, 'user_name': None, 'key': 1}
+            ]}
+        )
+        self.assertFalse(self.graph.cypher.begin.called)
+
+    def test_diff_ignores_rows_that_match_nothing(self):
+        self.sync.add_annotations([self.annotation('1'),
+                                   self.annotation('2')])
+        self.sync.add_read_access(['ds1', 'ds2'], [1])
+        # term CL:1 and data set ds2 are missing from the graph
+        self.graph.cypher.execute.side_effect = self._existing_rows({
+            EXISTING_ANNOTATIONS_BY_NAME: [0],
+            EXISTING_OR_UNMATCHED_READ_ACCESS: [1]
+        })
+        diff = self.sync.diff()
+        self.assertEqual([row['ont_id'] for row in
+                          diff['annotations_by_name']], ['CL:2'])
+        self.assertEqual(diff['add_read_access'], [
+            {'ds_uuid': 'ds1', 'user_id': 1, 'user_name': None}
+        ])
+
+    def _existing_rows(self, keys_by_statement):
+        def execute(statement, params):
+            keys = keys_by_statement.get(statement, [])
+            return [[row['key']] for row in params['rows']
+                    if row['key'] in keys]
+        return execute
@@ -0,0 +1,138 @@
+from django.test import SimpleTestCase
+
+import mock
+import requests
+
+from .solr_client import SolrClient, SolrUnavailableError
+
+
+def make_response(status_code=200, content='{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.request = requests.Request(
+        'POST', 'http://localhost:8983/solr/core/select', data='q=*:*'
+    ).prepare()
+    return response
+
+
+class SolrClientTests(SimpleTestCase):
+    def setUp(self):
+        self.client = SolrClient('core',
+                                 base_url='http://localhost:8983/solr/',
+                                 timeout=5, max_retries=2, backoff=0,
+                                 failure_threshold=2, reset_timeout=60,
+                                 pool_size=1)
+        self.request_mock = mock.patch.object(self.client.session,
+                                              'request').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_request_url_and_timeout(self):
+        self.request_mock.return_value = make_response()
+        self.client.get(params={'q': '*:*'})
+        self.request_mock.assert_called_once_with(
+            'GET', 'http://localhost:8983/solr/core/select', timeout=5,
+            params={'q': '*:*'}
+        )
+
+    def test_retry_after_connection_error(self):
+        self.request_mock.side_effect = [
+            requests.exceptions.ConnectionError(), make_response()
+        ]
+        self.assertEqual(self.client.get().status_code, 200)
+        self.assertEqual(self.request_mock.call_count, 2)
+
+    def test_retry_after_gateway_error(self):
+        self.request_mock.side_effect = [make_response(503), make_response()]
+        self.assertEqual(self.client.post().status_code, 200)
+
+    def test_no_retry_after_client_error(self):
+        self.request_mock.return_value = make_response(400)
+        self.assertEqual(self.client.post().status_code, 400)
+        self.assertEqual(self.request_mock.call_count, 1)
+
+    def test_retries_are_bounded(self):
+        self.request_mock.side_effect = requests.exceptions.Timeout()
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client.get()
+        self.assertEqual(self.request_mock.call_count, 3)
+
+    def test_no_retry_after_post_timeout(self):
+        self.request_mock.side_effect = [
+            requests.exceptions.ReadTimeout(), make_response()
+        ]
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client.post("update", params={"optimize": "true"})
+        self.assertEqual(self.request_mock.call_count, 1)
+
+    def test_retry_after_post_connect_timeout(self):
+        self.request_mock.side_effect = [
+            requests.exceptions.ConnectTimeout(), make_response()
+        ]
+        self.assertEqual(self.client.post("update").status_code, 200)
+        self.assertEqual(self.request_mock.call_count, 2)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.request_mock.side_effect = requests.exceptions.ConnectionError()
+        for i in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.get()
+        self.request_mock.reset_mock()
+        with self.assertRaises(SolrUnavailableError):
+            self.client.get()
+        self.assertFalse(self.request_mock.called)
+
+    def test_circuit_closes_after_reset_timeout(self):
+        self.request_mock.side_effect = requests.exceptions.ConnectionError()
+        for i in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.get()
+        self.request_mock.side_effect = None
+        self.request_mock.return_value = make_response()
+        with mock.patch('time.time', return_value=self.client._opened_at + 61):
+            self.assertEqual(self.client.get().status_code, 200)
+        self.assertEqual(self.client._failures, 0)
+
+    def test_only_one_probe_after_reset_timeout(self):
+        self.request_mock.side_effect = requests.exceptions.ConnectionError()
+        for i in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.get()
+        reset_time = self.client._opened_at + 61
+
+        def probe(*args, **kwargs):
+            # a concurrent request while the probe is in flight
+            with self.assertRaises(SolrUnavailableError):
+                self.client.get()
+            return make_response()
+
+        self.request_mock.side_effect = probe
+        with mock.patch('time.time', return_value=reset_time):
+            self.assertEqual(self.client.get().status_code, 200)
+        self.assertEqual(self.request_mock.call_count, 1)
+        self.assertIsNone(self.client._opened_at)
+        self.assertFalse(self.client._probing)
+
+    def test_failed_probe_reopens_circuit(self):
+        self.request_mock.side_effect = requests.exceptions.ConnectionError()
+        for i in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.get()
+        reset_time = self.client._opened_at + 61
+        with mock.patch('time.time', return_value=reset_time):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.client.get()
+            self.assertEqual(self.client._opened_at, reset_time)
+            with self.assertRaises(SolrUnavailableError):
+                self.client.get()
+
+    def test_metrics(self):
+        self.request_mock.return_value = make_response(content='{"a": 1}')
+        self.client.post(data='q=*:*')
+        metrics = self.client.get_metrics()['select']
+        self.assertEqual(metrics['requests'], 1)
+        self.assertEqual(metrics['errors'], 0)
+        self.assertEqual(metrics['request_bytes'], 5)
+        self.assertEqual(metrics['response_bytes'], 8)
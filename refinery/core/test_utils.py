@@ -1,7 +1,20 @@
+import uuid
+
+from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from factory_boy.django_model_factories import (
+    GalaxyInstanceFactory, WorkflowEngineFactory, WorkflowFactory
+)
+from factory_boy.utils import create_dataset_with_necessary_models
 
-from .utils import get_absolute_url, is_absolute_url
+from .models import DataSet, ExtendedGroup
+from .utils import (PermissionSnapshot, filter_by_group_perm, get_absolute_url,
+                    get_resource_statistics, get_sharing_statistics,
+                    is_absolute_url)
 
 
 class TestIsAbsoluteURL(TestCase):
@@ -46,3 +59,138 @@ class TestGetAbsoluteURL(TestCase):
     def test_get_absolute_url_with_invalid_current_site(self):
         Site.objects.all().delete()
         self.assertIsNone(get_absolute_url('/path/to/file'))
+
+
+class TestPermissionSnapshot(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', '', 'password')
+        self.data_set = create_dataset_with_necessary_models(user=self.user)
+        self.other_data_set = create_dataset_with_necessary_models()
+        self.group = ExtendedGroup.objects.create(name='Test Group')
+
+    def get_snapshot(self):
+        return PermissionSnapshot(
+            DataSet, [self.data_set.id, self.other_data_set.id]
+        )
+
+    def test_owner(self):
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.get_owner_id(self.data_set.id),
+                         self.user.id)
+        self.assertEqual(snapshot.get_owner_uuid(self.data_set.id),
+                         self.user.profile.uuid)
+
+    def test_no_owner(self):
+        self.assertIsNone(
+            self.get_snapshot().get_owner_uuid(self.other_data_set.id)
+        )
+
+    def test_is_shared(self):
+        self.data_set.share(self.group)
+        snapshot = self.get_snapshot()
+        self.assertTrue(snapshot.is_shared(self.data_set.id))
+        self.assertFalse(snapshot.is_shared(self.other_data_set.id))
+
+    def test_is_public(self):
+        self.data_set.share(ExtendedGroup.objects.public_group())
+        snapshot = self.get_snapshot()
+        self.assertTrue(snapshot.is_public(self.data_set.id))
+        self.assertFalse(snapshot.is_public(self.other_data_set.id))
+
+    def test_group_perms(self):
+        self.data_set.share(self.group, readonly=False)
+        self.assertEqual(
+            self.get_snapshot().get_group_perms(self.data_set.id,
+                                                self.group.id),
+            {'read': True, 'change': True, 'read_meta': True}
+        )
+
+    def test_group_perms_without_sharing(self):
+        self.assertEqual(
+            self.get_snapshot().get_group_perms(self.other_data_set.id,
+                                                self.group.id),
+            {'read': False, 'change': False, 'read_meta': False}
+        )
+
+    def test_number_of_queries_is_independent_of_resources(self):
+        with CaptureQueriesContext(connection) as one_data_set:
+            PermissionSnapshot(DataSet, [self.data_set.id])
+        with CaptureQueriesContext(connection) as many_data_sets:
+            PermissionSnapshot(
+                DataSet, DataSet.objects.values_list('id', flat=True)
+            )
+        self.assertEqual(len(one_data_set), len(many_data_sets))
+
+
+class TestFilterByGroupPerm(TestCase):
+
+    def setUp(self):
+        self.data_set = create_dataset_with_necessary_models()
+        self.other_data_set = create_dataset_with_necessary_models()
+        self.group = ExtendedGroup.objects.create(name='Test Group')
+
+    def test_filter_by_group_perm(self):
+        self.data_set.share(self.group)
+        self.assertEqual(
+            list(filter_by_group_perm(DataSet.objects.all(), self.group.id,
+                                      'read_meta_dataset')),
+            [self.data_set]
+        )
+
+    def test_filter_by_other_perm(self):
+        self.data_set.share(self.group)
+        self.assertFalse(
+            filter_by_group_perm(DataSet.objects.all(), self.group.id,
+                                 'change_dataset').exists()
+        )
+
+
+class TestSharingStatistics(TestCase):
+
+    def setUp(self):
+        self.public_data_set = create_dataset_with_necessary_models()
+        self.shared_data_set = create_dataset_with_necessary_models()
+        self.private_data_set = create_dataset_with_necessary_models()
+        self.public_data_set.share(ExtendedGroup.objects.public_group())
+        # sharing with a group also shares with its manager group
+        self.shared_data_set.share(
+            ExtendedGroup.objects.create(name='Test Group')
+        )
+
+    def test_get_sharing_statistics(self):
+        self.assertEqual(get_sharing_statistics(DataSet.objects.all()), {
+            'total': 3, 'public': 1, 'private': 1, 'private_shared': 1
+        })
+
+    def test_get_sharing_statistics_of_subset(self):
+        self.assertEqual(
+            get_sharing_statistics(
+                DataSet.objects.exclude(id=self.public_data_set.id)
+            ),
+            {'total': 2, 'public': 0, 'private': 1, 'private_shared': 1}
+        )
+
+    def test_resource_statistics_of_workflows(self):
+        workflow_engine = WorkflowEngineFactory(
+            instance=GalaxyInstanceFactory()
+        )
+        for is_active in [True, False]:
+            WorkflowFactory(uuid=str(uuid.uuid4()), is_active=is_active,
+                            workflow_engine=workflow_engine)
+        statistics = get_resource_statistics(refresh=True)
+        self.assertEqual(statistics['workflow']['total'], 2)
+        self.assertEqual(statistics['active_workflow']['total'], 1)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }
+    })
+    def test_resource_statistics_are_cached(self):
+        self.assertEqual(get_resource_statistics()['dataset']['total'], 3)
+        create_dataset_with_necessary_models()
+        self.assertEqual(get_resource_statistics()['dataset']['total'], 3)
+        self.assertEqual(
+            get_resource_statistics(refresh=True)['dataset']['total'], 4
+        )
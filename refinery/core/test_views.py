@@ -4,7 +4,8 @@ import string
 from urlparse import urljoin
 
 from cuser.middleware import CuserMiddleware
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory, TestCase, override_settings
 from django.utils.functional import SimpleLazyObject
 
 from guardian.shortcuts import get_groups_with_perms
@@ -19,16 +20,18 @@ from factory_boy.django_model_factories import (
     GalaxyInstanceFactory, WorkflowEngineFactory, WorkflowFactory
 )
 from factory_boy.utils import (create_dataset_with_necessary_models,
-                               create_tool_with_necessary_models)
+                               create_tool_with_necessary_models,
+                               make_analyses_with_single_dataset)
 
 from .models import (Analysis, DataSet, Event, ExtendedGroup, Project,
                      Workflow, WorkflowEngine)
 
 
 from .serializers import DataSetSerializer, UserSerializer
+from .solr_client import SolrUnavailableError
 
 from .views import (AnalysesViewSet, DataSetsViewSet, EventViewSet,
-                    UserProfileViewSet, WorkflowViewSet)
+                    UserProfileViewSet, WorkflowViewSet, solr_core_search)
 
 cache = memcache.Client(["127.0.0.1:11211"])
 
@@ -213,6 +216,39 @@ class DataSetApiV2Tests(APIV2TestCase):
         get_response = self.view(get_request)
         self.assertEqual(get_response.data.get('total_data_sets'), 1)
 
+    def test_get_returns_only_public_flag(self):
+        get_request = self.factory.get(self.url_root, {'public': True})
+        get_request.user = self.user
+        get_response = self.view(get_request)
+        self.assertEqual(get_response.data.get('total_data_sets'), 2)
+        self.assertEqual(
+            [data_set['uuid'] for data_set in
+             get_response.data.get('data_sets')],
+            [self.user_3_data_set.uuid, self.user_2_data_set.uuid]
+        )
+
+    def test_get_sets_owner_and_public_of_page(self):
+        get_request = self.factory.get(self.url_root, {'limit': 3})
+        get_request.user = self.user_2
+        get_response = self.view(get_request)
+        self.assertEqual(get_response.data.get('total_data_sets'), 2)
+        self.assertEqual(
+            [(data_set['uuid'], data_set['is_owner'], data_set['public'])
+             for data_set in get_response.data.get('data_sets')],
+            [(self.user_3_data_set.uuid, False, True),
+             (self.user_2_data_set.uuid, True, True)]
+        )
+
+    def test_get_sets_owner_for_superuser(self):
+        superuser = User.objects.create_superuser('admin', 'admin@fake.com',
+                                                  'coffeecoffee')
+        get_request = self.factory.get(self.url_root, {'is_owner': True})
+        get_request.user = superuser
+        get_response = self.view(get_request)
+        self.assertEqual(get_response.data.get('total_data_sets'), 4)
+        self.assertTrue(all(data_set['is_owner'] for data_set in
+                            get_response.data.get('data_sets')))
+
     def test_get_data_set_pagination_limit_and_offset(self):
         create_dataset_with_necessary_models(user=self.user)
         params = {'limit': 1, 'offset': 2}
@@ -717,6 +753,24 @@ class DataSetApiV2Tests(APIV2TestCase):
         get_response = self.view(self.get_request)
         self.assertTrue(get_response.data.get('data_sets')[0]["is_clean"])
 
+    def test_get_data_set_analyses_with_owners(self):
+        analyses, data_set = make_analyses_with_single_dataset(2, self.user)
+        self.get_request.user = self.user
+        # owners of all analyses on a page are loaded with a single query
+        with mock.patch.object(Analysis, 'get_owner') as get_owner_mock:
+            get_response = self.view(self.get_request)
+        get_owner_mock.assert_not_called()
+        data_set_data = get_response.data.get('data_sets')[0]
+        self.assertEqual(data_set_data['uuid'], data_set.uuid)
+        self.assertEqual(
+            sorted(analysis['uuid'] for analysis in data_set_data['analyses']),
+            sorted(analysis.uuid for analysis in analyses)
+        )
+        self.assertEqual(
+            set(analysis['owner'] for analysis in data_set_data['analyses']),
+            {self.user.profile.uuid}
+        )
+
     def test_get_data_set_is_not_clean(self):
         # Create a DataSet along with a Visualization Tool
         create_tool_with_necessary_models("VISUALIZATION", user=self.user)
@@ -1089,3 +1143,91 @@ class EventApiV2Tests(APIV2TestCase):
                 }
             ]
         )
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    }
+})
+class SolrCoreSearchTests(TestCase):
+    def setUp(self):
+        self.params = {
+            'q': 'test', 'qf': 'title', 'defType': 'edismax',
+            'fq': 'django_ct:core.dataset', 'allIds': '1',
+            'annotations': 'true'
+        }
+        self.export_response = {
+            'responseHeader': {'status': 0},
+            'response': {'numFound': 2, 'docs': [{'dbid': 1}, {'dbid': 2}]}
+        }
+        self.solr = mock.MagicMock()
+        self.solr.get.side_effect = self._solr_get
+        mock.patch('core.views.get_solr_client',
+                   return_value=self.solr).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def _solr_get(self, handler='select', **kwargs):
+        response = mock.MagicMock(status_code=200)
+        if handler == 'export':
+            if isinstance(self.export_response, Exception):
+                raise self.export_response
+            response.json.return_value = self.export_response
+        elif 'rows' in kwargs['params']:
+            response.json.return_value = {
+                'response': {'numFound': 2, 'docs': [{'dbid': 1},
+                                                     {'dbid': 2}]}
+            }
+        else:
+            response.json.return_value = {
+                'response': {'numFound': 2, 'docs': []}
+            }
+        return response
+
+    def _search(self):
+        request = RequestFactory().get('/solr/core/select/', self.params)
+        request.user = AnonymousUser()
+        return json.loads(solr_core_search(request).content)
+
+    def test_all_ids_from_export_handler(self):
+        response = self._search()
+        self.assertEqual(response['response']['allIds'], [1, 2])
+        self.assertEqual(response['response']['annotations'], {})
+        export_call = self.solr.get.call_args_list[1]
+        self.assertEqual(export_call[0], ('export',))
+        self.assertEqual(export_call[1]['params']['fl'], 'dbid')
+        self.assertIn('access:(g_', export_call[1]['params']['fq'])
+
+    def test_all_ids_are_cached(self):
+        self._search()
+        self._search()
+        handlers = [call[0][0] if call[0] else 'select'
+                    for call in self.solr.get.call_args_list]
+        self.assertEqual(handlers.count('export'), 1)
+
+    def test_all_ids_from_select_if_export_reports_an_error(self):
+        # dbid has no docValues until the core index was rebuilt
+        self.export_response = {
+            'responseHeader': {'status': 400},
+            'response': {'numFound': 0, 'docs': [
+                {'EXCEPTION': 'dbid must have DocValues to use this feature.'}
+            ]}
+        }
+        response = self._search()
+        self.assertEqual(response['response']['allIds'], [1, 2])
+        select_call = self.solr.get.call_args_list[2]
+        self.assertEqual(select_call[0], ())
+        self.assertEqual(select_call[1]['params']['rows'], 2147483647)
+
+    def test_all_ids_from_select_if_export_is_unavailable(self):
+        self.export_response = SolrUnavailableError("Circuit is open")
+        response = self._search()
+        self.assertEqual(response['response']['allIds'], [1, 2])
+
+    def test_search_unavailable(self):
+        self.solr.get.side_effect = SolrUnavailableError("Circuit is open")
+        request = RequestFactory().get('/solr/core/select/', self.params)
+        request.user = AnonymousUser()
+        self.assertEqual(solr_core_search(request).status_code, 503)
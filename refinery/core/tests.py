@@ -283,8 +283,8 @@ class UtilitiesTest(TestCase):
 
     # Mock methods used in filter_nodes_uuids_in_solr
     def fake_generate_solr_params(params, assay_uuid):
-        # Method should respond with a string
-        return ''
+        # Method should respond with solr params
+        return {'json': {'filter': []}, 'params': {}}
 
     def fake_search_solr(params, str_name):
         # Method expects solr params and a str_name. It should return a string
@@ -293,7 +293,7 @@ class UtilitiesTest(TestCase):
 
     def fake_format_solr_response(solr_response):
         # Method expects solr_response and returns array of uuid objs
-        if '&fq=-uuid' in solr_response:
+        if '-_query_:"' in ''.join(solr_response['json']['filter']):
             # if uuids are passed in
             response_node_uuids = [
                 {'uuid': 'd2041706-ad2e-4f5b-a6ac-2122fe2a9751'},
@@ -4,17 +4,20 @@ import ast
 import logging
 import sys
 from urlparse import urljoin
+import uuid
 
 from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.core.mail import send_mail
-from django.db import connection
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 
 from celery.task import task
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from guardian.shortcuts import get_objects_for_user
 from guardian.utils import get_anonymous_user
 import py2neo
@@ -25,8 +28,10 @@ import constants
 # These imports go against our coding style guide, but are necessary for the
 #  time being due to mutual import issues
 import core
+from core.neo4j_sync import Neo4jSync
 from core.search_indexes import DataSetIndex
 import data_set_manager
+import file_store
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +52,7 @@ def skip_if_test_run(func):
 @skip_if_test_run
 def update_data_set_index(data_set):
     """Update a dataset's corresponding document in Solr.
+    Returns False if the update failed.
     """
 
     logger.info('Updated data set (uuid: %s) index', data_set.uuid)
@@ -58,6 +64,8 @@ def update_data_set_index(data_set):
         (e.g. Travis CI doesn't support solr yet)
         """
         logger.error("Could not update DataSetIndex: %s", e)
+        return False
+    return True
 
 
 @skip_if_test_run
@@ -71,77 +79,17 @@ def add_data_set_to_neo4j(dataset, user_id):
         '(id: %s)', dataset.uuid, user_id
     )
 
-    graph = py2neo.Graph(urljoin(settings.NEO4J_BASE_URL, 'db/data'))
-
     # Get annotations of the data_set
     annotations = get_data_set_annotations(dataset.uuid)
     annotations = normalize_annotation_ont_ids(annotations)
 
-    try:
-        tx = graph.cypher.begin()
-
-        # Add dataset and annotations to Neo4J
-        counter = 1
-
-        statement_name = (
-            "MATCH (term:Class {name:{ont_id}}) "
-            "MERGE (ds:DataSet {id:{ds_id},uuid:{ds_uuid}}) "
-            "MERGE ds-[:`annotated_with`]->term"
-        )
-
-        statement_uri = (
-            "MATCH (term:Class {uri:{uri}}) "
-            "MERGE (ds:DataSet {id:{ds_id},uuid:{ds_uuid}}) "
-            "MERGE ds-[:`annotated_with`]->term"
-        )
+    sync = Neo4jSync()
+    sync.add_annotations(annotations)
+    # Link owner with the added dataset
+    sync.add_read_access([dataset.uuid], [user_id])
 
-        for annotation in annotations:
-            if 'value_uri' in annotation:
-                tx.append(
-                    statement_uri,
-                    {
-                        'uri': annotation['value_uri'],
-                        'ds_id': dataset.id,
-                        'ds_uuid': dataset.uuid
-                    }
-                )
-            else:
-                tx.append(
-                    statement_name,
-                    {
-                        'ont_id': (
-                            annotation['value_source'] +
-                            ':' +
-                            annotation['value_accession']
-                        ),
-                        'ds_id': dataset.id,
-                        'ds_uuid': dataset.uuid
-                    }
-                )
-
-            # Send batches of 50 Cypher queries to Neo4J
-            if counter % 50 == 0:
-                tx.process()
-
-            # Increase counter
-            counter += 1
-
-        # Link owner with the added dataset
-        statement = (
-            "MATCH (ds:DataSet {uuid:{ds_uuid}}) "
-            "MERGE (u:User {id:{user_id}}) "
-            "MERGE (ds)<-[:`read_access`]-(u)"
-        )
-
-        tx.append(
-            statement,
-            {
-                'ds_uuid': dataset.uuid,
-                'user_id': user_id
-            }
-        )
-
-        tx.commit()
+    try:
+        sync.apply()
     except Exception as e:
         """ Cypher queries are expected to fail and raise an exception when
         Neo4J is not running or when transactional queries are not available
@@ -163,29 +111,11 @@ def add_read_access_in_neo4j(dataset_uuids, user_ids):
         user_ids, dataset_uuids
     )
 
-    graph = py2neo.Graph(urljoin(settings.NEO4J_BASE_URL, 'db/data'))
-
-    statement = (
-        "MATCH (ds:DataSet {uuid:{dataset_uuid}}) "
-        "MERGE (u:User {id:{user_id}}) "
-        "MERGE (ds)<-[:`read_access`]-(u)"
-    )
+    sync = Neo4jSync()
+    sync.add_read_access(dataset_uuids, user_ids)
 
     try:
-        tx = graph.cypher.begin()
-
-        for dataset_uuid in dataset_uuids:
-            for user_id in user_ids:
-                tx.append(
-                    statement,
-                    {
-                        'dataset_uuid': dataset_uuid,
-                        'user_id': user_id,
-
-                    }
-                )
-
-        tx.commit()
+        sync.apply()
     except Exception as e:
         """ Cypher queries are expected to fail and raise an exception when
         Neo4J is not running or when transactional queries are not available
@@ -211,8 +141,9 @@ def sync_update_annotation_sets_neo4j(username=''):
     """
     Trigger async update of annotation sets in Neo4J
     AnnotationSets link Ontology classes from accessible DataSets with users
+    Returns False if the update failed.
     """
-    _update_annotation_sets_neo4j(username)
+    return _update_annotation_sets_neo4j(username)
 
 
 @task()
@@ -224,7 +155,7 @@ def _update_annotation_sets_neo4j(username):
     )
 
     try:
-        requests.post(
+        response = requests.post(
             urljoin(
                 urljoin(
                     settings.NEO4J_BASE_URL,
@@ -232,11 +163,13 @@ def _update_annotation_sets_neo4j(username):
                 ), username
             )
         )
-
+        response.raise_for_status()
     except Exception as e:
         logger.error(
             'Neo4J couldn\'t prepare annotation sets. Error %s', e
         )
+        return False
+    return True
 
 
 @skip_if_test_run
@@ -334,28 +267,11 @@ def remove_read_access_in_neo4j(dataset_uuids, user_ids):
         user_ids, dataset_uuids
     )
 
-    graph = py2neo.Graph(urljoin(settings.NEO4J_BASE_URL, 'db/data'))
-
-    statement = (
-        "MATCH (ds:DataSet {uuid:{dataset_uuid}}), (u:User {id:{user_id}}) "
-        "MATCH (ds)<-[r:`read_access`]-(u) "
-        "DELETE r"
-    )
+    sync = Neo4jSync()
+    sync.remove_read_access(dataset_uuids, user_ids)
 
     try:
-        tx = graph.cypher.begin()
-
-        for dataset_uuid in dataset_uuids:
-            for user_id in user_ids:
-                tx.append(
-                    statement,
-                    {
-                        'dataset_uuid': dataset_uuid,
-                        'user_id': user_id
-                    }
-                )
-
-        tx.commit()
+        sync.apply()
     except Exception as e:
         """ Cypher queries are expected to fail and raise an exception when
         Neo4J is not running or when transactional queries are not available
@@ -370,6 +286,7 @@ def remove_read_access_in_neo4j(dataset_uuids, user_ids):
 @skip_if_test_run
 def delete_data_set_index(data_set):
     """Remove a dataset's related document from Solr's index.
+    Returns False if the removal failed.
     """
 
     logger.debug('Deleted data set (uuid: %s) index', data_set.uuid)
@@ -381,11 +298,14 @@ def delete_data_set_index(data_set):
         (e.g. Travis CI doesn't support solr yet)
         """
         logger.error("Could not delete from DataSetIndex: %s", e)
+        return False
+    return True
 
 
 @skip_if_test_run
 def delete_data_set_neo4j(dataset_uuid):
     """Remove a dataset's related node in Neo4J.
+    Returns False if the removal failed.
     """
 
     logger.debug('Deleted data set (uuid: %s) in Neo4J', dataset_uuid)
@@ -414,6 +334,8 @@ def delete_data_set_neo4j(dataset_uuid):
             'Failed to remove dataset (uuid: %s) from Neo4J. '
             'Exception: %s', dataset_uuid, e
         )
+        return False
+    return True
 
 
 @skip_if_test_run
@@ -524,237 +446,40 @@ def get_data_set_annotations(dataset_uuid):
     """Extract ontology annotations from the database for all or a specific
     datasets.
     """
-
-    cursor = connection.cursor()
-
-    sql = """SELECT
-        data_set.id AS data_set_id,
-        data_set.uuid AS data_set_uuid,
-        annotated_study.value_source,
-        annotated_study.value_accession,
-        COUNT(data_set.id) AS value_count
-      FROM
-        (
-          SELECT
-            core_dataset.uuid,
-            core_dataset.id,
-            investigation.investigation_id
-          FROM
-            core_dataset
-            JOIN
-            core_investigationlink AS investigation
-            ON
-            core_dataset.id = investigation.data_set_id
-          {}
-        ) AS data_set
-        JOIN
-        (
-          SELECT
-            study.investigation_id AS investigation_id,
-            annotated_node.*
-          FROM
-            data_set_manager_study AS study
-            JOIN
-            (
-              SELECT
-                node.study_id,
-                attr.value_source,
-                attr.value_accession
-              FROM
-                data_set_manager_node AS node
-                JOIN
-                data_set_manager_attribute AS attr
-                ON
-                node.id = attr.node_id
-              WHERE
-                attr.value_source IS NOT NULL AND
-                attr.value_source NOT LIKE '' AND (
-                    attr.value_unit IS NULL OR
-                    attr.value_unit = ''
-                )
-
-              UNION ALL
-
-              SELECT
-                study_id,
-                measurement_source AS value_source,
-                measurement_accession AS value_accession
-              FROM
-                data_set_manager_assay
-              WHERE
-                measurement_accession IS NOT NULL AND
-                measurement_accession NOT LIKE ''
-
-              UNION ALL
-
-              SELECT
-                study_id,
-                technology_source AS value_source,
-                technology_accession AS value_accession
-              FROM
-                data_set_manager_assay
-              WHERE
-                technology_accession IS NOT NULL AND
-                technology_accession NOT LIKE ''
-
-              UNION ALL
-
-              SELECT
-                study_id,
-                type_source AS value_source,
-                type_accession AS value_accession
-              FROM
-                data_set_manager_factor
-              WHERE
-                type_accession IS NOT NULL AND
-                type_accession NOT LIKE ''
-            ) AS annotated_node
-            ON
-            annotated_node.study_id = study.nodecollection_ptr_id
-        ) AS annotated_study
-        ON
-        data_set.investigation_id = annotated_study.investigation_id
-        GROUP BY
-        data_set.id, data_set.uuid,
-        annotated_study.value_source,
-        annotated_study.value_accession
-        """
-
-    # Double string replacement, i.e. `sql` will be replace with a replacement
-    # string for a data set id in case `data_set` has been passed. This is
-    # needed as `cursor.execute()` only inserts escaped strings.
-    ds = ''
+    annotations = core.models.DataSetAnnotation.objects.all()
     if dataset_uuid:
-        ds = 'WHERE core_dataset.uuid = %s'
+        annotations = annotations.filter(data_set__uuid=dataset_uuid)
 
-    sql = sql.format(ds)
+    rows = annotations.values_list(
+        'data_set_id', 'data_set__uuid', 'value_source', 'value_accession'
+    ).annotate(value_count=Sum('count'))
 
-    # According to the docs, `cursor.execute()` automatically escapes all
-    # instances of `%s`.
-    # https://docs.djangoproject.com/en/1.8/topics/db/sql/#connections-and-cursors
-    if dataset_uuid:
-        cursor.execute(sql, [dataset_uuid])
-    else:
-        cursor.execute(sql)
-
-    desc = cursor.description
-
-    return [
-        dict(zip([col[0] for col in desc], row))
-        for row in cursor.fetchall()
-    ]
+    columns = ['data_set_id', 'data_set_uuid', 'value_source',
+               'value_accession', 'value_count']
+    return [dict(zip(columns, row)) for row in rows]
 
 
 def get_data_sets_annotations(dataset_ids=[]):
     """Extract ontology annotations from the database for all or a specific
     datasets.
     """
-
-    cursor = connection.cursor()
-
-    sql = """SELECT
-        data_set.id AS id,
-        annotated_study.value_accession AS term_uri,
-        COUNT(data_set.id) AS term_count
-      FROM
-        (
-          SELECT
-            core_dataset.uuid,
-            core_dataset.id,
-            investigation.investigation_id
-          FROM
-            core_dataset
-            JOIN
-            core_investigationlink AS investigation
-            ON
-            core_dataset.id = investigation.data_set_id
-          {}
-        ) AS data_set
-        JOIN
-        (
-          SELECT
-            study.investigation_id AS investigation_id,
-            annotated_node.*
-          FROM
-            data_set_manager_study AS study
-            JOIN
-            (
-              SELECT
-                node.study_id,
-                attr.value_accession
-              FROM
-                data_set_manager_node AS node
-                JOIN
-                data_set_manager_attribute AS attr
-                ON
-                node.id = attr.node_id
-              WHERE
-                attr.value_source IS NOT NULL AND
-                attr.value_source NOT LIKE '' AND (
-                    attr.value_unit IS NULL OR
-                    attr.value_unit = ''
-                )
-
-              UNION ALL
-
-              SELECT
-                study_id,
-                measurement_accession AS value_accession
-              FROM
-                data_set_manager_assay
-              WHERE
-                measurement_accession IS NOT NULL AND
-                measurement_accession NOT LIKE ''
-
-              UNION ALL
-
-              SELECT
-                study_id,
-                technology_accession AS value_accession
-              FROM
-                data_set_manager_assay
-              WHERE
-                technology_accession IS NOT NULL AND
-                technology_accession NOT LIKE ''
-            ) AS annotated_node
-            ON
-            annotated_node.study_id = study.nodecollection_ptr_id
-        ) AS annotated_study
-        ON
-        data_set.investigation_id = annotated_study.investigation_id
-        GROUP BY data_set.id, annotated_study.value_accession
-        """
-
-    # Double string replacement, i.e. `sql` will be replace with a replacement
-    # string for a data set id in case `data_set` has been passed. This is
-    # needed as `cursor.execute()` only inserts escaped strings.
-    ds = ''
-    if len(dataset_ids):
-        ds = (
-            'WHERE core_dataset.id IN (' +
-            ('%s, ' * len(dataset_ids))[:-2] +
-            ')'
-        )
-
-    sql = sql.format(ds)
-
-    # According to the docs, `cursor.execute()` automatically escapes all
-    # instances of `%s`.
-    # https://docs.djangoproject.com/en/1.8/topics/db/sql/#connections-and-cursors
+    # annotations of factors are not part of search results
+    annotations = core.models.DataSetAnnotation.objects.filter(
+        is_factor=False
+    )
     if len(dataset_ids):
-        cursor.execute(sql, dataset_ids)
-    else:
-        cursor.execute(sql)
+        annotations = annotations.filter(data_set_id__in=dataset_ids)
 
     response = {}
 
-    for row in cursor.fetchall():
-        if row[0] not in response:
-            response[row[0]] = []
+    for data_set_id, value_accession, count in annotations.values_list(
+            'data_set_id', 'value_accession').annotate(Sum('count')):
+        if data_set_id not in response:
+            response[data_set_id] = []
 
-        response[row[0]].append({
-            'term': normalize_annotation_uri(row[1]),
-            'count': row[2]
+        response[data_set_id].append({
+            'term': normalize_annotation_uri(value_accession),
+            'count': count
         })
 
     return response
@@ -835,6 +560,64 @@ def invalidate_cached_object(instance, is_test=False):
         return mc
 
 
+# version token of cached data set searches, which depend on the sharing of
+# all data sets (per-user data set access is versioned per user, see
+# get_data_set_access_version())
+DATA_SET_ACCESS_VERSION_KEY = "data-set-access-version"
+
+
+def get_cache_version(key):
+    """Returns the current version token stored under a cache key (created
+    if missing) or None if the cache is unavailable. Cache keys that include
+    the token are invalidated at once by bump_cache_version()
+    """
+    try:
+        version = cache.get(key)
+        if version is None:
+            # another process may create the token at the same time
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+    except Exception as e:
+        logger.error("Could not retrieve cache version '%s': %s", key, e)
+        return None
+    return version
+
+
+def bump_cache_version(key):
+    """Replaces the version token stored under a cache key, which makes all
+    cache entries created with the previous token stale
+    """
+    try:
+        cache.set(key, uuid.uuid4().hex, None)
+    except Exception as e:
+        logger.error("Could not bump cache version '%s': %s", key, e)
+
+
+def _get_data_set_access_version_key(user_id):
+    return "data-set-access-version-{}".format(user_id)
+
+
+def get_data_set_access_version(user_id):
+    """Returns the current version token of the cached data set access of a
+    user (e.g. accessible assays), or None if the cache is unavailable
+    """
+    return get_cache_version(_get_data_set_access_version_key(user_id))
+
+
+def invalidate_data_set_access(user_ids):
+    """Replaces the data set access version tokens of the given users only,
+    which makes their cached data set access stale
+    """
+    versions = {_get_data_set_access_version_key(user_id): uuid.uuid4().hex
+                for user_id in set(user_ids)}
+    if not versions:
+        return
+    try:
+        cache.set_many(versions, None)
+    except Exception as e:
+        logger.error("Could not bump data set access versions: %s", e)
+
+
 def get_absolute_url(string):
     """Creates an absolute URL from a relative URL using the current Site
     domain and REFINERY_URL_SCHEME Django setting
@@ -906,10 +689,10 @@ def filter_nodes_uuids_in_solr(assay_uuid, filter_out_uuids=[],
         params, assay_uuid)
     # Only require solr filters if exception uuids are passed
     if filter_out_uuids:
-        # node_arr = str(filter_out_uuids).split(',')
-        str_nodes = (' OR ').join(filter_out_uuids)
-        field_filter = "&fq=-uuid:({})".format(str_nodes)
-        solr_params = ''.join([solr_params, field_filter])
+        solr_params['json']['filter'].append('-_query_:"{}"'.format(
+            data_set_manager.utils.create_uuid_query('uuid',
+                                                     filter_out_uuids)
+        ))
     solr_response = data_set_manager.utils.search_solr(
         solr_params, 'data_set_manager')
     solr_reponse_json = data_set_manager.utils.format_solr_response(
@@ -1003,3 +786,180 @@ def accept_global_perms(resource_type):
     if resource_type == 'dataset':
         return False
     return True
+
+
+# guardian stores object primary keys as strings, so the permission table is
+# joined on the primary key cast to a string
+GROUP_PERMISSION_CONDITION = (
+    "EXISTS (SELECT 1 FROM guardian_groupobjectpermission group_perm "
+    "INNER JOIN auth_permission perm ON perm.id = group_perm.permission_id "
+    "WHERE group_perm.object_pk = CAST({table}.id AS VARCHAR(255)) "
+    "AND group_perm.content_type_id = %s AND group_perm.group_id = %s "
+    "AND perm.codename = %s)"
+)
+
+
+def filter_by_group_perm(queryset, group_id, codename):
+    """Restricts a queryset of sharable resources to the resources a group
+    has the given object permission for without loading all of their IDs
+    """
+    model = queryset.model
+    return queryset.extra(
+        where=[GROUP_PERMISSION_CONDITION.format(table=model._meta.db_table)],
+        params=[ContentType.objects.get_for_model(model).id, group_id,
+                codename]
+    )
+
+
+def get_owner_profile_uuids(res_type, res_ids):
+    """Maps IDs of ownable resources to the profile UUIDs of their owners
+    with a single query, ownership is determined by the "add" permission
+    (see OwnableResource.get_owner)
+    """
+    content_type = ContentType.objects.get_for_model(res_type)
+    # guardian stores object primary keys as strings
+    object_pks = [str(res_id) for res_id in res_ids]
+    return {
+        int(object_pk): profile_uuid
+        for object_pk, profile_uuid in UserObjectPermission.objects.filter(
+            content_type=content_type, object_pk__in=object_pks,
+            permission__codename='add_%s' % res_type._meta.verbose_name
+        ).values_list('object_pk', 'user__profile__uuid')
+    }
+
+
+class PermissionSnapshot(object):
+    """Owners and group permissions of many sharable resources of one type,
+    loaded with a constant number of queries instead of several queries per
+    resource
+    """
+    def __init__(self, res_type, res_ids):
+        self.verbose_name = res_type._meta.verbose_name
+        content_type = ContentType.objects.get_for_model(res_type)
+        res_ids = list(res_ids)
+        # guardian stores object primary keys as strings
+        object_pks = [str(res_id) for res_id in res_ids]
+
+        self.owners = {
+            res_id: (user_id, profile_uuid)
+            for res_id, user_id, profile_uuid in res_type.objects.filter(
+                id__in=res_ids, owner__isnull=False
+            ).values_list('id', 'owner_id', 'owner__profile__uuid')
+        }
+
+        # resource ID -> group ID -> permission codenames
+        self.group_perms = {}
+        for object_pk, group_id, codename in \
+                GroupObjectPermission.objects.filter(
+                    content_type=content_type, object_pk__in=object_pks
+                ).values_list('object_pk', 'group_id',
+                              'permission__codename'):
+            self.group_perms.setdefault(int(object_pk), {}).setdefault(
+                group_id, set()
+            ).add(codename)
+
+    def get_owner_id(self, res_id):
+        return self.owners.get(res_id, (None, None))[0]
+
+    def get_owner_uuid(self, res_id):
+        """Returns the UUID of the profile of the owner"""
+        return self.owners.get(res_id, (None, None))[1]
+
+    def is_shared(self, res_id):
+        return bool(self.group_perms.get(res_id))
+
+    def is_public(self, res_id):
+        codename = which_default_read_perm(self.verbose_name).split('.')[1]
+        return codename in self.group_perms.get(res_id, {}).get(
+            settings.REFINERY_PUBLIC_GROUP_ID, ()
+        )
+
+    def get_group_perms(self, res_id, group_id):
+        perms = {'read': False, 'change': False}
+        if self.verbose_name == 'dataset':
+            perms['read_meta'] = False
+
+        for codename in self.group_perms.get(res_id, {}).get(group_id, ()):
+            if codename.startswith('change'):
+                perms['change'] = True
+            elif codename.startswith('read_meta'):
+                # only data sets have read_meta permissions
+                perms['read_meta'] = True
+            elif codename.startswith('read'):
+                perms['read'] = True
+
+        return perms
+
+
+# cached counts of users, groups, files and resources (see StatisticsResource)
+RESOURCE_STATISTICS_CACHE_KEY = "resource-statistics"
+
+
+def get_sharing_statistics(queryset):
+    """Counts the public, privately shared and private resources of a
+    queryset with aggregate queries over the group permissions instead of
+    several queries per resource
+    """
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    # guardian stores object primary keys as strings
+    res_pks = set(str(res_id) for res_id in
+                  queryset.values_list('id', flat=True))
+    group_perms = GroupObjectPermission.objects.filter(
+        content_type=content_type
+    )
+
+    public_pks = set(group_perms.filter(
+        Q(permission__codename__startswith='read') |
+        Q(permission__codename__startswith='change'),
+        group_id=settings.REFINERY_PUBLIC_GROUP_ID
+    ).values_list('object_pk', flat=True).distinct()) & res_pks
+
+    # resources that more than one group has permissions for
+    shared_pks = set(
+        row['object_pk'] for row in group_perms.values('object_pk').annotate(
+            group_count=Count('group', distinct=True)
+        ).filter(group_count__gt=1)
+    ) & res_pks
+
+    total = len(res_pks)
+    public = len(public_pks)
+    private_shared = len(shared_pks - public_pks)
+    return {
+        'total': total, 'public': public,
+        'private': total - public - private_shared,
+        'private_shared': private_shared
+    }
+
+
+def get_resource_statistics(refresh=False):
+    """Returns the counts of users, groups and files and the sharing
+    statistics of data sets, workflows (all and active only) and projects
+    from the cache, computing them if they are missing or refresh is True
+    """
+    if not refresh:
+        try:
+            statistics = cache.get(RESOURCE_STATISTICS_CACHE_KEY)
+        except Exception as e:
+            logger.error("Could not retrieve cached resource statistics: %s",
+                         e)
+            statistics = None
+        if statistics is not None:
+            return statistics
+
+    statistics = {
+        'user': User.objects.count(),
+        'group': Group.objects.count(),
+        'files': file_store.models.FileStoreItem.objects.count(),
+        'dataset': get_sharing_statistics(core.models.DataSet.objects.all()),
+        'workflow': get_sharing_statistics(core.models.Workflow.objects.all()),
+        'active_workflow': get_sharing_statistics(
+            core.models.Workflow.objects.filter(is_active=True)
+        ),
+        'project': get_sharing_statistics(core.models.Project.objects.all())
+    }
+    try:
+        cache.set(RESOURCE_STATISTICS_CACHE_KEY, statistics,
+                  settings.REFINERY_STATISTICS_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.error("Could not cache resource statistics: %s", e)
+    return statistics
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import urllib
 from urlparse import urljoin
@@ -8,6 +10,7 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.sites.models import RequestSite, Site, get_current_site
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.core.mail import EmailMessage
 from django.core.urlresolvers import reverse
@@ -24,8 +27,6 @@ import boto3
 import botocore
 from guardian.shortcuts import (get_groups_with_perms, get_objects_for_user,
                                 get_perms)
-
-from guardian.core import ObjectPermissionChecker
 from guardian.utils import get_anonymous_user
 from registration import signals
 from registration.views import RegistrationView
@@ -47,7 +48,11 @@ from .models import (Analysis, CustomRegistrationProfile, DataSet, Event,
                      UserProfile, Workflow, WorkflowEngine)
 from .serializers import (DataSetSerializer, EventSerializer,
                           UserProfileSerializer, WorkflowSerializer)
-from .utils import (api_error_response, get_data_sets_annotations)
+from .solr_client import get_solr_client
+from .utils import (DATA_SET_ACCESS_VERSION_KEY, PermissionSnapshot,
+                    api_error_response, filter_by_group_perm,
+                    get_cache_version, get_data_sets_annotations,
+                    get_owner_profile_uuids)
 
 logger = logging.getLogger(__name__)
 
@@ -375,7 +380,7 @@ def solr_core_search(request):
     server, it's better to prefetch all dataset uuid and send them back
     altogether rather than having to query from the client side twice.
     """
-    url = settings.REFINERY_SOLR_BASE_URL + "core/select"
+    solr = get_solr_client("core")
 
     headers = {
         'Accept': 'application/json'
@@ -403,57 +408,106 @@ def solr_core_search(request):
     except KeyError:
         annotations = False
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = solr.get(params=params, headers=headers)
         response.raise_for_status()
     except HTTPError as e:
         logger.error(e)
+    except requests.exceptions.ConnectionError as e:
+        logger.error(e)
+        return HttpResponse('Service currently unavailable', status=503)
 
     if allIds or annotations:
-        # Query for all uuids given the same query. Solr shold be very fast
-        # because we just queried for almost the same information, only limited
-        # in size.
-        all_ids_params = {
-            'defType': params['defType'],
-            'fl': 'dbid',
-            'fq': params['fq'],
-            'q': params['q'],
-            'qf': params['qf'],
-            'rows': 2147483647,
-            'start': 0,
-            'wt': 'json'
-        }
-        try:
-            response_ids = requests.get(
-                url,
-                params=all_ids_params,
-                headers=headers
-            )
-            response_ids.raise_for_status()
-        except HTTPError as e:
-            logger.error(e)
-
-        if response_ids.status_code == 200:
-            response_ids = response_ids.json()
-            ids = []
-
-            for ds in response_ids['response']['docs']:
-                ids.append(ds['dbid'])
-
-            annotation_data = get_data_sets_annotations(ids)
+        ids = _get_all_data_set_ids(solr, params)
 
+        if ids is not None:
             response = response.json()
 
             if allIds:
                 response['response']['allIds'] = ids
 
             if annotations:
-                response['response']['annotations'] = annotation_data
+                response['response']['annotations'] = \
+                    get_data_sets_annotations(ids)
 
             return JsonResponse(response)
 
     return HttpResponse(response, content_type='application/json')
 
 
+def _get_all_data_set_ids(solr, params):
+    """Returns the ids of all data sets matching a search (the same query and
+    access filter) or None if Solr failed to return them.
+    Ids are streamed by Solr's export handler from docValues instead of a
+    single huge page of stored documents, and cached for a short time because
+    the same search is usually repeated while paging through the results.
+    """
+    ids_params = {
+        'defType': params['defType'],
+        'fl': 'dbid',
+        'fq': params['fq'],
+        'q': params['q'],
+        'qf': params['qf']
+    }
+    version = get_cache_version(DATA_SET_ACCESS_VERSION_KEY)
+    cache_key = "data-set-search-ids-{}-{}".format(
+        version,
+        hashlib.md5(json.dumps(ids_params, sort_keys=True)).hexdigest()
+    )
+    if version is not None:
+        ids = cache.get(cache_key)
+        if ids is not None:
+            return ids
+
+    ids = _export_data_set_ids(solr, ids_params)
+    if ids is None:
+        ids = _select_data_set_ids(solr, ids_params)
+    if ids is not None and version is not None:
+        cache.set(cache_key, ids,
+                  settings.REFINERY_SOLR_SEARCH_IDS_CACHE_TIMEOUT)
+    return ids
+
+
+def _export_data_set_ids(solr, ids_params):
+    """Returns all data set ids from the export handler or None if it failed,
+    e.g., because dbid has no docValues until the core index was rebuilt
+    (see the rebuild_solr_index fab task)
+    """
+    try:
+        response = solr.get("export", params=dict(ids_params,
+                                                  sort='dbid asc'),
+                            headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        response = response.json()
+    except (HTTPError, requests.exceptions.ConnectionError, ValueError) as e:
+        logger.error("Could not export data set ids from Solr: %s", e)
+        return None
+
+    # the export handler reports errors with status 200 in the response
+    docs = response.get('response', {}).get('docs', [])
+    if response.get('responseHeader', {}).get('status', 0) != 0 or \
+            any('dbid' not in doc for doc in docs):
+        logger.error("Could not export data set ids from Solr: %s",
+                     [doc.get('EXCEPTION') for doc in docs] or response)
+        return None
+    return [doc['dbid'] for doc in docs]
+
+
+def _select_data_set_ids(solr, ids_params):
+    """Returns all data set ids as a single page of search results or None if
+    Solr failed to return them
+    """
+    try:
+        response = solr.get(params=dict(ids_params, rows=2147483647, start=0,
+                                        wt='json'),
+                            headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        return [doc['dbid'] for doc in response.json()['response']['docs']]
+    except (HTTPError, requests.exceptions.ConnectionError, ValueError,
+            KeyError) as e:
+        logger.error("Could not retrieve data set ids from Solr: %s", e)
+        return None
+
+
 def doi(request, id):
     """Forwarding requests to DOI's API"""
     # Decode URL and replace dollar signs by forward slashes
@@ -654,80 +708,68 @@ class DataSetsViewSet(APIView):
         paginator = LimitOffsetPagination()
         paginator.default_limit = 100
 
-        filters = {
-            'is_owner': params.get('is_owner'),
-            'is_public': params.get('public')
-        }
-        try:
-            filters['group'] = ExtendedGroup.objects.get(
-                id=params.get('group')
-            )
-        except Exception:
-            filters['group'] = None
+        user = request.user
+        if not user.is_authenticated():
+            user = get_anonymous_user()
 
+        # data sets without a summary are still being created
         user_data_sets = get_objects_for_user(
-            request.user,
+            user,
             "core.read_meta_dataset",
             accept_global_perms=False
-        ).order_by('-modification_date')
-
-        filtered_data_sets = []
-        check_own = filters.get('is_owner')
-        all_owner_perms = ObjectPermissionChecker(request.user)
-        all_owner_perms.prefetch_perms(user_data_sets)
-
-        check_public = filters.get('is_public')
-        all_public_perms = ObjectPermissionChecker(
-            ExtendedGroup.objects.public_group()
-        )
-        all_public_perms.prefetch_perms(user_data_sets)
-
-        group = filters.get('group')
+        ).filter(summary__isnull=False)
+
+        # all filters have to match and are applied in the database so that
+        # only the requested page of data sets is loaded
+        if params.get('is_owner'):
+            # data sets that the user can share, all for superusers
+            user_data_sets = user_data_sets.filter(
+                id__in=get_objects_for_user(
+                    user, "core.share_dataset", use_groups=False
+                ).values('id')
+            )
+        if params.get('public'):
+            user_data_sets = filter_by_group_perm(
+                user_data_sets, settings.REFINERY_PUBLIC_GROUP_ID,
+                'read_meta_dataset'
+            )
+        try:
+            group = ExtendedGroup.objects.get(id=params.get('group'))
+        except Exception:
+            group = None
         if group:
-            all_group_perms = ObjectPermissionChecker(filters.get('group'))
-            all_group_perms.prefetch_perms(user_data_sets)
-
-        for data_set in user_data_sets:
-            is_public = all_public_perms.has_perm('read_meta_dataset',
-                                                  data_set)
-            is_owner = all_owner_perms.has_perm('share_dataset', data_set)
-            setattr(data_set, 'public', is_public)
-            setattr(data_set, 'is_owner', is_owner)
-
-            if not data_set.is_valid:
-                logger.warning(
-                    "DataSet with UUID: {} is invalid, and most likely is "
-                    "still being created".format(data_set.uuid)
-                )
-                continue
-            elif check_own or check_public or group:
-                if group:
-                    group_perms = all_group_perms.has_perm('read_meta_dataset',
-                                                           data_set)
-                # need to check for filter and then check data set perms
-                if check_own and check_public and group:
-                    if is_owner and is_public and group_perms:
-                        filtered_data_sets.append(data_set)
-                elif check_own and group:
-                    if is_owner and group_perms:
-                        filtered_data_sets.append(data_set)
-                elif check_own and check_public:
-                    if is_owner and is_public:
-                        filtered_data_sets.append(data_set)
-                elif check_public and group:
-                    if is_public and group_perms:
-                        filtered_data_sets.append(data_set)
-                elif check_own and is_owner or check_public and is_public\
-                        or group and group_perms:
-                    filtered_data_sets.append(data_set)
-            else:
-                filtered_data_sets.append(data_set)
+            user_data_sets = filter_by_group_perm(
+                user_data_sets, group.id, 'read_meta_dataset'
+            )
 
-        total_data_sets = len(filtered_data_sets)
-        paged_data_sets = paginator.paginate_queryset(filtered_data_sets,
+        user_data_sets = user_data_sets.select_related(
+            'owner', 'summary'
+        ).prefetch_related(
+            'analysis_set'
+        ).order_by('-modification_date', '-id')
+        paged_data_sets = paginator.paginate_queryset(user_data_sets,
                                                       request)
-        serializer = DataSetSerializer(paged_data_sets, many=True,
-                                       context={'request': request})
+        total_data_sets = paginator.count
+
+        paged_data_set_ids = [data_set.id for data_set in paged_data_sets]
+        perms = PermissionSnapshot(DataSet, paged_data_set_ids)
+        owned_data_set_ids = set(get_objects_for_user(
+            user, "core.share_dataset", use_groups=False
+        ).filter(id__in=paged_data_set_ids).values_list('id', flat=True))
+        for data_set in paged_data_sets:
+            data_set.public = perms.is_public(data_set.id)
+            data_set.is_owner = data_set.id in owned_data_set_ids
+
+        analysis_owner_uuids = get_owner_profile_uuids(
+            Analysis, [analysis.id for data_set in paged_data_sets
+                       for analysis in data_set.get_analyses()]
+        )
+
+        serializer = DataSetSerializer(
+            paged_data_sets, many=True,
+            context={'request': request,
+                     'analysis_owner_uuids': analysis_owner_uuids}
+        )
 
         return Response({'data_sets': serializer.data,
                         'total_data_sets': total_data_sets})
@@ -5,7 +5,6 @@ Created on May 11, 2012
 '''
 
 from collections import deque
-import csv
 import glob
 import itertools
 import logging
@@ -13,25 +12,104 @@ import os
 import re
 import string
 import tempfile
+import uuid
 from zipfile import ZipFile
 
-from django.core.files import File
+from django.conf import settings
 
+import billiard
 import botocore
 
-from file_store.models import FileStoreItem
+from file_store.models import FileStoreItem, bulk_create_file_store_items
 from .models import (Assay, Attribute, Contact, Design, Factor, Investigation,
                      Node, Ontology, Protocol, ProtocolReference,
                      ProtocolReferenceParameter, Publication, Study)
-from .utils import fix_last_column
+from .utils import read_isa_tab_table
 
 logger = logging.getLogger(__name__)
 
+# number of rows per INSERT statement when writing parsed nodes
+BULK_CREATE_BATCH_SIZE = 1000
+
 
 class ParserException(Exception):
     pass
 
 
+class _TableReader(object):
+    """Provides the results of read_isa_tab_table() by file name, either
+    computed on demand or by a pool of worker processes that read at most
+    read_ahead files ahead of the parser (files have to be requested in the
+    given order)
+    """
+    def __init__(self, file_names, pool=None, read_ahead=0):
+        self.pool = pool
+        self.read_ahead = read_ahead
+        self.results = {}
+        self.pending = deque()
+        for file_name in file_names:
+            if file_name not in self.pending:
+                self.pending.append(file_name)
+        self._read_ahead()
+
+    def _read_ahead(self):
+        if self.pool is None:
+            return
+        while self.pending and len(self.results) < self.read_ahead:
+            file_name = self.pending.popleft()
+            self.results[file_name] = self.pool.apply_async(
+                read_isa_tab_table, (file_name,)
+            )
+
+    def __getitem__(self, file_name):
+        """Returns a function that returns the table (or raises the error
+        raised while reading it)
+        """
+        def get_table():
+            result = self.results.pop(file_name, None)
+            # keep the workers busy while this table is parsed
+            self._read_ahead()
+            if result is None:
+                return read_isa_tab_table(file_name)
+            return result.get()
+        return get_table
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+
+class ParsedNode(object):
+    """Node parsed from a study or assay file that is kept in memory together
+    with its parents, attributes and protocol references until all files of
+    the study have been parsed
+    """
+    def __init__(self, node, file_source=None):
+        self.node = node
+        # source of the data file this node represents
+        self.file_source = file_source
+        self.parents = []
+        self.attributes = []
+        self.protocol_references = []
+        # (protocol reference, parameter) pairs
+        self.protocol_reference_parameters = []
+
+    def __unicode__(self):
+        return unicode(self.node.type) + ": " + unicode(self.node.name)
+
+    def add_parent(self, parent):
+        if parent not in self.parents:
+            self.parents.append(parent)
+
+    def has_attribute(self, type, value, subtype=None):
+        for attribute in self.attributes:
+            if (attribute.type == type and attribute.value == value and
+                    (subtype is None or attribute.subtype == subtype)):
+                return True
+        return False
+
+
 class IsaTabParser:
     # TODO: use these where appropriate
     SEPARATOR_CHARACTER = "\t"
@@ -272,9 +350,14 @@ class IsaTabParser:
         self._previous_node = None
         self._current_attribute = None
         self._current_protocol_reference = None
-        self._current_reader = None
+        self._current_line_number = None
         self._current_file = None
         self._current_file_name = None
+        # nodes of the current study in the order they were parsed
+        self._parsed_nodes = []
+        # nodes that are only created once per study (and assay) by key
+        self._parsed_nodes_by_key = {}
+        self._protocols = {}
 
     def _split_header(self, header):
         return [x.strip() for x in header.replace("]", "").strip().split("[")]
@@ -287,15 +370,12 @@ class IsaTabParser:
         # TODO: for a node the number of header components must be 1
         # assert(len(header_components)) == 1
 
-        # try to retrieve this node from the database (unless it is a
-        # normalization or data transformation)
-        is_new = True
-
         # name of the node
         node_name = row[0].strip()
+        node_type = header_components[0]
 
         # TODO: remove this once it has been implemented in the preprocessing
-        if (header_components[0] == Node.RAW_DATA_FILE and
+        if (node_type == Node.RAW_DATA_FILE and
                 self.additional_raw_data_file_extension is not None and
                 len(node_name) > 0):
             if not re.search(
@@ -303,70 +383,25 @@ class IsaTabParser:
                     node_name):
                 node_name += self.additional_raw_data_file_extension
 
-        if (header_components[0] in Node.ASSAYS |
-            {Node.SAMPLE, Node.SOURCE, Node.EXTRACT, Node.LABELED_EXTRACT,
-             Node.DATA_TRANSFORMATION, Node.NORMALIZATION} and
-                len(node_name) > 0) or \
-                (header_components[0] in Node.FILES and len(node_name) > 0):
-            if header_components[0] in {Node.SAMPLE, Node.SOURCE}:
-                node, is_new = Node.objects.get_or_create(
-                    study=self._current_study,
-                    type=header_components[0],
-                    name=node_name)
-            else:
-                node, is_new = Node.objects.get_or_create(
-                    study=self._current_study,
-                    assay=self._current_assay,
-                    type=header_components[0],
-                    name=node_name)
-            # this node represents a file - add the file to the file store and
-            # store the file UUID in the node
-            if (is_new and
-                    header_components[0] in Node.FILES and
-                    node_name is not ""):
-                # create the nodes for the data file in this row
-                file_path = self.file_source_translator(node_name)
-                file_store_item = FileStoreItem.objects.create(
-                    source=file_path
-                )
-                if file_store_item:
-                    node.file_uuid = file_store_item.uuid
-                    node.save()
-                else:
-                    raise ParserException(
-                        "Unable to add {} to file store as a temporary file."
-                        .format(file_path)
-                    )
-            if is_new:
-                logger.info("New node %s created", str(node))
-            else:
-                logger.info("Node %s retrieved", str(node))
+        if len(node_name) == 0:
+            # do not create empty nodes!
+            node = None
+        elif node_type in {Node.SAMPLE, Node.SOURCE}:
+            # sources and samples are shared by the study and its assays
+            node = self._get_or_create_node(node_type, node_name, None)
+        elif node_type in Node.ASSAYS | Node.FILES | {
+                Node.EXTRACT, Node.LABELED_EXTRACT, Node.DATA_TRANSFORMATION,
+                Node.NORMALIZATION}:
+            node = self._get_or_create_node(node_type, node_name,
+                                            self._current_assay)
         else:
-            if len(node_name) > 0:
-                node = Node.objects.create(
-                    study=self._current_study,
-                    assay=self._current_assay,
-                    type=header_components[0],
-                    name=node_name)
-            else:
-                # do not create empty nodes!
-                node = None
+            node = self._create_node(node_type, node_name,
+                                     self._current_assay)
 
         self._current_node = node
 
         if self._previous_node is not None and self._current_node is not None:
-            try:
-                # test if the node has already been created (??? why not use an
-                # if statement ???)
-                node.parents.get(to_node_id=self._previous_node.id)
-            except:
-                self._previous_node.children.add(node)
-                node.parents.add(self._previous_node)
-                node.save()
-                self._previous_node.save()
-        else:
-            # TODO: look up parent nodes in DB
-            pass
+            node.add_parent(self._previous_node)
 
         # remove the node from the row
         row.popleft()
@@ -382,7 +417,7 @@ class IsaTabParser:
                     logger.warning(
                         "Unexpected element `" + headers[-len(row)] + "` when "
                         "parsing node in line " +
-                        str(self._current_reader.line_num) + ", column " +
+                        str(self._current_line_number) + ", column " +
                         str(len(headers) - len(row)) + ".")
                     row.popleft()
             else:
@@ -390,12 +425,132 @@ class IsaTabParser:
                 # can't be attached to anything
                 row.popleft()
         if self._current_node is not None:
-            node.save()
             self._previous_node = node
             self._current_node = None
 
         return node
 
+    def _create_node(self, node_type, node_name, assay):
+        """Returns a new ParsedNode for the current study"""
+        node = Node(uuid=str(uuid.uuid4()), study=self._current_study,
+                    assay=assay, type=node_type, name=node_name)
+        # this node represents a file - the file will be added to the file
+        # store and its UUID stored in the node
+        file_source = None
+        if node_type in Node.FILES:
+            file_source = self.file_source_translator(node_name)
+        parsed_node = ParsedNode(node, file_source)
+        self._parsed_nodes.append(parsed_node)
+        logger.debug("New node %s created", unicode(parsed_node))
+        return parsed_node
+
+    def _get_or_create_node(self, node_type, node_name, assay):
+        """Returns the ParsedNode for this node type and name in the current
+        study and assay, creating it if it does not exist yet
+        """
+        key = (self._current_study.id, assay.id if assay else None,
+               node_type, node_name)
+        try:
+            parsed_node = self._parsed_nodes_by_key[key]
+        except KeyError:
+            parsed_node = self._create_node(node_type, node_name, assay)
+            self._parsed_nodes_by_key[key] = parsed_node
+        else:
+            logger.debug("Node %s retrieved", unicode(parsed_node))
+        return parsed_node
+
+    def _save_nodes(self):
+        """Writes all nodes parsed from the current study and its assays to
+        the database together with their file store items, parents,
+        attributes and protocol references using bulk inserts
+        """
+        parsed_nodes = self._parsed_nodes
+        file_nodes = [
+            parsed_node for parsed_node in parsed_nodes
+            if parsed_node.file_source is not None
+        ]
+        file_store_items = bulk_create_file_store_items(
+            [parsed_node.file_source for parsed_node in file_nodes],
+            batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        for parsed_node, file_store_item in zip(file_nodes,
+                                                file_store_items):
+            parsed_node.node.file_uuid = file_store_item.uuid
+
+        Node.objects.bulk_create(
+            [parsed_node.node for parsed_node in parsed_nodes],
+            batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        # bulk_create() does not set primary keys
+        node_ids = dict(
+            Node.objects.filter(study=self._current_study).values_list(
+                "uuid", "id"
+            )
+        )
+        for parsed_node in parsed_nodes:
+            parsed_node.node.id = node_ids[parsed_node.node.uuid]
+            parsed_node.node._state.adding = False
+
+        parents = []
+        children = []
+        attributes = []
+        protocol_references = []
+        protocol_reference_parameters = []
+        for parsed_node in parsed_nodes:
+            node_id = parsed_node.node.id
+            for parent in parsed_node.parents:
+                parents.append(Node.parents.through(
+                    from_node_id=node_id, to_node_id=parent.node.id
+                ))
+                children.append(Node.children.through(
+                    from_node_id=parent.node.id, to_node_id=node_id
+                ))
+            for attribute in parsed_node.attributes:
+                attribute.node_id = node_id
+                attributes.append(attribute)
+            # unsaved model instances are not hashable
+            parameters = {}
+            for protocol_reference, parameter in \
+                    parsed_node.protocol_reference_parameters:
+                parameters.setdefault(
+                    id(protocol_reference), []
+                ).append(parameter)
+            for protocol_reference in parsed_node.protocol_references:
+                protocol_reference.node_id = node_id
+                if id(protocol_reference) in parameters:
+                    # parameters need the ID of their protocol reference
+                    protocol_reference.save()
+                    for parameter in parameters[id(protocol_reference)]:
+                        parameter.protocol_reference_id = protocol_reference.id
+                        protocol_reference_parameters.append(parameter)
+                else:
+                    protocol_references.append(protocol_reference)
+
+        Node.parents.through.objects.bulk_create(
+            parents, batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        Node.children.through.objects.bulk_create(
+            children, batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        Attribute.objects.bulk_create(
+            attributes, batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        ProtocolReference.objects.bulk_create(
+            protocol_references, batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        ProtocolReferenceParameter.objects.bulk_create(
+            protocol_reference_parameters, batch_size=BULK_CREATE_BATCH_SIZE
+        )
+        logger.info(
+            "Created %s nodes, %s file store items and %s attributes for "
+            "study '%s'", len(parsed_nodes), len(file_store_items),
+            len(attributes), self._current_study
+        )
+
+        self._parsed_nodes = []
+        self._parsed_nodes_by_key = {}
+        self._protocols = {}
+
     def _parse_attribute(self, headers, row):
         """row is a deque, column header is at position len(headers) - len(row)
         """
@@ -411,25 +566,20 @@ class IsaTabParser:
 
         # test if the current node already has an attribute with these
         # properties
-        has_attribute = False
-
         if len(header_components) > 1:
-            if self._current_node.attribute_set.filter(
-                    type=header_components[0],
-                    value=row[0],
-                    subtype=header_components[1]
-            ).count() > 0:
-                has_attribute = True
+            has_attribute = self._current_node.has_attribute(
+                type=header_components[0],
+                value=row[0],
+                subtype=header_components[1]
+            )
         else:
-            if self._current_node.attribute_set.filter(
-                    type=header_components[0],
-                    value=row[0]
-            ).count() > 0:
-                has_attribute = True
+            has_attribute = self._current_node.has_attribute(
+                type=header_components[0],
+                value=row[0]
+            )
         # add attribute if it does not exist yet
         if not has_attribute:
-            attribute = Attribute.objects.create(node=self._current_node)
-            attribute.study = self._current_study
+            attribute = Attribute()
             attribute.type = header_components[0]
             attribute.value = row[0]
 
@@ -465,7 +615,7 @@ class IsaTabParser:
 
         if not has_attribute:
             # done
-            attribute.save()
+            self._current_node.attributes.append(attribute)
             return attribute
 
         # remove the attribute from the row
@@ -476,8 +626,14 @@ class IsaTabParser:
         if self.is_protocol_reference(headers[-len(row)]):
 
             try:
-                protocol = self._current_study.protocol_set.get(name=row[0])
-                # if protocol is None:
+                protocol = self._protocols[row[0]]
+            except KeyError:
+                protocol = None
+            try:
+                if protocol is None:
+                    protocol = self._current_study.protocol_set.get(
+                        name=row[0]
+                    )
             except:
                 if self.ignore_missing_protocols:
                     protocol, is_created = Protocol.objects.get_or_create(
@@ -486,7 +642,7 @@ class IsaTabParser:
                     logger.info(
                         "Undeclared protocol " + row[0] + " when parsing term "
                         "protocol in line " +
-                        str(self._current_reader.line_num) + ", column " +
+                        str(self._current_line_number) + ", column " +
                         str(len(headers) - len(row)) + "." + " This protocol "
                         "was created since the parser is being run with "
                         "ignore_missing_protocols = True.")
@@ -496,14 +652,14 @@ class IsaTabParser:
                         "protocol in line {}, column {}. An attempt to "
                         "create this protocol failed.".format(
                             row[0],
-                            self._current_reader.line_num,
+                            self._current_line_number,
                             len(headers) - len(row)
                         )
                     )
 
-            protocol_reference = ProtocolReference.objects.create(
-                node=self._current_node,
-                protocol=protocol)
+            self._protocols[row[0]] = protocol
+
+            protocol_reference = ProtocolReference(protocol=protocol)
             self._current_protocol_reference = protocol_reference
 
             row.popleft()
@@ -523,7 +679,9 @@ class IsaTabParser:
                 else:
                     pass
 
-            protocol_reference.save()
+            self._current_node.protocol_references.append(
+                protocol_reference
+            )
             return protocol_reference
 
     def _parse_protocol_reference_parameter(self, headers, row):
@@ -534,8 +692,7 @@ class IsaTabParser:
         # ISA-Tab Spec 5.4.2)
         # assert(len(header_components)) > 1 and <= 3
 
-        parameter = ProtocolReferenceParameter.objects.create(
-            protocol_reference=self._current_protocol_reference)
+        parameter = ProtocolReferenceParameter()
         parameter.name = header_components[1]
         parameter.value = row[0]
 
@@ -554,7 +711,9 @@ class IsaTabParser:
             parameter.value_accession = unit_information["accession"]
             parameter.value_source = unit_information["source"]
         # done
-        parameter.save()
+        self._current_node.protocol_reference_parameters.append(
+            (self._current_protocol_reference, parameter)
+        )
         return parameter
 
     def _parse_term_information(self, headers, row):
@@ -577,7 +736,7 @@ class IsaTabParser:
                     "Unexpected element {} when "
                     "parsing term information in line {} , column {}.".format(
                         headers[-len(row)],
-                        self._current_reader.line_num,
+                        self._current_line_number,
                         len(headers) - len(row)
                     )
                 )
@@ -595,7 +754,7 @@ class IsaTabParser:
                     "Unexpected element {} when "
                     "parsing term information in line {} , column {}.".format(
                         headers[-len(row)],
-                        self._current_reader.line_num,
+                        self._current_line_number,
                         len(headers) - len(row)
                     )
                 )
@@ -604,7 +763,7 @@ class IsaTabParser:
                 "Unexpected element {} when "
                 "parsing term information in line {} , column {}.".format(
                     headers[-len(row)],
-                    self._current_reader.line_num,
+                    self._current_line_number,
                     len(headers) - len(row)
                 )
             )
@@ -622,7 +781,7 @@ class IsaTabParser:
                 "Unexpected element {} when "
                 "parsing unit information in line {} , column {}.".format(
                     headers[-len(row)],
-                    self._current_reader.line_num,
+                    self._current_line_number,
                     len(headers) - len(row)
                 )
             )
@@ -639,20 +798,20 @@ class IsaTabParser:
             "source": term_information["source"]
         }
 
-    def _parse_assay_file(self, study, assay, file_name):
+    def _parse_assay_file(self, study, assay, file_name, table):
         self._current_file_name = file_name
         self._current_assay = assay
-        self._parse_study_file(study, file_name)
+        self._parse_study_file(study, file_name, table)
 
-    def _parse_study_file(self, study, file_name):
+    def _parse_study_file(self, study, file_name, table):
+        """Builds the nodes of a study or assay file
+        :param table: header and rows returned by read_isa_tab_table()
+        """
         self._current_file_name = file_name
         self._current_study = study
-        self._current_file = open(file_name, "rU")
-        self._current_reader = csv.reader(self._current_file,
-                                          dialect="excel-tab")
         # read column headers
-        headers = []
-        headers = self._current_reader.next()
+        headers, rows = table
+        headers = list(headers)
 
         try:
             headers.remove("")
@@ -661,7 +820,7 @@ class IsaTabParser:
 
         # TODO: check if all factor values used in this file have been declared
 
-        for row in self._current_reader:
+        for self._current_line_number, row in rows:
 
             row = deque(row)
             self._previous_node = None
@@ -993,19 +1152,39 @@ class IsaTabParser:
         # 4. parse all study files and corresponding assay files
         if self._current_investigation is not None:
             # identify studies associated with this investigation
-            for study in self._current_investigation.study_set.all():
-                # parse study file
-                self._current_assay = None
-                study_file_name = os.path.join(path, study.file_name)
-                if fix_last_column(study_file_name):
-                    self._parse_study_file(study, study_file_name)
-                    for assay in study.assay_set.all():
-                        # parse assay file
-                        self._previous_node = None
-                        assay_file_name = os.path.join(path, assay.file_name)
-                        if fix_last_column(assay_file_name):
-                            self._parse_assay_file(study, assay,
-                                                   assay_file_name)
+            studies = [
+                (study, list(study.assay_set.all()))
+                for study in self._current_investigation.study_set.all()
+            ]
+            # in the order in which the files are parsed
+            tables = self._read_tables([
+                os.path.join(path, file_name)
+                for study, assays in studies
+                for file_name in [study.file_name] +
+                [assay.file_name for assay in assays]
+            ])
+            try:
+                for study, assays in studies:
+                    # parse study file
+                    self._current_assay = None
+                    study_file_name = os.path.join(path, study.file_name)
+                    table = tables[study_file_name]()
+                    if table is not None:
+                        self._parse_study_file(study, study_file_name, table)
+                        for assay in assays:
+                            # parse assay file
+                            self._previous_node = None
+                            assay_file_name = os.path.join(path,
+                                                           assay.file_name)
+                            table = tables[assay_file_name]()
+                            if table is not None:
+                                self._parse_assay_file(study, assay,
+                                                       assay_file_name, table)
+                    # write all nodes of the study and its assays at once
+                    self._current_study = study
+                    self._save_nodes()
+            finally:
+                tables.close()
         else:
             raise ParserException(
                 "No investigation was identified when parsing investigation "
@@ -1017,8 +1196,8 @@ class IsaTabParser:
             self._current_investigation.isarchive_file = file_store_item.uuid
             try:
                 with open(isa_archive, 'rb') as isa_archive_obj:
-                    file_store_item.datafile.save(
-                        os.path.basename(isa_archive), File(isa_archive_obj)
+                    file_store_item.save_datafile(
+                        os.path.basename(isa_archive), isa_archive_obj
                     )
             except (EnvironmentError, botocore.exceptions.ClientError,
                     botocore.exceptions.ParamValidationError) as exc:
@@ -1034,8 +1213,8 @@ class IsaTabParser:
                 file_store_item.uuid
             try:
                 with open(isa_archive, 'rb') as preisa_archive_obj:
-                    file_store_item.datafile.save(
-                        os.path.basename(isa_archive), File(preisa_archive_obj)
+                    file_store_item.save_datafile(
+                        os.path.basename(isa_archive), preisa_archive_obj
                     )
             except (EnvironmentError, botocore.exceptions.ClientError,
                     botocore.exceptions.ParamValidationError) as exc:
@@ -1047,6 +1226,23 @@ class IsaTabParser:
         self._current_investigation.save()
         return self._current_investigation
 
+    def _read_tables(self, file_names):
+        """Starts reading and validating study and assay files, in a pool of
+        processes if settings.REFINERY_ISA_TAB_PARSER_PROCESSES is larger than
+        one (tables are still parsed into nodes in order by this process)
+        :param file_names: list of study and assay file names in the order in
+        which they are parsed
+        :returns: _TableReader
+        """
+        processes = min(settings.REFINERY_ISA_TAB_PARSER_PROCESSES,
+                        len(set(file_names)))
+        if processes > 1:
+            # unlike multiprocessing, billiard can start processes from
+            # daemonic Celery workers
+            return _TableReader(file_names, billiard.Pool(processes),
+                                read_ahead=processes)
+        return _TableReader(file_names)
+
     # Utility Functions
     def is_multiline_start(self, string):
         start_quote = False
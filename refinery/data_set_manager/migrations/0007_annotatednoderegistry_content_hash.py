@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_set_manager', '0006_auto_20180124_1042'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annotatednoderegistry',
+            name='content_hash',
+            field=models.CharField(max_length=40, null=True, blank=True),
+        ),
+    ]
@@ -5,20 +5,22 @@ Created on May 10, 2012
 '''
 import os
 from datetime import datetime
+import json
 import logging
 
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
 from celery.result import AsyncResult
 from django_extensions.db.fields import UUIDField
-import requests
 from requests.exceptions import HTTPError
 
 import core
-from core.utils import delete_analysis_index, skip_if_test_run
+from core.solr_client import get_solr_client
+from core.utils import (bump_cache_version, delete_analysis_index,
+                        get_cache_version, skip_if_test_run)
 import data_set_manager
 from file_store.models import FileStoreItem
 
@@ -707,6 +709,8 @@ class Node(models.Model):
         data_set_manager.search_indexes.NodeIndex().update_object(
             self, using="data_set_manager"
         )
+        if self.assay_id is not None:
+            invalidate_assay_files_cache(self.assay.uuid)
 
 
 @receiver(pre_delete, sender=Node)
@@ -726,6 +730,8 @@ def _node_delete(sender, instance, *args, **kwargs):
         file_store_item.delete()
 
     delete_analysis_index(instance)
+    if instance.assay_id is not None:
+        invalidate_assay_files_cache(instance.assay.uuid)
 
 
 class Attribute(models.Model):
@@ -830,12 +836,46 @@ class AttributeOrder(models.Model):
         ) + str(self.rank)
 
 
+@receiver([post_save, post_delete], sender=AttributeOrder)
+def _attribute_order_changed(sender, instance, **kwargs):
+    """Cached file browser responses of an assay depend on its attribute
+    order (facets, exposed fields)"""
+    try:
+        assay = instance.assay
+    except Assay.DoesNotExist:
+        # assay is being deleted
+        return
+    if assay is not None:
+        invalidate_assay_files_cache(assay.uuid)
+
+
+def _get_assay_files_version_key(assay_uuid):
+    return "assay-files-version-{}".format(assay_uuid)
+
+
+def get_assay_files_cache_version(assay_uuid):
+    """Returns the current version token of cached AssaysFiles responses
+    for an assay, or None if the cache is unavailable
+    """
+    return get_cache_version(_get_assay_files_version_key(assay_uuid))
+
+
+def invalidate_assay_files_cache(assay_uuid):
+    """Replaces the version token of an assay which makes all cached
+    AssaysFiles responses for it stale (they expire on their own)
+    """
+    bump_cache_version(_get_assay_files_version_key(assay_uuid))
+
+
 class AnnotatedNodeRegistry(models.Model):
     study = models.ForeignKey(Study)
     assay = models.ForeignKey(Assay, blank=True, null=True)
     node_type = models.TextField()
     creation_date = models.DateTimeField(auto_now_add=True)
     modification_date = models.DateTimeField(auto_now=True)
+    # hash of the content of the AnnotatedNodes created for this entry (used
+    # to skip unchanged study/assays when updating incrementally)
+    content_hash = models.CharField(max_length=40, blank=True, null=True)
 
 
 class AnnotatedNode(models.Model):
@@ -903,15 +943,11 @@ def _is_ignored_attribute(attribute):
     return attribute in ["django_ct", "django_id", "id"]
 
 
-def _query_solr(study, assay, attribute=None):
+def _query_solr(study, assay, facet_attributes=None):
     types = ' OR '.join(
         '"{0}"'.format(type) for type in Node.FILES
     )
 
-    url = '{base_url}data_set_manager/select'.format(
-        base_url=settings.REFINERY_SOLR_BASE_URL
-    )
-
     params = {
         'fq': 'study_uuid:{study_uuid} AND '
               'assay_uuid: {assay_uuid} AND '
@@ -927,13 +963,13 @@ def _query_solr(study, assay, attribute=None):
         'wt': 'json'
     }
 
-    if attribute is not None:
-        params.update({
-            'facet': 'true',
-            'facet.field': attribute,
-            'facet.sort': 'count',
-            'facet.limit': '-1'
-        })
+    if facet_attributes:
+        # number of distinct values of every attribute in a single request
+        # using the JSON Facet API
+        params['json.facet'] = json.dumps(dict(
+            (attribute, 'unique({})'.format(attribute))
+            for attribute in facet_attributes
+        ))
 
     # This log tends to be massive and spams the log file. Turn on only when
     # needed.
@@ -941,7 +977,11 @@ def _query_solr(study, assay, attribute=None):
 
     headers = {'Accept': 'application/json'}
     try:
-        response = requests.get(url, params=params, headers=headers)
+        # parameters are sent in the body since the facets of all attributes
+        # can exceed the maximum length of the request line
+        response = get_solr_client('data_set_manager').post(
+            data=params, headers=headers
+        )
         response.raise_for_status()
     except HTTPError as e:
         logger.error(e)
@@ -959,20 +999,20 @@ def _query_solr(study, assay, attribute=None):
     return results
 
 
-def _is_facet_attribute(attribute, study, assay):
+def _is_facet_attribute(attribute, results):
     """Tests if a an attribute should be used as a facet by default.
     :param attribute: The name of the attribute.
     :type attribute: string
+    :param results: Solr response with unique() counts of the attributes.
+    :type results: dict
     :returns: True if the ratio between items in the data set and the number of
     facet attribute values is smaller than
     settings.DEFAULT_FACET_ATTRIBUTE_VALUES_RATIO, false otherwise.
     """
     ratio = 0.5
-    results = _query_solr(attribute=attribute, study=study, assay=assay)
     items = results['response']['numFound']
-    attribute_values = len(
-        results['facet_counts']['facet_fields'][attribute]
-    ) / 2
+    # attributes without any values are left out of the facets
+    attribute_values = results.get('facets', {}).get(attribute, 0)
 
     return (attribute_values / items) < ratio
 
@@ -988,28 +1028,35 @@ def initialize_attribute_order(study, assay):
     :returns: Number of attributes that were indexed.
     """
     results = _query_solr(study=study, assay=assay)
+    attributes = [
+        key for key in results['response']['docs'][0]
+        if not _is_ignored_attribute(key)
+    ]
+    results = _query_solr(study=study, assay=assay,
+                          facet_attributes=attributes)
 
     attribute_order_objects = []
-    for key in results['response']['docs'][0]:
-        is_facet = _is_facet_attribute(key, study, assay)
+    for key in attributes:
+        is_facet = _is_facet_attribute(key, results)
         is_exposed = _is_exposed_attribute(key)
         is_internal = _is_internal_attribute(key)
         is_active = _is_active_attribute(key)
-        if not _is_ignored_attribute(key):
-            attribute_order_objects.append(
-                AttributeOrder(
-                    study=study,
-                    assay=assay,
-                    solr_field=key,
-                    rank=0,
-                    is_facet=is_facet,
-                    is_exposed=is_exposed,
-                    is_internal=is_internal,
-                    is_active=is_active
-                )
+        attribute_order_objects.append(
+            AttributeOrder(
+                study=study,
+                assay=assay,
+                solr_field=key,
+                rank=0,
+                is_facet=is_facet,
+                is_exposed=is_exposed,
+                is_internal=is_internal,
+                is_active=is_active
             )
+        )
     # insert AttributeOrder objects into database
     AttributeOrder.objects.bulk_create(attribute_order_objects)
+    # bulk_create() does not send post_save signals
+    invalidate_assay_files_cache(assay.uuid)
 
     return len(attribute_order_objects)
 
@@ -10,16 +10,171 @@ import re
 from django.conf import settings
 
 import celery
+from djcelery.backends.database import DatabaseBackend
+from djcelery.models import TaskMeta
 from haystack import indexes
 from haystack.exceptions import SkipDocument
 
 import constants
 import core
+from file_store.models import FileStoreItem
 
 from .models import AnnotatedNode, Assay, Node
 
 logger = logging.getLogger(__name__)
 
+ANNOTATION_FIELDS = [
+    "attribute_type",
+    "attribute_subtype",
+    "attribute_value",
+    "attribute_value_unit"
+]
+
+
+class NodeRelations(object):
+    """Looks up the objects related to a Node that are needed to prepare its
+    Solr document, with separate queries for every Node
+    """
+    def get_annotations(self, node):
+        return AnnotatedNode.objects.filter(node=node).values_list(
+            *ANNOTATION_FIELDS
+        )
+
+    def get_data_set_uuid(self, node):
+        """Raises RuntimeError if the Node's study has no DataSet"""
+        return node.study.get_dataset().uuid
+
+    def get_file_store_item(self, node):
+        return node.get_file_store_item()
+
+    def get_analysis(self, node):
+        return node.get_analysis()
+
+    def is_analysis_output(self, node):
+        """Returns True if the Node is the only non-Refinery output file of an
+        analysis (these are not indexed)
+        """
+        try:
+            core.models.AnalysisNodeConnection.objects.get(
+                node=node,
+                is_refinery_file=False,
+                direction=core.models.OUTPUT_CONNECTION
+            )
+        except (core.models.AnalysisNodeConnection.DoesNotExist,
+                core.models.AnalysisNodeConnection.MultipleObjectsReturned):
+            # Not all Nodes will have an AnalysisNodeConnection
+            # and that's okay
+            return False
+        return True
+
+    def get_import_status(self, file_store_item):
+        return file_store_item.get_import_status()
+
+
+class BulkNodeRelations(NodeRelations):
+    """Looks up the objects related to a batch of Nodes with one query per
+    relation type and serves them from memory
+    """
+    def __init__(self, nodes):
+        node_ids = [node.id for node in nodes]
+
+        self.annotations = {}
+        for values in AnnotatedNode.objects.filter(
+                node_id__in=node_ids).values_list("node_id",
+                                                  *ANNOTATION_FIELDS):
+            self.annotations.setdefault(values[0], []).append(values[1:])
+
+        # the latest version of each investigation determines the DataSet
+        self.data_set_uuids = dict(
+            (investigation_id, data_set_uuid)
+            for investigation_id, data_set_uuid in
+            core.models.InvestigationLink.objects.filter(
+                investigation_id__in=set(
+                    node.study.investigation_id for node in nodes
+                )
+            ).order_by("version", "id").values_list("investigation_id",
+                                                    "data_set__uuid")
+        )
+
+        self.file_store_items = {}
+        for file_store_item in FileStoreItem.objects.filter(
+                uuid__in=[node.file_uuid for node in nodes if node.file_uuid]
+        ).select_related("filetype"):
+            # Node.get_file_store_item() treats duplicates as missing
+            if file_store_item.uuid in self.file_store_items:
+                self.file_store_items[file_store_item.uuid] = None
+            else:
+                self.file_store_items[file_store_item.uuid] = file_store_item
+
+        self.analyses = {}
+        for analysis in core.models.Analysis.objects.filter(
+                uuid__in=set(
+                    node.analysis_uuid for node in nodes if node.analysis_uuid
+                )):
+            if analysis.uuid in self.analyses:
+                self.analyses[analysis.uuid] = None
+            else:
+                self.analyses[analysis.uuid] = analysis
+
+        output_connection_counts = {}
+        for node_id in core.models.AnalysisNodeConnection.objects.filter(
+                node_id__in=node_ids,
+                is_refinery_file=False,
+                direction=core.models.OUTPUT_CONNECTION
+        ).values_list("node_id", flat=True):
+            output_connection_counts[node_id] = (
+                output_connection_counts.get(node_id, 0) + 1
+            )
+        self.analysis_output_ids = set(
+            node_id for node_id, count in output_connection_counts.iteritems()
+            if count == 1
+        )
+
+        # import states are only needed for files that are not available yet
+        self.import_states = None
+        import_task_ids = [
+            item.import_task_id for item in self.file_store_items.values()
+            if item is not None and item.import_task_id and not item.datafile
+        ]
+        if isinstance(celery.current_app.backend, DatabaseBackend):
+            self.import_states = dict(
+                TaskMeta.objects.filter(
+                    task_id__in=import_task_ids
+                ).values_list("task_id", "status")
+            )
+
+    def get_annotations(self, node):
+        return self.annotations.get(node.id, [])
+
+    def get_data_set_uuid(self, node):
+        try:
+            return self.data_set_uuids[node.study.investigation_id]
+        except KeyError:
+            raise RuntimeError(
+                "Couldn't fetch DataSet for Investigation {}".format(
+                    node.study.investigation_id
+                )
+            )
+
+    def get_file_store_item(self, node):
+        if node.file_uuid:
+            return self.file_store_items.get(node.file_uuid)
+        return None
+
+    def get_analysis(self, node):
+        return self.analyses.get(node.analysis_uuid)
+
+    def is_analysis_output(self, node):
+        return node.id in self.analysis_output_ids
+
+    def get_import_status(self, file_store_item):
+        if self.import_states is None:
+            # result backend can't be queried in bulk
+            return file_store_item.get_import_status()
+        # unknown tasks are pending (like celery.result.AsyncResult.state)
+        return self.import_states.get(file_store_item.import_task_id,
+                                      celery.states.PENDING)
+
 
 class NodeIndex(indexes.SearchIndex, indexes.Indexable):
     TYPE_PREFIX = "REFINERY_TYPE"
@@ -48,6 +203,10 @@ class NodeIndex(indexes.SearchIndex, indexes.Indexable):
                                         null=True)
     # TODO: add modification date (based on registry)
 
+    def __init__(self):
+        super(NodeIndex, self).__init__()
+        self.relations = NodeRelations()
+
     def get_model(self):
         return Node
 
@@ -71,25 +230,32 @@ class NodeIndex(indexes.SearchIndex, indexes.Indexable):
                     data[key].add(assay_attr)
         return data
 
-    @staticmethod
-    def _check_skip_indexing_conditions(node):
+    def _check_skip_indexing_conditions(self, node):
         if node.type not in Node.INDEXED_FILES:
             raise SkipDocument()
 
-        try:
-            core.models.AnalysisNodeConnection.objects.get(
-                node=node,
-                is_refinery_file=False,
-                direction=core.models.OUTPUT_CONNECTION
-            )
-        except (core.models.AnalysisNodeConnection.DoesNotExist,
-                core.models.AnalysisNodeConnection.MultipleObjectsReturned):
-            # Not all Nodes will have an AnalysisNodeConnection
-            # and that's okay
-            pass
-        else:
+        if self.relations.is_analysis_output(node):
             raise SkipDocument()
 
+    def full_prepare_nodes(self, nodes):
+        """Returns the Solr documents of a batch of Nodes (skipping Nodes that
+        are not indexed). Related objects are looked up with one query per
+        relation type for the whole batch instead of several queries per
+        Node.
+        :param nodes: list of Nodes, ideally with study and assay selected
+        """
+        self.relations = BulkNodeRelations(nodes)
+        documents = []
+        try:
+            for node in nodes:
+                try:
+                    documents.append(self.full_prepare(node))
+                except SkipDocument:
+                    logger.debug("Indexing for Node '%s' skipped", node.uuid)
+        finally:
+            self.relations = NodeRelations()
+        return documents
+
     # dynamic fields:
     # https://groups.google.com/forum/?fromgroups#!topic/django-haystack/g39QjTkN-Yg
     # http://stackoverflow.com/questions/7399871/django-haystack-sort-results-by-title
@@ -97,12 +263,11 @@ class NodeIndex(indexes.SearchIndex, indexes.Indexable):
         self._check_skip_indexing_conditions(node)
 
         data = super(NodeIndex, self).prepare(node)
-        annotations = AnnotatedNode.objects.filter(node=node)
+        annotations = self.relations.get_annotations(node)
         id_suffix = str(node.study.id)
 
         try:
-            data_set = node.study.get_dataset()
-            data['data_set_uuid'] = data_set.uuid
+            data['data_set_uuid'] = self.relations.get_data_set_uuid(node)
         except RuntimeError as e:
             logger.warn(e)
 
@@ -111,19 +276,21 @@ class NodeIndex(indexes.SearchIndex, indexes.Indexable):
 
         id_suffix = "_" + id_suffix + "_s"
 
-        file_store_item = node.get_file_store_item()
+        file_store_item = self.relations.get_file_store_item(node)
+        analysis = self.relations.get_analysis(node)
 
         data.update(self._assay_data(node))
 
         # create dynamic fields for each attribute
-        for annotation in annotations:
-            name = annotation.attribute_type
-            if annotation.attribute_subtype is not None:
-                name = annotation.attribute_subtype + "_" + name
+        for (attribute_type, attribute_subtype, attribute_value,
+             attribute_value_unit) in annotations:
+            name = attribute_type
+            if attribute_subtype is not None:
+                name = attribute_subtype + "_" + name
 
-            value = annotation.attribute_value
-            if annotation.attribute_value_unit is not None:
-                value += " " + annotation.attribute_value_unit
+            value = attribute_value
+            if attribute_value_unit is not None:
+                value += " " + attribute_value_unit
 
             name = re.sub(r'\W',
                           settings.REFINERY_SOLR_SPACE_DYNAMIC_FIELDS,
@@ -159,15 +326,15 @@ class NodeIndex(indexes.SearchIndex, indexes.Indexable):
         data.update({
             NodeIndex.DATAFILE: datafile,
             NodeIndex.DOWNLOAD_URL: _get_download_url_or_import_state(
-                file_store_item
+                file_store_item, self.relations
             ),
             NodeIndex.TYPE_PREFIX + id_suffix: node.type,
             NodeIndex.NAME_PREFIX + id_suffix: node.name,
             'filetype_Characteristics' + NodeIndex.GENERIC_SUFFIX: filetype,
             NodeIndex.FILETYPE_PREFIX + id_suffix: filetype,
             NodeIndex.ANALYSIS_UUID_PREFIX + id_suffix:
-                constants.NOT_AVAILABLE if node.get_analysis() is None
-                else node.get_analysis().name,
+                constants.NOT_AVAILABLE if analysis is None
+                else analysis.name,
             NodeIndex.SUBANALYSIS_PREFIX + id_suffix:
                 (-1 if node.subanalysis is None  # TODO: upgrade flake8
                  else node.subanalysis),         # and remove parentheses
@@ -179,10 +346,11 @@ class NodeIndex(indexes.SearchIndex, indexes.Indexable):
         return data
 
 
-def _get_download_url_or_import_state(file_store_item):
+def _get_download_url_or_import_state(file_store_item, relations=None):
     """
     Discerns the download url or file import state for a given FileStoreItem
     :param file_store_item: A FileStoreItem instance
+    :param relations: NodeRelations instance used to look up the import state
     :returns <String>:
         - a valid url pointing to the FileStoreItem's datafile
         - constants.NOT_AVAILABLE
@@ -202,6 +370,8 @@ def _get_download_url_or_import_state(file_store_item):
 
     # "N/A" if the import_state is in a "READY_STATE" or "PENDING" with an
     # import_task_id and without a valid download_url
-    import_state = file_store_item.get_import_status()
+    if relations is None:
+        relations = NodeRelations()
+    import_state = relations.get_import_status(file_store_item)
     if import_state in {celery.states.PENDING} | celery.states.READY_STATES:
         return constants.NOT_AVAILABLE
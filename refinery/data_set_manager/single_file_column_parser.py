@@ -6,12 +6,14 @@ Created on Jun 20, 2012
 import csv
 import logging
 import operator
+import uuid
 
 from django.conf import settings
 
 from annotation_server.models import Taxon, species_to_taxon_id
 from core.models import DataSet
-from file_store.models import FileStoreItem, generate_file_source_translator
+from file_store.models import (FileStoreItem, bulk_create_file_store_items,
+                               generate_file_source_translator)
 from file_store.tasks import FileImportTask
 
 from .models import Assay, Attribute, Investigation, Node, Study
@@ -19,6 +21,40 @@ from .tasks import create_dataset
 
 logger = logging.getLogger(__name__)
 
+# number of rows of the metadata file to write to the database at once
+ROW_BATCH_SIZE = 1000
+# maximum number of parameters in a single lookup query
+ID_LOOKUP_CHUNK_SIZE = 500
+
+
+def _read_lines(file_object, chunk_size=64 * 1024):
+    """Iterates over the lines of a file without reading it into memory all
+    at once. Line endings are handled like str.splitlines() to avoid potential
+    newline errors: http://madebyknight.com/handling-csv-uploads-in-django/
+    """
+    remainder = ""
+    while True:
+        chunk = file_object.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).splitlines(True)
+        # the last line may be incomplete or end with a "\r" that belongs to
+        # a "\r\n" split between chunks
+        remainder = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r\n")
+    if remainder:
+        yield remainder.rstrip("\r\n")
+
+
+def _get_node_id(node):
+    """Returns the ID of a Node or the ID itself for Nodes that were written
+    to the database in a previous batch
+    """
+    if isinstance(node, Node):
+        return node.id
+    return node
+
 
 class SingleFileColumnParser:
     """Creates a source -> sample -> assay -> raw data file sequences.
@@ -67,10 +103,8 @@ class SingleFileColumnParser:
         self.metadata_file = metadata_file
         self.metadata_file.seek(0)
         try:
-            # need to use splitlines() to avoid potential newline errors
-            # http://madebyknight.com/handling-csv-uploads-in-django/
             self.metadata_reader = csv.reader(
-                self.metadata_file.read().splitlines(),
+                _read_lines(self.metadata_file),
                 dialect="excel-tab",
                 delimiter=self.delimiter)
         except csv.Error:
@@ -124,6 +158,13 @@ class SingleFileColumnParser:
         self.sample_column_index = sample_column_index
         self.assay_column_index = assay_column_index
         self.column_index_separator = column_index_separator
+        # taxon IDs by species name
+        self._species = {}
+        # source, sample and assay nodes by type and name (the IDs of nodes
+        # are kept instead once they have been written to the database)
+        self._nodes = {Node.SOURCE: {}, Node.SAMPLE: {}, Node.ASSAY: {}}
+        # (parent type, parent name, child type, child name)
+        self._edges = set()
 
     def _create_investigation(self):
         return Investigation.objects.create()
@@ -137,18 +178,24 @@ class SingleFileColumnParser:
 
     def _get_species(self, row):
         if self.species_column_index is not None:
-            try:
-                species_name = row[self.species_column_index].strip()
-                taxon_id_options = species_to_taxon_id(species_name)
-                if len(taxon_id_options) > 1:
-                    logger.warn(
-                        "Using first out of multiple taxon ids found for "
-                        "%s: %s", species_name, taxon_id_options)
-                return taxon_id_options[0][1]
-            except Taxon.DoesNotExist:
-                return None
+            species_name = row[self.species_column_index].strip()
+            if species_name not in self._species:
+                self._species[species_name] = \
+                    self._get_taxon_id(species_name)
+            return self._species[species_name]
         return None
 
+    def _get_taxon_id(self, species_name):
+        try:
+            taxon_id_options = species_to_taxon_id(species_name)
+            if len(taxon_id_options) > 1:
+                logger.warn(
+                    "Using first out of multiple taxon ids found for "
+                    "%s: %s", species_name, taxon_id_options)
+            return taxon_id_options[0][1]
+        except Taxon.DoesNotExist:
+            return None
+
     def _get_genome_build(self, row):
         if self.genome_build_column_index is not None:
             return row[self.genome_build_column_index].strip()
@@ -194,51 +241,113 @@ class SingleFileColumnParser:
                      self.file_column_index, self.auxiliary_file_column_index)
         # UUIDs of data files to postpone importing until parsing is finished
         data_files = []
-        # iterate over non-header rows in file
+        # iterate over non-header rows in file and write them in batches
+        rows = []
         for row in self.metadata_reader:
+            rows.append(row)
+            if len(rows) == ROW_BATCH_SIZE:
+                data_files.extend(self._create_nodes(rows, study, assay))
+                rows = []
+        data_files.extend(self._create_nodes(rows, study, assay))
+
+        # Start remote file import tasks if `Make Import Permanent:` flag set
+        # by the user
+        # Likewise, we'll try to import these files if their source begins with
+        # our REFINERY_DATA_IMPORT_DIR setting (This will be the case if
+        # users upload datafiles associated with their metadata)
+        for file_uuid in data_files:
+            FileImportTask().delay(file_uuid)
+
+        return investigation
+
+    def _get_or_create_node(self, study, assay, node_type, name, new_nodes):
+        """Returns the source, sample or assay node with this name (or its ID)
+        and whether it was newly created
+        """
+        nodes = self._nodes[node_type]
+        try:
+            return nodes[name], False
+        except KeyError:
+            node = Node(uuid=str(uuid.uuid4()), study=study, assay=assay,
+                        type=node_type, name=name)
+            nodes[name] = node
+            new_nodes.append(node)
+            return node, True
+
+    def _add_edge(self, parent_type, parent_name, parent, child_type,
+                  child_name, child, edges):
+        key = (parent_type, parent_name, child_type, child_name)
+        if key not in self._edges:
+            self._edges.add(key)
+            edges.append((parent, child))
+
+    def _create_nodes(self, rows, study, assay):
+        """Creates file store items, nodes, parent/child relationships and
+        sample attributes for a batch of rows using bulk inserts
+        :returns: list of UUIDs of the data files that need to be imported
+        """
+        if not rows:
+            return []
+        # add data files and auxiliary files to file store
+        file_sources = []
+        for row in rows:
+            file_sources.append(
+                self.file_source_translator(row[self.file_column_index])
+            )
+            if self.auxiliary_file_column_index:
+                file_sources.append(self.file_source_translator(
+                    row[self.auxiliary_file_column_index]
+                ))
+        file_store_items = iter(bulk_create_file_store_items(file_sources))
+
+        data_files = []
+        new_nodes = []
+        # (parent, child) pairs of nodes or node IDs
+        edges = []
+        # (sample node, attribute) pairs
+        attributes = []
+        for row in rows:
             # TODO: resolve relative indices
             internal_source_column_index = self.source_column_index
             internal_sample_column_index = self.sample_column_index
             internal_assay_column_index = self.assay_column_index
-            # add data file to file store
-            data_file_path = self.file_source_translator(
-                row[self.file_column_index])
-            data_file_item = \
-                FileStoreItem.objects.create(source=data_file_path)
-            data_files.append(data_file_item.uuid)
-            # add auxiliary file to file store
+            data_file_item = next(file_store_items)
+            row_file_store_items = [data_file_item]
             if self.auxiliary_file_column_index:
-                auxiliary_file_path = self.file_source_translator(
-                    row[self.auxiliary_file_column_index])
-                auxiliary_file_item = \
-                    FileStoreItem.objects.create(source=auxiliary_file_path)
-                data_files.append(auxiliary_file_item.uuid)
-            # create nodes if file was successfully created
+                row_file_store_items.append(next(file_store_items))
+            for file_store_item in row_file_store_items:
+                if (self.file_permanent or file_store_item.source.startswith(
+                        (settings.REFINERY_DATA_IMPORT_DIR, 's3://')
+                )):
+                    data_files.append(file_store_item.uuid)
             # source node
             source_name = self._create_name(
                 row, internal_source_column_index, self.file_column_index)
-            source_node, is_source_new = Node.objects.get_or_create(
-                study=study, name=source_name, type=Node.SOURCE)
+            source_node, is_source_new = self._get_or_create_node(
+                study, None, Node.SOURCE, source_name, new_nodes)
             # sample node
             sample_name = self._create_name(
                 row, internal_sample_column_index, self.file_column_index)
-            sample_node, is_sample_new = Node.objects.get_or_create(
-                study=study, name=sample_name, type=Node.SAMPLE)
-            source_node.add_child(sample_node)
+            sample_node, is_sample_new = self._get_or_create_node(
+                study, None, Node.SAMPLE, sample_name, new_nodes)
+            self._add_edge(Node.SOURCE, source_name, source_node,
+                           Node.SAMPLE, sample_name, sample_node, edges)
             # assay node
             assay_name = self._create_name(
                 row, internal_assay_column_index, self.file_column_index)
-            assay_node, is_assay_new = Node.objects.get_or_create(
-                study=study, assay=assay, name=assay_name, type=Node.ASSAY)
-            sample_node.add_child(assay_node)
-            file_node = Node.objects.create(
-                study=study, assay=assay,
+            assay_node, is_assay_new = self._get_or_create_node(
+                study, assay, Node.ASSAY, assay_name, new_nodes)
+            self._add_edge(Node.SAMPLE, sample_name, sample_node,
+                           Node.ASSAY, assay_name, assay_node, edges)
+            file_node = Node(
+                uuid=str(uuid.uuid4()), study=study, assay=assay,
                 name=row[self.file_column_index].strip(),
                 file_uuid=data_file_item.uuid, type=Node.RAW_DATA_FILE,
                 species=self._get_species(row),
                 genome_build=self._get_genome_build(row),
                 is_annotation=self._is_annotation(row))
-            assay_node.add_child(file_node)
+            new_nodes.append(file_node)
+            edges.append((assay_node, file_node))
             # iterate over columns to create attributes to attach to sample
             # node
             for column_index in range(0, len(row)):
@@ -250,32 +359,42 @@ class SingleFileColumnParser:
                 # create attribute as characteristic and attach to sample node
                 # if the sample node was newly created
                 if is_sample_new:
-                    Attribute.objects.create(
-                        node=sample_node, type=Attribute.CHARACTERISTICS,
+                    attributes.append((sample_node, Attribute(
+                        type=Attribute.CHARACTERISTICS,
                         subtype=self.headers[column_index].strip().lower(),
                         value=row[column_index].strip()
-                    )
+                    )))
 
-        # Start remote file import tasks if `Make Import Permanent:` flag set
-        # by the user
-        # Likewise, we'll try to import these files if their source begins with
-        # our REFINERY_DATA_IMPORT_DIR setting (This will be the case if
-        # users upload datafiles associated with their metadata)
+        Node.objects.bulk_create(new_nodes)
+        # bulk_create() does not set primary keys
+        node_ids = {}
+        node_uuids = [node.uuid for node in new_nodes]
+        for index in range(0, len(node_uuids), ID_LOOKUP_CHUNK_SIZE):
+            node_ids.update(Node.objects.filter(
+                uuid__in=node_uuids[index:index + ID_LOOKUP_CHUNK_SIZE]
+            ).values_list("uuid", "id"))
+        for node in new_nodes:
+            node.id = node_ids[node.uuid]
+            # keep only IDs of nodes that may be referenced by later rows
+            if node.type in self._nodes:
+                self._nodes[node.type][node.name] = node.id
 
-        for uuid in data_files:
-            try:
-                file_store_item = FileStoreItem.objects.get(uuid=uuid)
-            except (FileStoreItem.DoesNotExist,
-                    FileStoreItem.MultipleObjectsReturned) as e:
-                logger.error("Couldn't properly fetch FileStoreItem %s", e)
-            else:
-
-                if (self.file_permanent or file_store_item.source.startswith(
-                        (settings.REFINERY_DATA_IMPORT_DIR, 's3://')
-                )):
-                    FileImportTask().delay(uuid)
-
-        return investigation
+        Node.children.through.objects.bulk_create([
+            Node.children.through(from_node_id=_get_node_id(parent),
+                                  to_node_id=_get_node_id(child))
+            for parent, child in edges
+        ])
+        Node.parents.through.objects.bulk_create([
+            Node.parents.through(from_node_id=_get_node_id(child),
+                                 to_node_id=_get_node_id(parent))
+            for parent, child in edges
+        ])
+        for sample_node, attribute in attributes:
+            attribute.node_id = _get_node_id(sample_node)
+        Attribute.objects.bulk_create(
+            [attribute for sample_node, attribute in attributes]
+        )
+        return data_files
 
 
 def process_metadata_table(
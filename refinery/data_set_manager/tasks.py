@@ -267,7 +267,8 @@ def annotate_nodes(investigation_uuid):
                     node_type,
                     study.uuid,
                     assay.uuid,
-                    update=True
+                    update=True,
+                    incremental=True
                 )
 
                 index_annotated_nodes(node_type, study.uuid, assay.uuid)
@@ -342,6 +343,9 @@ def parse_isatab(username, public, path, identity_id=None,
                         fileStoreItem = FileStoreItem.objects.get(
                             uuid=investigation.isarchive_file)
                         if fileStoreItem:
+                            # recorded when the archive was saved
+                            checksum = fileStoreItem.checksum
+                        if fileStoreItem and not checksum:
                             try:
                                 logger.info("Get file: %s", fileStoreItem)
                                 checksum = calculate_checksum(
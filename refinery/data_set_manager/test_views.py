@@ -29,6 +29,11 @@ from .tests import MetadataImportTestBase
 from .views import AddFileToNodeView, Assays, AssaysAttributes, NodeViewSet
 
 TEST_DATA_BASE_PATH = "data_set_manager/test-data/"
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    }
+}
 
 
 class AddFileToNodeViewTests(APITestCase):
@@ -540,6 +545,14 @@ class AssaysFilesAPITests(APITestCase):
         self.url = "/api/v2/assays/%s/files/"
         self.non_meta_attributes = ['REFINERY_DOWNLOAD_URL', 'REFINERY_NAME']
         self.client = APIClient()
+        self.download_url = "/api/v2/assays/%s/files/download/"
+        self.export_fields = ['REFINERY_NAME_6_3_s',
+                              'organism_Characteristics_6_3_s']
+        self.export_docs = [
+            {'REFINERY_NAME_6_3_s': 'a.txt',
+             'organism_Characteristics_6_3_s': u'Homo sapiens'},
+            {'REFINERY_NAME_6_3_s': 'b.txt'}
+        ]
 
     def tearDown(self):
         self.client.logout()
@@ -650,6 +663,132 @@ class AssaysFilesAPITests(APITestCase):
                                               self.non_meta_attributes)
         self.assertEqual(response.status_code, 200)
 
+    def _get_files(self, params=None):
+        if params is None:
+            params = {'limit': '0', 'data_set_uuid': self.data_set.uuid}
+        return self.client.get(self.url % self.valid_uuid, params)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch('data_set_manager.views.search_solr')
+    @mock.patch('data_set_manager.views.format_solr_response',
+                return_value={'status': 200})
+    def test_repeated_request_is_cached(self, mock_format, mock_search):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        self._get_files()
+        response = self._get_files()
+        self.assertEqual(response.data, {'status': 200})
+        self.assertEqual(mock_search.call_count, 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch('data_set_manager.views.search_solr')
+    @mock.patch('data_set_manager.views.format_solr_response',
+                return_value={'status': 200})
+    def test_different_params_are_cached_separately(self, mock_format,
+                                                    mock_search):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        self._get_files()
+        self._get_files({'limit': '0', 'offset': '10',
+                         'data_set_uuid': self.data_set.uuid})
+        self.assertEqual(mock_search.call_count, 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch('data_set_manager.views.search_solr')
+    @mock.patch('data_set_manager.views.format_solr_response',
+                return_value={'status': 200})
+    def test_permission_tiers_are_cached_separately(self, mock_format,
+                                                    mock_search):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        self._get_files()
+        self.client.logout()
+        assign_perm('read_meta_%s' % DataSet._meta.model_name, self.user2,
+                    self.data_set)
+        self.client.login(username=self.user_guest,
+                          password=self.fake_password)
+        self._get_files()
+        self.assertEqual(mock_search.call_count, 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch('data_set_manager.views.search_solr')
+    @mock.patch('data_set_manager.views.format_solr_response',
+                return_value={'status': 200})
+    def test_cache_invalidated_by_attribute_order_change(self, mock_format,
+                                                         mock_search):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        self._get_files()
+        assay = Assay.objects.get(uuid=self.valid_uuid)
+        AttributeOrder.objects.create(study=assay.study, assay=assay,
+                                      solr_field='Character_Title')
+        self._get_files()
+        self.assertEqual(mock_search.call_count, 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @mock.patch('data_set_manager.views.search_solr')
+    @mock.patch('data_set_manager.views.format_solr_response',
+                return_value={'status': 200})
+    def test_cache_invalidated_by_reindexing(self, mock_format, mock_search):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        self._get_files()
+        assay = Assay.objects.get(uuid=self.valid_uuid)
+        node = Node.objects.create(assay=assay, study=assay.study,
+                                   name='test')
+        with mock.patch('data_set_manager.search_indexes.NodeIndex'):
+            node.update_solr_index()
+        self._get_files()
+        self.assertEqual(mock_search.call_count, 2)
+
+    def _download(self, **params):
+        params['data_set_uuid'] = self.data_set.uuid
+        solr_params = {'json': {'fields': self.export_fields}, 'params': {}}
+        with mock.patch(
+                'data_set_manager.views.generate_solr_params_for_assay',
+                return_value=solr_params), \
+            mock.patch('data_set_manager.views.iterate_solr_docs',
+                       return_value=iter(self.export_docs)) as mock_iterate:
+            response = self.client.get(self.download_url % self.valid_uuid,
+                                       params)
+            content = ''.join(getattr(response, 'streaming_content', []))
+        return response, content, mock_iterate
+
+    def test_download_csv(self):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        response, content, mock_iterate = self._download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(content, 'Name,Organism\r\n'
+                                  'a.txt,Homo sapiens\r\n'
+                                  'b.txt,\r\n')
+        mock_iterate.assert_called_once_with(
+            {'json': {'fields': self.export_fields}, 'params': {}},
+            'data_set_manager'
+        )
+
+    def test_download_tsv(self):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        response, content, mock_iterate = self._download(file_format='tsv')
+        self.assertEqual(response['Content-Type'],
+                         'text/tab-separated-values')
+        self.assertEqual(content.splitlines()[1], 'a.txt\tHomo sapiens')
+
+    def test_download_invalid_format(self):
+        self.client.login(username=self.user_owner,
+                          password=self.fake_password)
+        response, content, mock_iterate = self._download(file_format='xls')
+        self.assertEqual(response.status_code, 400)
+
+    def test_download_without_perms(self):
+        self.client.login(username=self.user_guest,
+                          password=self.fake_password)
+        response, content, mock_iterate = self._download()
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(mock_iterate.called)
+
 
 class CheckDataFilesViewTests(MetadataImportTestBase):
     def setUp(self):
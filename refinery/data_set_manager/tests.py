@@ -1,5 +1,6 @@
 from StringIO import StringIO
 import contextlib
+import hashlib
 import logging
 import json
 import os
@@ -12,9 +13,11 @@ from django.contrib.auth.models import User
 from django.core.files.uploadedfile import (InMemoryUploadedFile,
                                             SimpleUploadedFile)
 from django.core.management import call_command, CommandError
+from django.db import connection
 from django.db.models import Q
 from django.http import QueryDict
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from celery.states import FAILURE, PENDING, STARTED, SUCCESS
 from djcelery.models import TaskMeta
@@ -32,23 +35,32 @@ from core.tests import TestMigrations
 from file_store.models import FileStoreItem, generate_file_source_translator
 from file_store.tasks import FileImportTask
 
-from .isa_tab_parser import IsaTabParser, ParserException
-from .models import (AnnotatedNode, Assay, AttributeOrder, Investigation, Node,
-                     Study)
+from .isa_tab_parser import IsaTabParser, ParserException, _TableReader
+from .models import (AnnotatedNode, AnnotatedNodeRegistry, Assay, Attribute,
+                     AttributeOrder, Investigation, Node, Study,
+                     _is_facet_attribute, _query_solr)
 from .search_indexes import NodeIndex
 from .serializers import AttributeOrderSerializer
-from .single_file_column_parser import process_metadata_table
+from .single_file_column_parser import _read_lines, process_metadata_table
 from .tasks import parse_isatab
-from .utils import (_create_solr_params_from_node_uuids,
+from .utils import (_bulk_create_annotated_nodes,
+                    _create_solr_params_from_node_uuids, _CopyRowStream,
+                    _delete_annotated_nodes, _get_annotated_node_rows,
+                    _get_annotated_node_rows_hash, _get_attributes_by_id,
+                    _get_inherited_attribute_ids, _retrieve_nodes,
                     create_facet_field_counts, create_facet_filter_query,
+                    create_uuid_query,
                     cull_attributes_from_list, customize_attribute_response,
                     escape_character_solr, format_solr_response,
                     generate_filtered_facet_fields,
                     generate_solr_params_for_assay,
                     get_file_url_from_node_uuid, get_owner_from_assay,
-                    hide_fields_from_list, initialize_attribute_order_ranks,
-                    is_field_in_hidden_list, update_annotated_nodes,
-                    update_attribute_order_ranks)
+                    get_solr_response_json,
+                    hide_fields_from_list, index_nodes_in_batches,
+                    initialize_attribute_order_ranks,
+                    is_field_in_hidden_list, iterate_solr_docs,
+                    read_isa_tab_table, stream_delimited_rows,
+                    update_annotated_nodes, update_attribute_order_ranks)
 
 TEST_DATA_BASE_PATH = "data_set_manager/test-data/"
 
@@ -500,7 +512,13 @@ class UtilitiesTests(TestCase):
     def test_generate_solr_params_no_params_returns_json_filter(self):
         query = generate_solr_params_for_assay(QueryDict({}), self.valid_uuid)
         self.assertListEqual(query['json']['filter'],
-                             ['assay_uuid:({})'.format(self.valid_uuid)]
+                             ['assay_uuid:({})'.format(self.valid_uuid)])
+
+    @override_settings(REFINERY_SOLR_EXACT_UUID_FIELDS=True)
+    def test_generate_solr_params_returns_terms_filter(self):
+        query = generate_solr_params_for_assay(QueryDict({}), self.valid_uuid)
+        self.assertListEqual(query['json']['filter'],
+                             ['{!terms f=assay_uuid_exact}' + self.valid_uuid]
                              )
 
     def test_generate_solr_params_no_params_returns_json_query(self):
@@ -982,6 +1000,30 @@ class UtilitiesTests(TestCase):
             self.assertEqual(attribute.rank,
                              expect_attribute_order[attribute.solr_field])
 
+    def test_query_solr_requests_unique_counts_in_one_request(self):
+        with mock.patch("core.solr_client.SolrClient.post") as post_mock:
+            post_mock.return_value.json.return_value = {
+                "response": {"numFound": 4, "docs": [{}]},
+                "facets": {"count": 4, "Organism": 1}
+            }
+            results = _query_solr(self.study, self.assay,
+                                  facet_attributes=["Organism", "name"])
+        self.assertEqual(post_mock.call_count, 1)
+        self.assertEqual(
+            json.loads(post_mock.call_args[1]["data"]["json.facet"]),
+            {"Organism": "unique(Organism)", "name": "unique(name)"}
+        )
+        self.assertTrue(_is_facet_attribute("Organism", results))
+        # attributes without values don't show up in the facets
+        self.assertTrue(_is_facet_attribute("name", results))
+
+    def test_is_facet_attribute_with_unique_values(self):
+        results = {
+            "response": {"numFound": 4},
+            "facets": {"count": 4, "name": 4}
+        }
+        self.assertFalse(_is_facet_attribute("name", results))
+
     def test_update_attribute_order_ranks(self):
         # Test basic increase
         expected_order = {'Character_Title': 5,
@@ -1189,15 +1231,105 @@ class UtilitiesTests(TestCase):
             {
                 "json": {
                     "query": "django_ct:data_set_manager.node",
-                    "filter": "uuid:({})".format(" OR ".join(fake_node_uuids))
+                    "filter": "uuid:({})".format(
+                        " OR ".join(fake_node_uuids)
+                    )
+                },
+                "params": {
+                    "wt": "json",
+                    "rows": 2
+                }
+            }
+        )
+
+    @override_settings(REFINERY_SOLR_TERMS_CHUNK_SIZE=2)
+    def test_create_uuid_query_splits_or_queries(self):
+        self.assertEqual(create_uuid_query('uuid', ['a', 'b', 'c']),
+                         '(uuid:(a OR b) OR uuid:(c))')
+
+    @override_settings(REFINERY_SOLR_TERMS_CHUNK_SIZE=2)
+    def test_create_uuid_query_without_split(self):
+        self.assertEqual(create_uuid_query('uuid', ['a', 'b']),
+                         'uuid:(a OR b)')
+
+    @override_settings(REFINERY_SOLR_EXACT_UUID_FIELDS=True)
+    def test__create_solr_params_from_node_uuids_with_exact_fields(self):
+        fake_node_uuids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        node_solr_params = _create_solr_params_from_node_uuids(fake_node_uuids)
+        self.assertEqual(
+            node_solr_params,
+            {
+                "json": {
+                    "query": "django_ct:data_set_manager.node",
+                    "filter": "{!terms f=uuid_exact}" +
+                              ",".join(fake_node_uuids)
                 },
                 "params": {
                     "wt": "json",
-                    "rows": constants.REFINERY_SOLR_DOC_LIMIT
+                    "rows": 2
                 }
             }
         )
 
+    def test_iterate_solr_docs_follows_cursor(self):
+        pages = [
+            {"response": {"docs": [{"uuid": "a"}, {"uuid": "b"}]},
+             "nextCursorMark": "AoE1"},
+            {"response": {"docs": [{"uuid": "c"}]},
+             "nextCursorMark": "AoE2"},
+            {"response": {"docs": []}, "nextCursorMark": "AoE2"}
+        ]
+        solr_params = {
+            "json": {"query": "django_ct:data_set_manager.node",
+                     "facet": {"name": {"type": "terms"}}},
+            "params": {"rows": "10", "start": "20", "sort": "name asc"}
+        }
+        cursor_marks = []
+
+        def search(params, core):
+            cursor_marks.append(params["params"]["cursorMark"])
+            self.assertNotIn("start", params["params"])
+            self.assertNotIn("facet", params["json"])
+            self.assertEqual(params["params"]["sort"], "name asc, id asc")
+            self.assertEqual(params["params"]["rows"], 2)
+            return json.dumps(pages[len(cursor_marks) - 1])
+
+        with mock.patch("data_set_manager.utils.search_solr",
+                        side_effect=search):
+            docs = list(iterate_solr_docs(solr_params, "data_set_manager",
+                                          page_size=2))
+        self.assertEqual([doc["uuid"] for doc in docs], ["a", "b", "c"])
+        self.assertEqual(cursor_marks, ["*", "AoE1", "AoE2"])
+        # the original params are not modified
+        self.assertEqual(solr_params["params"]["start"], "20")
+
+    def test_stream_delimited_rows(self):
+        lines = stream_delimited_rows(["a", "b"], iter([["1", "2,3"]]), "\t")
+        self.assertEqual(list(lines), ["a\tb\r\n", "1\t2,3\r\n"])
+
+    @override_settings(REFINERY_SOLR_TERMS_CHUNK_SIZE=2,
+                       REFINERY_SOLR_EXACT_UUID_FIELDS=True)
+    def test_get_solr_response_json_in_chunks(self):
+        node_uuids = [str(uuid.uuid4()) for i in range(5)]
+
+        def search(params, core):
+            chunk = params['json']['filter'].split('}')[1].split(',')
+            return json.dumps({
+                'responseHeader': {},
+                'response': {
+                    'numFound': len(chunk),
+                    'docs': [{'uuid': node_uuid} for node_uuid in chunk]
+                }
+            })
+
+        with mock.patch('data_set_manager.utils.search_solr',
+                        side_effect=search) as search_mock:
+            response = get_solr_response_json(node_uuids)
+        self.assertEqual(search_mock.call_count, 3)
+        self.assertEqual(response['nodes_count'], 5)
+        self.assertItemsEqual([node['uuid'] for node in response['nodes']],
+                              node_uuids)
+
     def test_update_annotated_nodes(self):
         type = 'Raw Data File'
 
@@ -1400,6 +1532,306 @@ class NodeClassMethodTests(TestCase):
         self.assertIsNone(self.node.get_analysis())
 
 
+class AnnotatedNodeTests(TestCase):
+    def setUp(self):
+        investigation = Investigation.objects.create()
+        self.study = Study.objects.create(investigation=investigation)
+        self.assay = Assay.objects.create(study=self.study)
+
+        self.source = Node.objects.create(study=self.study, type=Node.SOURCE,
+                                          name="source")
+        self.sample = Node.objects.create(study=self.study, type=Node.SAMPLE,
+                                          name="sample")
+        self.file_node = Node.objects.create(
+            study=self.study, assay=self.assay, type=Node.RAW_DATA_FILE,
+            name="file.fastq"
+        )
+        self.source.add_child(self.sample)
+        self.sample.add_child(self.file_node)
+
+        self.organism = Attribute.objects.create(
+            node=self.source, type=Attribute.CHARACTERISTICS,
+            subtype="organism", value="Homo sapiens"
+        )
+        self.cell_type = Attribute.objects.create(
+            node=self.sample, type=Attribute.CHARACTERISTICS,
+            subtype="cell type", value="HeLa"
+        )
+
+        other_study = Study.objects.create(investigation=investigation)
+        other_node = Node.objects.create(study=other_study,
+                                         type=Node.SOURCE, name="other")
+        self.other_attribute = Attribute.objects.create(
+            node=other_node, type=Attribute.CHARACTERISTICS,
+            subtype="organism", value="Mus musculus"
+        )
+
+    def test_retrieve_nodes(self):
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid)
+        self.assertEqual(
+            sorted(nodes.keys()),
+            sorted([self.source.id, self.sample.id, self.file_node.id])
+        )
+        self.assertEqual(list(nodes[self.file_node.id]["parents"]),
+                         [self.sample.id])
+        self.assertEqual(list(nodes[self.source.id]["parents"]), [])
+
+    def test_retrieve_nodes_attributes_are_scoped_to_nodes(self):
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid, True)
+        attribute_ids = [
+            attribute[0] for node in nodes.values()
+            for attribute in node["attributes"]
+        ]
+        self.assertEqual(sorted(attribute_ids),
+                         sorted([self.organism.id, self.cell_type.id]))
+        self.assertNotIn(self.other_attribute.id, attribute_ids)
+
+    def test_retrieve_nodes_in_batches(self):
+        with mock.patch("data_set_manager.utils.NODE_GRAPH_BATCH_SIZE", 1):
+            nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid)
+        self.assertEqual(len(nodes), 3)
+        sample_attributes = nodes[self.sample.id]["attributes"]
+        self.assertEqual([attribute[0] for attribute in sample_attributes],
+                         [self.cell_type.id])
+
+    def test_retrieve_nodes_study_only(self):
+        nodes = _retrieve_nodes(self.study.uuid)
+        self.assertNotIn(self.file_node.id, nodes)
+        self.assertEqual(len(nodes), 2)
+
+    def test_get_inherited_attribute_ids(self):
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid)
+        inherited = _get_inherited_attribute_ids(nodes)
+        self.assertEqual(inherited[self.source.id], {self.organism.id})
+        self.assertEqual(inherited[self.sample.id],
+                         {self.organism.id, self.cell_type.id})
+        self.assertEqual(inherited[self.file_node.id],
+                         {self.organism.id, self.cell_type.id})
+
+    def test_get_inherited_attribute_ids_multiple_parents(self):
+        other_sample = Node.objects.create(study=self.study,
+                                           type=Node.SAMPLE, name="sample2")
+        self.source.add_child(other_sample)
+        other_sample.add_child(self.file_node)
+        other_cell_type = Attribute.objects.create(
+            node=other_sample, type=Attribute.CHARACTERISTICS,
+            subtype="cell type", value="K562"
+        )
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid)
+        inherited = _get_inherited_attribute_ids(nodes)
+        self.assertEqual(
+            inherited[self.file_node.id],
+            {self.organism.id, self.cell_type.id, other_cell_type.id}
+        )
+
+    def test_get_inherited_attribute_ids_shared_by_siblings(self):
+        other_file_node = Node.objects.create(
+            study=self.study, assay=self.assay, type=Node.RAW_DATA_FILE,
+            name="file2.fastq"
+        )
+        self.sample.add_child(other_file_node)
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid)
+        inherited = _get_inherited_attribute_ids(nodes)
+        self.assertIs(inherited[self.file_node.id],
+                      inherited[other_file_node.id])
+
+    def _get_annotated_nodes(self):
+        return AnnotatedNode.objects.filter(
+            study=self.study, node_type=Node.RAW_DATA_FILE
+        )
+
+    def test_update_annotated_nodes(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        annotated_nodes = self._get_annotated_nodes()
+        self.assertEqual(
+            sorted(annotated_nodes.values_list("attribute_id", flat=True)),
+            sorted([self.organism.id, self.cell_type.id])
+        )
+        annotated_node = annotated_nodes.get(attribute=self.cell_type)
+        self.assertEqual(annotated_node.node, self.file_node)
+        self.assertEqual(annotated_node.assay, self.assay)
+        self.assertEqual(annotated_node.node_uuid, self.file_node.uuid)
+        self.assertIsNone(annotated_node.node_file_uuid)
+        self.assertEqual(annotated_node.attribute_subtype, "cell type")
+        self.assertEqual(annotated_node.attribute_value, "HeLa")
+        self.assertFalse(annotated_node.is_annotation)
+
+    def test_update_annotated_nodes_replaces_existing_rows(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        self.cell_type.delete()
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        self.assertEqual(
+            list(self._get_annotated_nodes().values_list("attribute_id",
+                                                         flat=True)),
+            [self.organism.id]
+        )
+
+    def test_update_annotated_nodes_records_content_hash(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        registry = AnnotatedNodeRegistry.objects.get(
+            study=self.study, assay=self.assay, node_type=Node.RAW_DATA_FILE
+        )
+        self.assertEqual(len(registry.content_hash), 40)
+
+    def test_update_annotated_nodes_incremental(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        organism_row_id = self._get_annotated_nodes().get(
+            attribute=self.organism
+        ).id
+        self.cell_type.delete()
+        treatment = Attribute.objects.create(
+            node=self.sample, type=Attribute.FACTOR_VALUE,
+            subtype="treatment", value="none"
+        )
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True,
+                               incremental=True)
+        annotated_nodes = self._get_annotated_nodes()
+        self.assertEqual(
+            sorted(annotated_nodes.values_list("attribute_id", flat=True)),
+            sorted([self.organism.id, treatment.id])
+        )
+        # unchanged rows are kept
+        self.assertEqual(
+            annotated_nodes.get(attribute=self.organism).id, organism_row_id
+        )
+
+    def test_update_annotated_nodes_incremental_removes_stale_rows(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        AnnotatedNode.objects.create(
+            node=self.file_node, attribute=self.other_attribute,
+            study=self.study, assay=self.assay,
+            node_uuid=self.file_node.uuid, node_type=Node.RAW_DATA_FILE,
+            node_name=self.file_node.name, attribute_type="Characteristics"
+        )
+        AnnotatedNodeRegistry.objects.update(content_hash=None)
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True,
+                               incremental=True)
+        self.assertEqual(
+            sorted(self._get_annotated_nodes().values_list("attribute_id",
+                                                           flat=True)),
+            sorted([self.organism.id, self.cell_type.id])
+        )
+
+    @mock.patch("data_set_manager.utils.ANNOTATED_NODE_SYNC_BATCH_SIZE", 1)
+    def test_update_annotated_nodes_incremental_replaces_changed_rows(self):
+        other_file_node = Node.objects.create(
+            study=self.study, assay=self.assay, type=Node.RAW_DATA_FILE,
+            name="file2.fastq"
+        )
+        self.sample.add_child(other_file_node)
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        cell_type_row_ids = set(self._get_annotated_nodes().filter(
+            attribute=self.cell_type
+        ).values_list("id", flat=True))
+        self.organism.value = "Mus musculus"
+        self.organism.save()
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True,
+                               incremental=True)
+        annotated_nodes = self._get_annotated_nodes()
+        self.assertEqual(
+            sorted(annotated_nodes.filter(
+                attribute=self.organism
+            ).values_list("attribute_value", flat=True)),
+            ["Mus musculus", "Mus musculus"]
+        )
+        self.assertEqual(set(annotated_nodes.filter(
+            attribute=self.cell_type
+        ).values_list("id", flat=True)), cell_type_row_ids)
+
+    def test_update_annotated_nodes_incremental_skips_unchanged(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        with mock.patch(
+            "data_set_manager.utils._sync_annotated_nodes"
+        ) as sync_mock:
+            update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                                   self.assay.uuid, update=True,
+                                   incremental=True)
+        self.assertFalse(sync_mock.called)
+
+    @mock.patch("pysolr.Solr.commit")
+    @mock.patch("pysolr.Solr.add")
+    def test_index_nodes_in_batches(self, add_mock, commit_mock):
+        for name in ["file2.fastq", "file3.fastq"]:
+            self.sample.add_child(Node.objects.create(
+                study=self.study, assay=self.assay, type=Node.RAW_DATA_FILE,
+                name=name
+            ))
+        counter = index_nodes_in_batches(
+            Node.objects.filter(study=self.study), batch_size=2, threads=0
+        )
+        # source and sample nodes are not indexed
+        self.assertEqual(counter, 3)
+        self.assertEqual(
+            [len(call[0][0]) for call in add_mock.call_args_list], [2, 1]
+        )
+        self.assertEqual(commit_mock.call_count, 1)
+
+    def test_bulk_create_annotated_nodes(self):
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid)
+        rows = _get_annotated_node_rows(
+            nodes, [self.file_node.id], self.study, self.assay,
+            _get_inherited_attribute_ids(nodes), _get_attributes_by_id(nodes)
+        )
+        self.assertEqual(_bulk_create_annotated_nodes(rows), 2)
+        self.assertEqual(self._get_annotated_nodes().count(), 2)
+
+    def test_update_annotated_nodes_hashes_inserted_rows(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        nodes = _retrieve_nodes(self.study.uuid, self.assay.uuid, True)
+        rows = _get_annotated_node_rows(
+            nodes, [self.file_node.id], self.study, self.assay,
+            _get_inherited_attribute_ids(nodes), _get_attributes_by_id(nodes)
+        )
+        self.assertEqual(
+            AnnotatedNodeRegistry.objects.get(
+                assay=self.assay, node_type=Node.RAW_DATA_FILE
+            ).content_hash,
+            _get_annotated_node_rows_hash(rows)
+        )
+
+    def test_delete_annotated_nodes(self):
+        update_annotated_nodes(Node.RAW_DATA_FILE, self.study.uuid,
+                               self.assay.uuid, update=True)
+        _delete_annotated_nodes(
+            self._get_annotated_nodes().filter(attribute=self.organism)
+        )
+        self.assertEqual(
+            list(self._get_annotated_nodes().values_list("attribute_id",
+                                                         flat=True)),
+            [self.cell_type.id]
+        )
+
+    def test_copy_row_stream_hashes_rows(self):
+        rows = [(1, None, True, u"a"), (2, u"\u00e9", False, u"b")]
+        hasher = hashlib.sha1()
+        _CopyRowStream(rows, hasher).read()
+        self.assertEqual(hasher.hexdigest(),
+                         _get_annotated_node_rows_hash(rows))
+
+    def test_copy_row_stream(self):
+        stream = _CopyRowStream(
+            [(1, None, True, u"a\tb\\c"), (2, u"\u00e9", False, u"x\ny")]
+        )
+        self.assertEqual(
+            stream.read(4) + stream.read(),
+            "1\t\\N\tt\ta\\tb\\\\c\n2\t\xc3\xa9\tf\tx\\ny\n"
+        )
+        self.assertEqual(stream.row_count, 2)
+        self.assertEqual(stream.read(), "")
+
+
 class NodeIndexTests(APITestCase):
 
     def setUp(self):
@@ -1635,6 +2067,30 @@ class NodeIndexTests(APITestCase):
                 expected_datafile=self.file_store_item.datafile
             )
 
+    def test_full_prepare_nodes_matches_full_prepare(self):
+        node_index = NodeIndex()
+        self.assertEqual(node_index.full_prepare_nodes([self.node]),
+                         [NodeIndex().full_prepare(self.node)])
+
+    def test_full_prepare_nodes_skips_non_exposed_output_node(self):
+        self._create_analysis_node_connection(OUTPUT_CONNECTION, False)
+        self.assertEqual(NodeIndex().full_prepare_nodes([self.node]), [])
+
+    def test_full_prepare_nodes_query_count_is_independent_of_batch_size(
+            self
+    ):
+        nodes = [self.node] + [
+            Node.objects.create(assay=self.node.assay, study=self.node.study,
+                                name='fake{}.txt'.format(i),
+                                type='Raw Data File')
+            for i in range(10)
+        ]
+        with CaptureQueriesContext(connection) as single_node_queries:
+            NodeIndex().full_prepare_nodes(nodes[:1])
+        with CaptureQueriesContext(connection) as batch_queries:
+            NodeIndex().full_prepare_nodes(nodes)
+        self.assertEqual(len(batch_queries), len(single_node_queries))
+
 
 @contextlib.contextmanager
 def temporary_directory(*args, **kwargs):
@@ -1716,6 +2172,71 @@ class IsaTabParserTests(IsaTabTestBase):
         assays = studies[0].assay_set.all()
         self.assertEqual(len(assays), 1)
 
+    def test_minimal_nodes(self):
+        investigation = self.parse('minimal')
+        study = investigation.study_set.get()
+
+        nodes = Node.objects.filter(study=study)
+        self.assertEqual(nodes.count(), 36)
+        self.assertEqual(nodes.filter(type=Node.SAMPLE).count(), 9)
+        self.assertEqual(
+            Attribute.objects.filter(node__study=study).count(), 36
+        )
+        file_node = nodes.get(type=Node.RAW_DATA_FILE,
+                              name__endswith='rfc111.txt')
+        self.assertEqual(file_node.get_file_store_item().source,
+                         file_node.name)
+        assay_node = nodes.get(type=Node.ASSAY, name='RFC111_file')
+        self.assertEqual(list(file_node.parents.all()), [assay_node])
+        self.assertEqual(list(assay_node.children.all()), [file_node])
+        sample_node = nodes.get(type=Node.SAMPLE, name='RFC111_document')
+        self.assertEqual(list(sample_node.parents.all()),
+                         [nodes.get(type=Node.SOURCE, name='RFC111')])
+        self.assertEqual(list(sample_node.children.all()), [assay_node])
+
+    @override_settings(REFINERY_ISA_TAB_PARSER_PROCESSES=2)
+    def test_multiple_assay_in_parallel(self):
+        investigation = self.parse('multiple-assay')
+
+        studies = investigation.study_set.all()
+        self.assertEqual(len(studies), 1)
+
+        assays = studies[0].assay_set.all()
+        self.assertEqual(len(assays), 2)
+        for assay in assays:
+            self.assertTrue(Node.objects.filter(assay=assay).exists())
+
+    def test_read_isa_tab_table_removes_empty_columns(self):
+        with tempfile.NamedTemporaryFile() as isa_tab_file:
+            isa_tab_file.write("Source Name\tSample Name\t\n"
+                               "source\tsample\t\n"
+                               "source\tsample\n")
+            isa_tab_file.flush()
+            self.assertEqual(
+                read_isa_tab_table(isa_tab_file.name),
+                (["Source Name", "Sample Name"],
+                 [(2, ["source", "sample"]), (3, ["source", "sample"])])
+            )
+
+    def test_read_isa_tab_table_with_value_in_empty_column(self):
+        with tempfile.NamedTemporaryFile() as isa_tab_file:
+            isa_tab_file.write("Source Name\tSample Name\t\n"
+                               "source\tsample\tvalue\n")
+            isa_tab_file.flush()
+            self.assertIsNone(read_isa_tab_table(isa_tab_file.name))
+
+    def test_table_reader_reads_ahead_a_limited_number_of_files(self):
+        pool = mock.MagicMock()
+        tables = _TableReader(['s.txt', 'a1.txt', 'a2.txt', 'a1.txt'], pool,
+                              read_ahead=2)
+        self.assertEqual(
+            [call[0][1] for call in pool.apply_async.call_args_list],
+            [('s.txt',), ('a1.txt',)]
+        )
+        tables['s.txt']()
+        self.assertEqual(pool.apply_async.call_count, 3)
+        self.assertEqual(pool.apply_async.call_args[0][1], ('a2.txt',))
+
     def test_mising_investigation(self):
         with self.assertRaises(ParserException):
             self.parse('missing-investigation')
@@ -1871,6 +2392,28 @@ class SingleFileColumnParserTests(TestCase):
         dataset = self.process_csv('two-line.csv')
         self.assert_expected_nodes(dataset, 2)
 
+    def test_two_line_csv_in_batches(self):
+        with mock.patch(
+                "data_set_manager.single_file_column_parser.ROW_BATCH_SIZE", 1
+        ):
+            dataset = self.process_csv('two-line.csv')
+        self.assert_expected_nodes(dataset, 2)
+        study = dataset.get_investigation().study_set.get()
+        for data_node in Node.objects.filter(study=study,
+                                             type='Raw Data File'):
+            self.assertIsNotNone(data_node.get_file_store_item())
+            assay_node = data_node.parents.get()
+            self.assertEqual(list(assay_node.children.all()), [data_node])
+            sample_node = assay_node.parents.get()
+            self.assertEqual(sample_node.type, Node.SAMPLE)
+            self.assertEqual(sample_node.parents.get().type, Node.SOURCE)
+            self.assertTrue(sample_node.attribute_set.exists())
+
+    def test_read_lines(self):
+        metadata_file = StringIO("a,b\r\nc,d\re,f\ng,h")
+        self.assertEqual(list(_read_lines(metadata_file, chunk_size=4)),
+                         ["a,b", "c,d", "e,f", "g,h"])
+
     def test_reindex_triggered_for_nodes_missing_datafiles(self):
         with mock.patch(
             "data_set_manager.search_indexes.NodeIndex.update_object"
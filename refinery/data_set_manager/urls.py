@@ -12,7 +12,7 @@ from constants import UUID_RE
 from rest_framework.routers import DefaultRouter
 
 from .views import (AddFileToNodeView, Assays, AssaysAttributes,
-                    AssaysFiles, CheckDataFilesView,
+                    AssaysFiles, AssaysFilesDownload, CheckDataFilesView,
                     ChunkedFileUploadCompleteView, ChunkedFileUploadView,
                     DataSetImportView, ImportISATabView, NodeViewSet,
                     ProcessISATabView, ProcessMetadataTableView,
@@ -53,6 +53,8 @@ data_set_manager_router.urls.extend([
     url(r'^assays/$', Assays.as_view()),
     url(r'^assays/(?P<uuid>' + UUID_RE + ')/files/$',
         AssaysFiles.as_view()),
+    url(r'^assays/(?P<uuid>' + UUID_RE + ')/files/download/$',
+        AssaysFilesDownload.as_view()),
     url(r'^assays/(?P<uuid>' + UUID_RE + ')/attributes/$',
         AssaysAttributes.as_view()),
     url(r'^data_set_manager/add-file/$',
@@ -3,28 +3,32 @@ Created on May 29, 2012
 
 @author: nils
 '''
+import array
 import copy
 import csv
 import hashlib
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 import shutil
 import tempfile
 import time
-import urlparse
 
 from django.conf import settings
+from django.db import connection, connections, transaction
 from django.db.models import Q
 from django.utils.http import urlquote, urlunquote
 
-import requests
+import haystack
+from pysolr import SolrError
 
 import constants
 import core
+from core.solr_client import get_solr_client
 
 from .models import (
     AnnotatedNode, AnnotatedNodeRegistry, Assay, Attribute, AttributeOrder,
-    Node, Study
+    Node, Study, get_assay_files_cache_version, invalidate_assay_files_cache
 )
 from .search_indexes import NodeIndex
 from .serializers import AttributeOrderSerializer
@@ -36,12 +40,31 @@ logger = logging.getLogger(__name__)
 # https://docs.djangoproject.com/en/dev/ref/models/querysets/#django.db.models.query.QuerySet.bulk_create
 MAX_BULK_LIST_SIZE = 75
 
-
-# make a list of values unique
-def uniquify(seq):
-    set = {}
-    map(set.__setitem__, seq, [])
-    return set.keys()
+# number of rows fetched per query when loading the node graph of a study or
+# assay (see _retrieve_nodes())
+NODE_GRAPH_BATCH_SIZE = 10000
+
+# number of nodes whose AnnotatedNodes are compared at a time by incremental
+# updates (see _sync_annotated_nodes())
+ANNOTATED_NODE_SYNC_BATCH_SIZE = 1000
+
+# AnnotatedNode fields written by update_annotated_nodes() and
+# _add_annotated_nodes(), in the order of the rows they generate
+ANNOTATED_NODE_FIELDS = [
+    "node",
+    "attribute",
+    "study",
+    "assay",
+    "node_uuid",
+    "node_file_uuid",
+    "node_type",
+    "node_name",
+    "attribute_type",
+    "attribute_subtype",
+    "attribute_value",
+    "attribute_value_unit",
+    "is_annotation"
+]
 
 
 # for an assay declaration (= assay file in a study)
@@ -91,28 +114,92 @@ def _get_node_types_recursion(node):
     return sequence
 
 
-def _get_unique_parent_attributes(nodes, node_id):
-    """Recursively collects attributes from the current node and each parent
-    node until no more parents are available and make sure that the final list
-    of attributes is unique.
-    """
-    attributes = {}
+def _get_inherited_attribute_ids(nodes):
+    """Returns a dict mapping the id of every node in `nodes` to the frozenset
+    of ids of its own attributes and the attributes of all its ancestors.
 
-    if len(nodes[node_id]["parents"]) == 0:
-        for attr in nodes[node_id]["attributes"]:
-            attributes[attr[0]] = attr
+    Nodes are resolved once each in topological order (parents before
+    children), so shared ancestor chains are only computed once. Nodes that
+    do not add attributes of their own share the set of their parent.
+    Parents that are not part of `nodes` are ignored.
+    """
+    inherited = {}
+    in_progress = set()
+
+    for start_id in nodes:
+        stack = [start_id]
+        while stack:
+            node_id = stack[-1]
+            if node_id in inherited:
+                stack.pop()
+                continue
+
+            parent_ids = [
+                parent_id for parent_id in nodes[node_id]["parents"]
+                if parent_id in nodes
+            ]
+            if node_id not in in_progress:
+                # resolve all parents first; parents that are in progress
+                # already close a cycle and are skipped
+                in_progress.add(node_id)
+                stack.extend(
+                    parent_id for parent_id in parent_ids
+                    if parent_id not in inherited and
+                    parent_id not in in_progress
+                )
+                continue
 
-        return attributes
+            stack.pop()
+            in_progress.remove(node_id)
+            own_ids = frozenset(
+                attribute[0] for attribute in nodes[node_id]["attributes"]
+            )
+            parent_sets = [
+                inherited[parent_id] for parent_id in parent_ids
+                if parent_id in inherited
+            ]
+            if len(parent_sets) == 1 and own_ids <= parent_sets[0]:
+                inherited[node_id] = parent_sets[0]
+            else:
+                inherited[node_id] = own_ids.union(*parent_sets)
 
-    for parent_id in nodes[node_id]["parents"]:
-        attributes.update(_get_unique_parent_attributes(nodes, parent_id))
+    return inherited
 
-    for attr in nodes[node_id]["attributes"]:
-        attributes[attr[0]] = attr
 
+def _get_attributes_by_id(nodes):
+    """Returns a dict mapping attribute ids to the attribute tuples of all
+    nodes in `nodes`
+    """
+    attributes = {}
+    for node in nodes.itervalues():
+        for attribute in node["attributes"]:
+            attributes[attribute[0]] = attribute
     return attributes
 
 
+def _iterate_in_batches(queryset, fields, batch_size=None):
+    """Yields `fields` value tuples of `queryset` one batch at a time.
+    Batches are fetched with keyset pagination on the primary key (which has
+    to be the first item of `fields`) so that at most `batch_size` rows are
+    held in memory, no matter how large the result set is.
+    """
+    if batch_size is None:
+        batch_size = NODE_GRAPH_BATCH_SIZE
+
+    queryset = queryset.order_by("id").values_list(*fields)
+    last_id = None
+    while True:
+        if last_id is None:
+            batch = list(queryset[:batch_size])
+        else:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        for row in batch:
+            yield row
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1][0]
+
+
 def _retrieve_nodes(
         study_uuid,
         assay_uuid=None,
@@ -122,17 +209,12 @@ def _retrieve_nodes(
     assay.
 
     If `node_uuids` is `None` query nodes (both from assay and from study only)
-    """
-    node_fields = [
-        "id",
-        "uuid",
-        "file_uuid",
-        "type",
-        "name",
-        "parents",
-        "attribute"
-    ]
 
+    Only the parent links and attributes of the retrieved nodes are loaded
+    (in batches) so that memory use scales with the size of the study/assay
+    rather than with the size of the database. Parent ids are kept in compact
+    integer arrays.
+    """
     # Build filters
     filters = {}
     q_filters = []
@@ -147,123 +229,314 @@ def _retrieve_nodes(
             )
         q_filters.append(q_filters_1)
 
-    # Query for notes
-    node_list = (
-        Node.objects
-            .filter(*q_filters, **filters)
-            .prefetch_related("attribute_set")
-            .order_by("id", "attribute")
-            .values(*node_fields)
-    )
+    node_query = Node.objects.filter(*q_filters, **filters)
+    node_ids = node_query.values("id")
 
     if ontology_attribute_fields:
         attribute_fields = Attribute.ALL_FIELDS
     else:
         attribute_fields = Attribute.NON_ONTOLOGY_FIELDS
 
-    attribute_list = (
-        Attribute.objects
-                 .filter()
-                 .order_by("id")
-                 .values_list(*attribute_fields)
+    nodes = {}
+
+    for node_id, uuid, file_uuid, node_type, name in _iterate_in_batches(
+            node_query, ["id", "uuid", "file_uuid", "type", "name"]):
+        nodes[node_id] = {
+            "id": node_id,
+            "uuid": uuid,
+            "attributes": [],
+            "parents": array.array("l"),
+            "name": name,
+            "type": node_type,
+            "file_uuid": file_uuid
+        }
+
+    parent_links = Node.parents.through.objects.filter(
+        from_node__in=node_ids
     )
+    # nodes created after the first pass (e.g. by a running analysis) are
+    # ignored
+    for link_id, node_id, parent_id in _iterate_in_batches(
+            parent_links, ["id", "from_node", "to_node"]):
+        if node_id in nodes and parent_id not in nodes[node_id]["parents"]:
+            nodes[node_id]["parents"].append(parent_id)
+
+    node_attribute_index = attribute_fields.index("node")
+    for attribute in _iterate_in_batches(
+            Attribute.objects.filter(node__in=node_ids), attribute_fields):
+        node_id = attribute[node_attribute_index]
+        if node_id in nodes:
+            nodes[node_id]["attributes"].append(attribute)
 
-    attributes = {}
-    current_id = None
-    current_node = None
-    nodes = {}
+    return nodes
 
-    for attribute in attribute_list:
-        attributes[attribute[0]] = attribute
-
-    for node in node_list:
-        if current_id is None or current_id != node["id"]:
-            # save current node
-            if current_node is not None:
-                current_node["parents"] = uniquify(current_node["parents"])
-                nodes[current_id] = current_node
-
-            # new node, start merging
-            current_id = node["id"]
-            current_node = {
-                "id": node["id"],
-                "uuid": node["uuid"],
-                "attributes": [],
-                "parents": [],
-                "name": node["name"],
-                "type": node["type"],
-                "file_uuid": node["file_uuid"]
-            }
 
-        # Fritz: Do the parents really differ or is this overhead?
-        if node["parents"] is not None:
-            current_node["parents"].append(node["parents"])
+def _get_annotated_node_rows(nodes, node_ids, study, assay,
+                             inherited_attribute_ids, attributes):
+    """Yields one tuple of ANNOTATED_NODE_FIELDS values for each attribute
+    inherited by each of the nodes with the given ids (in the order of
+    `node_ids` and by attribute id)
+    """
+    assay_id = None if assay is None else assay.id
+    for node_id in node_ids:
+        node = nodes[node_id]
+        for attribute_id in sorted(inherited_attribute_ids[node_id]):
+            attribute = attributes[attribute_id]
+            yield (
+                node_id,
+                attribute_id,
+                study.id,
+                assay_id,
+                node["uuid"],
+                node["file_uuid"],
+                node["type"],
+                node["name"],
+                attribute[1],  # type
+                attribute[2],  # subtype
+                attribute[3],  # value
+                attribute[4],  # value_unit
+                False  # is_annotation
+            )
 
-        if node["attribute"] is not None:
-            try:
-                current_node["attributes"].append(
-                    attributes[node["attribute"]]
-                )
-            except:
-                pass
 
-    # save last node
-    if current_node is not None:
-        current_node["parents"] = uniquify(current_node["parents"])
-        nodes[current_id] = current_node
+def _format_copy_value(value):
+    """Renders a value in PostgreSQL COPY text format"""
+    if value is None:
+        return u"\\N"
+    if isinstance(value, bool):
+        return u"t" if value else u"f"
+    return (
+        unicode(value)
+        .replace(u"\\", u"\\\\")
+        .replace(u"\t", u"\\t")
+        .replace(u"\n", u"\\n")
+        .replace(u"\r", u"\\r")
+    )
 
-    return nodes
+
+def _format_copy_row(row):
+    """Renders a row as a UTF-8 encoded line in PostgreSQL COPY text format"""
+    return (
+        u"\t".join(_format_copy_value(value) for value in row) + u"\n"
+    ).encode("utf-8")
 
 
-def _create_annotated_node_objs(
-        bulk_list=[],
-        node=None,
-        study=None,
-        assay=None,
-        attrs=None):
-    """Helper method to bulk create annotated nodes.
+def _get_annotated_node_rows_hash(rows):
+    """Returns a hash of the content of AnnotatedNode rows (which depends on
+    the order of the rows)
     """
-    counter = 0
-    if (node is not None and
-            study is not None and
-            assay is not None and
-            attrs is not None):
-        for attr_key in attrs:
-            counter += 1
-            bulk_list.append(
-                AnnotatedNode(
-                    node_id=node["id"],
-                    attribute_id=attrs[attr_key][0],
-                    study=study,
-                    assay=assay,
-                    node_uuid=node["uuid"],
-                    node_file_uuid=node["file_uuid"],
-                    node_type=node["type"],
-                    node_name=node["name"],
-                    attribute_type=attrs[attr_key][1],
-                    attribute_subtype=attrs[attr_key][2],
-                    attribute_value=attrs[attr_key][3],
-                    attribute_value_unit=attrs[attr_key][4]
-                )
-            )
+    hasher = hashlib.sha1()
+    for row in _hash_annotated_node_rows(rows, hasher):
+        pass
+    return hasher.hexdigest()
+
+
+def _hash_annotated_node_rows(rows, hasher):
+    """Yields rows while adding them to a hash (see
+    _get_annotated_node_rows_hash())
+    """
+    for row in rows:
+        hasher.update(_format_copy_row(row))
+        yield row
+
+
+class _CopyRowStream(object):
+    """File-like object that renders rows in PostgreSQL COPY text format
+    while they are read, so rows can be streamed to the database without
+    building the whole payload in memory
+    :param hasher: optional hash object that is updated with all rows (see
+    _get_annotated_node_rows_hash())
+    """
+    def __init__(self, rows, hasher=None):
+        self.rows = iter(rows)
+        self.hasher = hasher
+        self.row_count = 0
+        self.buffer = ""
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            line = _format_copy_row(row)
+            if self.hasher is not None:
+                self.hasher.update(line)
+            chunks.append(line)
+            length += len(line)
+            self.row_count += 1
+        data = "".join(chunks)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def _copy_annotated_nodes(rows, hasher=None):
+    """Streams rows into the AnnotatedNode table using COPY (PostgreSQL only)
+    :returns: number of rows inserted
+    """
+    columns = ", ".join(
+        AnnotatedNode._meta.get_field(field).column
+        for field in ANNOTATED_NODE_FIELDS
+    )
+    stream = _CopyRowStream(rows, hasher)
+    cursor = connection.cursor()
+    cursor.copy_expert(
+        "COPY {} ({}) FROM STDIN".format(AnnotatedNode._meta.db_table,
+                                         columns),
+        stream
+    )
+    return stream.row_count
 
-            if len(bulk_list) == MAX_BULK_LIST_SIZE:
-                AnnotatedNode.objects.bulk_create(bulk_list)
-                # Reset list
-                bulk_list = []
 
-    elif len(bulk_list) > 0:
-        # Create remaining annotated nodes
+def _bulk_create_annotated_nodes(rows):
+    """Inserts rows into the AnnotatedNode table using the ORM in batches of
+    MAX_BULK_LIST_SIZE objects
+    :returns: number of rows inserted
+    """
+    field_names = [
+        AnnotatedNode._meta.get_field(field).attname
+        for field in ANNOTATED_NODE_FIELDS
+    ]
+    counter = 0
+    bulk_list = []
+    for row in rows:
+        bulk_list.append(AnnotatedNode(**dict(zip(field_names, row))))
+        counter += 1
+        if len(bulk_list) == MAX_BULK_LIST_SIZE:
+            AnnotatedNode.objects.bulk_create(bulk_list)
+            bulk_list = []
+    if len(bulk_list) > 0:
         AnnotatedNode.objects.bulk_create(bulk_list)
+    return counter
+
+
+def _insert_annotated_nodes(rows, hasher=None):
+    """Inserts AnnotatedNode rows using COPY on PostgreSQL and bulk_create()
+    on other database backends
+    :param rows: iterable of tuples of ANNOTATED_NODE_FIELDS values
+    :param hasher: optional hash object that is updated with all rows while
+    they are inserted (see _get_annotated_node_rows_hash())
+    :returns: number of rows inserted
+    """
+    if connection.vendor == "postgresql":
+        return _copy_annotated_nodes(rows, hasher)
+    if hasher is not None:
+        rows = _hash_annotated_node_rows(rows, hasher)
+    return _bulk_create_annotated_nodes(rows)
+
+
+def _get_annotated_node_query(node_type, study, assay=None):
+    """Returns the AnnotatedNodes of the given type in a study (including the
+    study-level ones if an assay is given)
+    """
+    if assay is None:
+        return AnnotatedNode.objects.filter(
+            study=study, assay__isnull=True, node_type=node_type
+        )
+    return AnnotatedNode.objects.filter(
+        Q(assay__isnull=True) | Q(assay=assay),
+        study=study, node_type=node_type
+    )
+
+
+def _delete_annotated_nodes(queryset):
+    """Deletes AnnotatedNodes with a single DELETE statement on PostgreSQL,
+    without going through the ORM delete collector and its signals
+    """
+    if connection.vendor != "postgresql":
+        queryset.delete()
+        return
+    sql, params = queryset.values("id").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {} WHERE id IN ({})".format(
+                AnnotatedNode._meta.db_table, sql
+            ),
+            params
+        )
 
-    return bulk_list, counter
+
+def _sync_annotated_nodes(get_rows, node_ids, node_type, study, assay=None):
+    """Makes the AnnotatedNodes of the given type in a study/assay match the
+    rows of the given nodes by deleting the existing rows that are not part of
+    them and inserting only the rows that do not exist yet.
+    Rows are compared by (node, attribute) key for a batch of
+    ANNOTATED_NODE_SYNC_BATCH_SIZE nodes at a time, so that only the keys of
+    changed rows and the ids of stale rows are kept in memory.
+    :param get_rows: function that returns an iterable of tuples of
+    ANNOTATED_NODE_FIELDS values for a list of node ids (ordered by node and
+    attribute id)
+    :param node_ids: sorted list of the ids of the nodes
+    :returns: tuple of the numbers of inserted and deleted rows
+    """
+    field_names = [
+        AnnotatedNode._meta.get_field(field).attname
+        for field in ANNOTATED_NODE_FIELDS
+    ]
+    existing_rows = _get_annotated_node_query(node_type, study, assay)
+
+    # rows of nodes that are no longer of the given type
+    node_id_set = set(node_ids)
+    stale_ids = [
+        row_id for row_id, node_id in _iterate_in_batches(existing_rows,
+                                                          ["id", "node"])
+        if node_id not in node_id_set
+    ]
+    new_keys = set()
+    for index in range(0, len(node_ids), ANNOTATED_NODE_SYNC_BATCH_SIZE):
+        batch_node_ids = node_ids[index:index + ANNOTATED_NODE_SYNC_BATCH_SIZE]
+        # ids and content of the existing rows by (node, attribute) key
+        # (duplicate rows are possible)
+        existing = {}
+        for values in existing_rows.filter(
+                node__in=batch_node_ids
+        ).values_list("id", *field_names):
+            existing.setdefault(values[1:3], []).append(
+                (values[0], values[1:])
+            )
+        for row in get_rows(batch_node_ids):
+            key = row[:2]
+            matches = existing.pop(key, [])
+            unchanged = [row_id for row_id, values in matches
+                         if values == row][:1]
+            if not unchanged:
+                new_keys.add(key)
+            stale_ids.extend(row_id for row_id, values in matches
+                             if row_id not in unchanged)
+        for matches in existing.itervalues():
+            stale_ids.extend(row_id for row_id, values in matches)
+
+    for index in range(0, len(stale_ids), MAX_BULK_LIST_SIZE):
+        _delete_annotated_nodes(AnnotatedNode.objects.filter(
+            id__in=stale_ids[index:index + MAX_BULK_LIST_SIZE]
+        ))
+
+    inserted = 0
+    if new_keys:
+        inserted = _insert_annotated_nodes(
+            row for row in get_rows(node_ids) if row[:2] in new_keys
+        )
+    return inserted, len(stale_ids)
 
 
 def update_annotated_nodes(
         node_type,
         study_uuid,
         assay_uuid=None,
-        update=False):
+        update=False,
+        incremental=False):
+    """Creates the AnnotatedNodes of the given type in a study/assay.
+
+    If `update` is True existing AnnotatedNodes are rebuilt. If `incremental`
+    is True only the rows that changed are inserted or deleted, and nothing is
+    written at all if the content hash recorded in the AnnotatedNodeRegistry
+    is unchanged.
+    """
     # Retrieve first study and assay ids
     study = Study.objects.get(uuid=study_uuid)
 
@@ -287,26 +560,16 @@ def update_annotated_nodes(
         # registry entry exists and no updating requested
         return
 
-    # Remove existing annotated node objects for this node_type in this
-    # study/assay
-    if assay_uuid is None:
-        AnnotatedNode.objects.filter(
-            Q(study__uuid=study_uuid, assay__uuid__isnull=True),
-            node_type=node_type).delete()
-    else:
-        AnnotatedNode.objects.filter(
-            Q(study__uuid=study_uuid, assay__uuid__isnull=True) |
-            Q(study__uuid=study_uuid, assay__uuid=assay_uuid),
-            node_type=node_type).delete()
-
     # Retrieve _all_ annotated nodes associated to the given study and assay
     nodes = _retrieve_nodes(study_uuid, assay_uuid, True)
 
     # Start timer
     start = time.time()
 
-    # Holds AnnotatedNodes objects for bulk db entry creation
-    bulk_list = []
+    # Attributes inherited by each node, shared by the counting and the
+    # creation pass below
+    inherited_attribute_ids = _get_inherited_attribute_ids(nodes)
+    attributes = _get_attributes_by_id(nodes)
 
     # Total number of associated nodes of the given node type.
     num_nodes_of_type = 0
@@ -325,9 +588,7 @@ def update_annotated_nodes(
         )
         if node["type"] == node_type:
             num_nodes_of_type += 1
-            attrs = _get_unique_parent_attributes(nodes, node_id)
-            u_len = len(attrs)
-            total_attrs += u_len
+            total_attrs += len(inherited_attribute_ids[node_id])
     if total_attrs == total_unique_attrs * num_nodes_of_type \
             and len([
                 n for n in nodes.values() if n['type'] == 'Sample Name'
@@ -341,23 +602,47 @@ def update_annotated_nodes(
 
         logger.error(error_message)
 
-    for node_id, node in nodes.iteritems():
-        if node["type"] == node_type:
-            bulk_list, counter = _create_annotated_node_objs(
-                bulk_list,
-                node,
-                study,
-                assay,
-                _get_unique_parent_attributes(nodes, node_id)
+    node_ids = sorted(
+        node_id for node_id, node in nodes.iteritems()
+        if node["type"] == node_type
+    )
+
+    def get_rows(row_node_ids=node_ids):
+        return _get_annotated_node_rows(nodes, row_node_ids, study, assay,
+                                        inherited_attribute_ids, attributes)
+
+    if incremental:
+        content_hash = _get_annotated_node_rows_hash(get_rows())
+        if not created and content_hash == registry.content_hash:
+            logger.info(
+                "Annotated nodes of type %s are up to date, skipping",
+                node_type
             )
+            return
 
-    _create_annotated_node_objs(bulk_list)
+    with transaction.atomic():
+        if incremental:
+            counter, deleted = _sync_annotated_nodes(get_rows, node_ids,
+                                                     node_type, study, assay)
+        else:
+            # Replace existing annotated node objects for this node_type in
+            # this study/assay, hashing the rows while they are inserted
+            _delete_annotated_nodes(
+                _get_annotated_node_query(node_type, study, assay)
+            )
+            hasher = hashlib.sha1()
+            counter = _insert_annotated_nodes(get_rows(), hasher)
+            content_hash = hasher.hexdigest()
+            deleted = None
+        registry.content_hash = content_hash
+        registry.save()
 
     end = time.time()
 
     logger.info(
-        "Created %s annotated nodes from %s nodes in %s msec",
-        str(total_attrs),
+        "Created %s annotated nodes (deleted %s) from %s nodes in %s msec",
+        str(counter),
+        "all" if deleted is None else str(deleted),
         str(len(nodes)),
         str(end - start)
     )
@@ -415,25 +700,21 @@ def _add_annotated_nodes(
     # Insert node and attribute information
     start = time.time()
 
-    counter = 0
-    bulk_list = []
-
-    for node_id, node in nodes.iteritems():
-        if node["type"] == node_type:
-            if node["uuid"] in node_uuids:
-                bulk_list, num_created = _create_annotated_node_objs(
-                    bulk_list,
-                    node,
-                    study,
-                    assay,
-                    _get_unique_parent_attributes(nodes, node_id)
-                )
-                counter += num_created
-
-    _create_annotated_node_objs(bulk_list)
+    inherited_attribute_ids = _get_inherited_attribute_ids(nodes)
+    attributes = _get_attributes_by_id(nodes)
 
-    if len(bulk_list) > 0:
-        AnnotatedNode.objects.bulk_create(bulk_list)
+    node_ids = [
+        node_id for node_id, node in nodes.iteritems()
+        if node["type"] == node_type and node["uuid"] in node_uuids
+    ]
+    counter = _insert_annotated_nodes(
+        _get_annotated_node_rows(nodes, node_ids, study, assay,
+                                 inherited_attribute_ids, attributes)
+    )
+    # the recorded content no longer matches the AnnotatedNodes
+    AnnotatedNodeRegistry.objects.filter(
+        study=study, assay=assay, node_type=node_type
+    ).update(content_hash=None)
 
     end = time.time()
 
@@ -470,14 +751,97 @@ def _index_annotated_nodes(node_type, study_uuid, assay_uuid=None,
     logger.info("%s nodes for indexing", str(nodes.count()))
     # index nodes
     start = time.time()
-    counter = 0
-    for node in nodes:
-        node.update_solr_index()
-        counter += 1
+    counter = index_nodes_in_batches(nodes)
     end = time.time()
     logger.info("%s nodes indexed in %s", str(counter), str(end - start))
 
 
+def _prepare_node_documents(node_ids):
+    """Returns the Solr documents of the Nodes with the given ids, skipping
+    Nodes that are not indexed
+    """
+    # SearchIndex.full_prepare() keeps state on the index instance
+    return NodeIndex().full_prepare_nodes(list(
+        Node.objects.filter(id__in=node_ids).select_related("study", "assay")
+    ))
+
+
+def _prepare_node_documents_in_thread(node_ids):
+    try:
+        return _prepare_node_documents(node_ids)
+    finally:
+        # database connections are opened per thread
+        connections.close_all()
+
+
+def index_nodes_in_batches(nodes, batch_size=None, threads=None):
+    """Indexes Nodes in Solr with one update request per batch of Nodes and a
+    single commit at the end (instead of one request and commit per Node)
+    :param nodes: Node QuerySet
+    :param batch_size: number of documents per update request, defaults to
+    settings.REFINERY_SOLR_INDEXING_BATCH_SIZE
+    :param threads: number of threads used to prepare batches concurrently,
+    defaults to settings.REFINERY_SOLR_INDEXING_THREADS (no threads if 0)
+    :returns: number of documents sent to Solr
+    """
+    if batch_size is None:
+        batch_size = settings.REFINERY_SOLR_INDEXING_BATCH_SIZE
+    if threads is None:
+        threads = settings.REFINERY_SOLR_INDEXING_THREADS
+
+    node_ids = list(nodes.order_by("id").values_list("id", flat=True))
+    batches = [
+        node_ids[index:index + batch_size]
+        for index in range(0, len(node_ids), batch_size)
+    ]
+
+    backend = haystack.connections["data_set_manager"].get_backend()
+    field_weights = NodeIndex().get_field_weights()
+
+    pool = None
+    if threads > 0 and len(batches) > 1:
+        pool = ThreadPool(threads)
+        document_batches = pool.imap(_prepare_node_documents_in_thread,
+                                     batches)
+    else:
+        document_batches = (
+            _prepare_node_documents(batch) for batch in batches
+        )
+
+    counter = 0
+    try:
+        for documents in document_batches:
+            if not documents:
+                continue
+            try:
+                backend.conn.add(documents, commit=False,
+                                 boost=field_weights)
+            except (IOError, SolrError) as exc:
+                if not backend.silently_fail:
+                    raise
+                logger.error("Failed to add %s Node documents to Solr: %s",
+                             len(documents), exc)
+            else:
+                counter += len(documents)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    try:
+        backend.conn.commit()
+    except (IOError, SolrError) as exc:
+        if not backend.silently_fail:
+            raise
+        logger.error("Failed to commit Node documents to Solr: %s", exc)
+
+    for assay_uuid in nodes.exclude(assay=None).values_list(
+            "assay__uuid", flat=True).distinct():
+        invalidate_assay_files_cache(assay_uuid)
+
+    return counter
+
+
 def generate_solr_params_for_assay(params, assay_uuid, exclude_facets=[]):
     """Creates the encoded solr params requiring only an assay.
     Keyword Argument
@@ -493,6 +857,25 @@ def generate_solr_params_for_assay(params, assay_uuid, exclude_facets=[]):
     return generate_solr_params(params, [assay_uuid], False, exclude_facets)
 
 
+def get_assay_files_cache_key(assay_uuid, params, permission):
+    """Returns the cache key of an AssaysFiles response or None if responses
+    for the assay can't be cached
+    :param assay_uuid: uuid of the assay
+    :param params: QueryDict of the request
+    :param permission: 'read' or 'read_meta' (responses differ in the fields
+    they expose)
+    """
+    version = get_assay_files_cache_version(assay_uuid)
+    if version is None:
+        return None
+    # the order of different parameters does not change the response
+    normalized_params = json.dumps(sorted(params.lists()))
+    return "assay-files-{}-{}-{}-{}".format(
+        assay_uuid, version, permission,
+        hashlib.md5(normalized_params).hexdigest()
+    )
+
+
 def generate_solr_params(
         params,
         assay_uuids,
@@ -520,7 +903,7 @@ def generate_solr_params(
 
     if len(assay_uuids) == 0:
         return None
-    filter_arr = ['assay_uuid:({})'.format(' OR '.join(assay_uuids))]
+    filter_arr = [create_uuid_query('assay_uuid', assay_uuids)]
 
     field_limit = []  # limit attributes to return
     facet_fields_obj = {}  # requested facets formatted for solr
@@ -610,6 +993,35 @@ def cull_attributes_from_list(attribute_list, attribute_names_to_remove):
     return culled_attributes
 
 
+def create_terms_query(field, values):
+    """Returns a query for documents with any of the values in an untokenized
+    field (unlike OR queries not limited by maxBooleanClauses and cheap to
+    parse for many values)
+    """
+    return '{{!terms f={}}}{}'.format(field, ','.join(values))
+
+
+def create_uuid_query(field, uuids):
+    """Returns a query for documents with any of the UUIDs in a field
+    Terms queries use the untokenized <field>_exact copy field, which is only
+    populated after the data_set_manager core was reindexed, so OR queries on
+    the field itself are used until REFINERY_SOLR_EXACT_UUID_FIELDS is set.
+    OR queries are split into groups of REFINERY_SOLR_TERMS_CHUNK_SIZE UUIDs
+    to stay below Solr's maxBooleanClauses limit, which applies to each group.
+    """
+    if settings.REFINERY_SOLR_EXACT_UUID_FIELDS:
+        return create_terms_query(field + '_exact', uuids)
+    uuids = list(uuids)
+    chunk_size = settings.REFINERY_SOLR_TERMS_CHUNK_SIZE
+    queries = [
+        '{}:({})'.format(field, ' OR '.join(uuids[index:index + chunk_size]))
+        for index in range(0, max(len(uuids), 1), chunk_size)
+    ]
+    if len(queries) == 1:
+        return queries[0]
+    return '({})'.format(' OR '.join(queries))
+
+
 def create_facet_filter_query(facet_filter_fields):
     # Creates the solr request for the attribute filters
     filter_list = []
@@ -695,11 +1107,10 @@ def search_solr(encoded_params, core):
         encoded_params:  Expect the params to be url-ready (using urlquote)
         core: Specify which node
     """
-    url_portion = '/'.join([core, "select"])
-    url = urlparse.urljoin(settings.REFINERY_SOLR_BASE_URL, url_portion)
-    full_response = requests.post(url,
-                                  json=encoded_params.get('json'),
-                                  params=encoded_params.get('params'))
+    full_response = get_solr_client(core).post(
+        json=encoded_params.get('json'),
+        params=encoded_params.get('params')
+    )
     if not full_response.ok:
         try:
             response_obj = json.loads(full_response.content)
@@ -722,6 +1133,70 @@ def search_solr(encoded_params, core):
     return response
 
 
+def iterate_solr_docs(solr_params, core, page_size=None):
+    """Yields all documents matching a query one cursor page at a time (Solr
+    deep paging with cursorMark), ignoring offset/limit and facets
+    :param solr_params: dict with 'json' and 'params', e.g. created by
+    generate_solr_params()
+    :param core: name of the Solr core
+    :param page_size: number of documents per request, defaults to
+    settings.REFINERY_SOLR_CURSOR_PAGE_SIZE
+    """
+    if page_size is None:
+        page_size = settings.REFINERY_SOLR_CURSOR_PAGE_SIZE
+    json_params = dict(solr_params.get('json', {}))
+    json_params.pop('facet', None)
+    params = dict(solr_params.get('params', {}))
+    params.pop('start', None)
+    params['rows'] = page_size
+    # cursors require the unique key as a tie breaker in the sort
+    sort = params.get('sort')
+    if not sort:
+        params['sort'] = 'id asc'
+    elif 'id' not in [field.split()[0] for field in sort.split(',')
+                      if field.strip()]:
+        params['sort'] = '{}, id asc'.format(sort)
+
+    cursor_mark = '*'
+    while True:
+        params['cursorMark'] = cursor_mark
+        response = json.loads(
+            search_solr({'json': json_params, 'params': params}, core)
+        )
+        docs = response['response']['docs']
+        for doc in docs:
+            yield doc
+        next_cursor_mark = response.get('nextCursorMark')
+        if not docs or next_cursor_mark in (None, cursor_mark):
+            return
+        cursor_mark = next_cursor_mark
+
+
+class _Echo(object):
+    """File-like object that returns what is written to it instead of
+    buffering it (for streaming csv.writer output)
+    """
+    def write(self, value):
+        return value
+
+
+# file_format: (delimiter, content type, file extension)
+EXPORT_FORMATS = {
+    'csv': (',', 'text/csv', 'csv'),
+    'tsv': ('\t', 'text/tab-separated-values', 'tsv')
+}
+
+
+def stream_delimited_rows(header, rows, delimiter=','):
+    """Yields header and rows one formatted line at a time, so that they can
+    be written to a StreamingHttpResponse as they are produced
+    """
+    writer = csv.writer(_Echo(), delimiter=delimiter)
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
 def get_owner_from_assay(uuid):
     # Returns the owner from an assay_uuid. Ownership is passed from dataset
 
@@ -966,6 +1441,47 @@ def get_file_url_from_node_uuid(node_uuid, require_valid_url=False):
         return core.utils.get_absolute_url(url) if url else None
 
 
+def remove_empty_columns(header, rows):
+    """Removes empty columns from the header of an ISA-Tab file and the
+    corresponding columns at the end of its rows without rewriting the file
+    :param header: list of column headers
+    :param rows: iterable of rows (lists of fields)
+    :returns: tuple of the fixed header and a generator of the fixed rows that
+    raises ValueError for rows that can't be fixed
+    """
+    num_empty_cols = 0  # number of empty header columns
+    # TODO: throw exception if there is an empty field in the header between
+    # two non-empty fields
+    for item in header:
+        if not item.strip():
+            num_empty_cols += 1
+    if num_empty_cols == 0:
+        return header, iter(rows)
+    logger.info("Empty columns in header present, attempting to fix...")
+    return header[:-num_empty_cols], _remove_empty_row_columns(
+        rows, len(header), num_empty_cols
+    )
+
+
+def _remove_empty_row_columns(rows, header_length, num_empty_cols):
+    # check that all the rows are the same length
+    for line, row in enumerate(rows, 1):
+        if len(row) < header_length - num_empty_cols:
+            raise ValueError(
+                "Line " + str(line) + " in the file had fewer fields than "
+                "the header.")
+        # check that all the end columns that are supposed to be empty are
+        if len(row) > header_length - num_empty_cols:
+            for check_item in row[-num_empty_cols:]:
+                if check_item.strip():  # item not empty
+                    raise ValueError(
+                        "Found a value in " + str(line) +
+                        " where an empty column was expected.")
+            yield row[:-num_empty_cols]
+        else:
+            yield row
+
+
 def fix_last_column(file):
     """If the header has empty columns in it, then it will delete this and
     corresponding columns in the rows; returns 0 or 1 based on whether it
@@ -975,50 +1491,44 @@ def fix_last_column(file):
     """
     # TODO: exception handling for file operations (IOError)
     logger.info("trying to fix the last column if necessary")
-    # FIXME: use context manager to handle file opening and closing
-    reader = csv.reader(open(file, 'rU'), dialect='excel-tab')
-    tempfilename = tempfile.NamedTemporaryFile().name
-    writer = csv.writer(open(tempfilename, 'wb'), dialect='excel-tab')
-    # check that all rows have the same length
-    header = reader.next()
-    header_length = len(header)
-    num_empty_cols = 0  # number of empty header columns
-    # TODO: throw exception if there is an empty field in the header between
-    # two non-empty fields
-    for item in header:
-        if not item.strip():
-            num_empty_cols += 1
-    # write the file
-    writer.writerow(header[:-num_empty_cols])
-    if num_empty_cols > 0:  # if there are empty header columns
-        logger.info("Empty columns in header present, attempting to fix...")
-        # check that all the rows are the same length
-        line = 0
-        for row in reader:
-            line += 1
-            if len(row) < header_length - num_empty_cols:
-                logger.error(
-                    "Line " + str(line) + " in the file had fewer fields than "
-                    "the header.")
+    with open(file, 'rU') as isa_tab_file:
+        reader = csv.reader(isa_tab_file, dialect='excel-tab')
+        header = reader.next()
+        fixed_header, rows = remove_empty_columns(header, reader)
+        if len(fixed_header) == len(header):
+            return True
+        tempfilename = tempfile.NamedTemporaryFile().name
+        with open(tempfilename, 'wb') as temp_file:
+            writer = csv.writer(temp_file, dialect='excel-tab')
+            writer.writerow(fixed_header)
+            try:
+                writer.writerows(rows)
+            except ValueError as exc:
+                logger.error(exc)
                 return False
-            # check that all the end columns that are supposed to be empty are
-            i = 0
-            if len(row) > len(header) - num_empty_cols:
-                while i < num_empty_cols:
-                    i += 1
-                    check_item = row[-i].strip()
-                    if check_item:  # item not empty
-                        logger.error(
-                            "Found a value in " + str(line) +
-                            " where an empty column was expected.")
-                        return False
-                writer.writerow(row[:-num_empty_cols])
-            else:
-                writer.writerow(row)
-        shutil.move(tempfilename, file)
+    shutil.move(tempfilename, file)
     return True
 
 
+def read_isa_tab_table(file_name):
+    """Reads and validates an ISA-Tab study or assay file, removing empty
+    columns on the fly (see fix_last_column())
+    Runs in worker processes when ISA-Tab archives are parsed in parallel, so
+    it must not access the database.
+    :param file_name: name of the study or assay file
+    :returns: tuple of the header and a list of (line number, row) tuples or
+    None if the file can't be fixed
+    """
+    with open(file_name, 'rU') as isa_tab_file:
+        reader = csv.reader(isa_tab_file, dialect='excel-tab')
+        header, rows = remove_empty_columns(reader.next(), reader)
+        try:
+            return header, [(reader.line_num, row) for row in rows]
+        except ValueError as exc:
+            logger.error("%s: %s", file_name, exc)
+            return None
+
+
 def _create_solr_params_from_node_uuids(node_uuids):
     """
     Create and return a dict containing the proper Solr params to query
@@ -1027,22 +1537,45 @@ def _create_solr_params_from_node_uuids(node_uuids):
     return {
         'json': {
             "query": "django_ct:data_set_manager.node",
-            "filter": "uuid:({})".format(" OR ".join(node_uuids)),
+            "filter": create_uuid_query("uuid", node_uuids),
             },
         'params': {
             "wt": "json",
-            "rows": constants.REFINERY_SOLR_DOC_LIMIT
+            "rows": len(node_uuids)
             }
         }
 
 
+def _search_nodes_by_uuid(node_uuids):
+    return format_solr_response(
+        search_solr(_create_solr_params_from_node_uuids(node_uuids),
+                    'data_set_manager')
+    )
+
+
 def get_solr_response_json(node_uuids):
     """
     Fetch the information indexed within Solr for many Nodes and return
     it as JSON
+    Lists longer than settings.REFINERY_SOLR_TERMS_CHUNK_SIZE are requested
+    in chunks in parallel and the responses are merged
     """
-    solr_response = search_solr(
-        _create_solr_params_from_node_uuids(node_uuids),
-        'data_set_manager'
-    )
-    return format_solr_response(solr_response)
+    node_uuids = list(node_uuids)
+    chunk_size = settings.REFINERY_SOLR_TERMS_CHUNK_SIZE
+    if len(node_uuids) <= chunk_size:
+        return _search_nodes_by_uuid(node_uuids)
+
+    chunks = [node_uuids[index:index + chunk_size]
+              for index in range(0, len(node_uuids), chunk_size)]
+    pool = ThreadPool(min(settings.REFINERY_SOLR_TERMS_THREADS, len(chunks)))
+    try:
+        responses = pool.map(_search_nodes_by_uuid, chunks)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    solr_response_json = responses[0]
+    for response in responses[1:]:
+        solr_response_json["nodes"].extend(response["nodes"])
+        solr_response_json["nodes_count"] += response["nodes_count"]
+    return solr_response_json
@@ -13,11 +13,12 @@ import urlparse
 
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
                          HttpResponseForbidden, HttpResponseNotFound,
                          HttpResponseRedirect, HttpResponseServerError,
-                         JsonResponse)
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, render, render_to_response
 from django.template import RequestContext
 from django.views.generic import View
@@ -45,10 +46,11 @@ from .serializers import (AssaySerializer, AttributeOrderSerializer,
 from .single_file_column_parser import process_metadata_table
 from .tasks import parse_isatab
 from .utils import (
-    customize_attribute_response, format_solr_response,
-    generate_solr_params_for_assay, get_owner_from_assay,
-    initialize_attribute_order_ranks, is_field_in_hidden_list, search_solr,
-    update_attribute_order_ranks
+    EXPORT_FORMATS, customize_attribute_response, format_solr_response,
+    generate_solr_params_for_assay, get_assay_files_cache_key,
+    get_owner_from_assay, initialize_attribute_order_ranks,
+    is_field_in_hidden_list, iterate_solr_docs, search_solr,
+    stream_delimited_rows, update_attribute_order_ranks
 )
 
 logger = logging.getLogger(__name__)
@@ -855,24 +857,26 @@ class AssaysFiles(APIView):
         # requires data_set_uuid to check perms
         if data_set_uuid:
             data_set = get_object_or_404(DataSet, uuid=data_set_uuid)
-            public_group = ExtendedGroup.objects.public_group()
-
-            if request.user.has_perm('core.read_dataset', data_set) or \
-                    'read_dataset' in get_perms(public_group, data_set):
-                solr_params = generate_solr_params_for_assay(params, uuid)
-            elif request.user.has_perm('core.read_meta_dataset', data_set) or \
-                    'read_meta_dataset' in get_perms(public_group, data_set):
-                solr_params = generate_solr_params_for_assay(
-                    params,
-                    uuid,
-                    ['REFINERY_DOWNLOAD_URL', 'REFINERY_NAME']
-                )
-            else:
+            permission, solr_params = _get_assay_files_solr_params(
+                request.user, data_set, params, uuid
+            )
+            if permission is None:
                 message = 'User does not have read permissions.'
                 return Response(message, status=status.HTTP_401_UNAUTHORIZED)
 
-            solr_response = search_solr(solr_params, 'data_set_manager')
-            solr_response_json = format_solr_response(solr_response)
+            # responses only change when the assay's nodes are reindexed or
+            # its attribute order is updated (both invalidate the cache)
+            cache_key = get_assay_files_cache_key(uuid, params, permission)
+            solr_response_json = None
+            if cache_key is not None:
+                solr_response_json = cache.get(cache_key)
+
+            if solr_response_json is None:
+                solr_response = search_solr(solr_params, 'data_set_manager')
+                solr_response_json = format_solr_response(solr_response)
+                if cache_key is not None:
+                    cache.set(cache_key, solr_response_json,
+                              settings.REFINERY_ASSAY_FILES_CACHE_TIMEOUT)
 
             return Response(solr_response_json)
         else:
@@ -882,6 +886,109 @@ class AssaysFiles(APIView):
             )
 
 
+class AssaysFilesDownload(APIView):
+    """
+    Return all files of an assay as a CSV or TSV file which is streamed
+    while the files are retrieved from Solr
+
+    ---
+    #YAML
+
+    GET:
+        parameters:
+            - name: uuid
+              description: Assay uuid
+              type: string
+              required: true
+              paramType: path
+            - name: data_set_uuid
+              description: data set uuid required to check for perms
+              type: string
+              required: true
+              paramType: query
+            - name: file_format
+              description: csv (default) or tsv
+              type: string
+              paramType: query
+            - name: filter_attribute
+              description: Filters for attributes fields
+              type: string
+              paramType: query
+            - name: sort
+              description: Order node response with field name asc/desc
+              type: string
+              paramType: query
+    ...
+    """
+
+    def get(self, request, uuid, format=None):
+        params = request.query_params
+        data_set_uuid = params.get('data_set_uuid', None)
+        if not data_set_uuid:
+            return Response(
+                'Requires data set uuid.',
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        file_format = params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                "Unsupported file format '{}'".format(file_format),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data_set = get_object_or_404(DataSet, uuid=data_set_uuid)
+        permission, solr_params = _get_assay_files_solr_params(
+            request.user, data_set, params, uuid
+        )
+        if permission is None:
+            message = 'User does not have read permissions.'
+            return Response(message, status=status.HTTP_401_UNAUTHORIZED)
+
+        fields = solr_params['json']['fields']
+        header = [attribute['display_name'] for attribute
+                  in customize_attribute_response(fields)]
+        rows = (
+            [_format_export_value(doc.get(field)) for field in fields]
+            for doc in iterate_solr_docs(solr_params, 'data_set_manager')
+        )
+
+        delimiter, content_type, extension = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            stream_delimited_rows(header, rows, delimiter),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="{}-files.{}"'.format(uuid, extension)
+        return response
+
+
+def _get_assay_files_solr_params(user, data_set, params, assay_uuid):
+    """Returns the permission tier of the user for the data set ('read',
+    'read_meta' or None) and the Solr params of the assay's files (fields
+    that are hidden from read_meta users are excluded)
+    """
+    public_group = ExtendedGroup.objects.public_group()
+    if user.has_perm('core.read_dataset', data_set) or \
+            'read_dataset' in get_perms(public_group, data_set):
+        return 'read', generate_solr_params_for_assay(params, assay_uuid)
+    if user.has_perm('core.read_meta_dataset', data_set) or \
+            'read_meta_dataset' in get_perms(public_group, data_set):
+        return 'read_meta', generate_solr_params_for_assay(
+            params,
+            assay_uuid,
+            ['REFINERY_DOWNLOAD_URL', 'REFINERY_NAME']
+        )
+    return None, None
+
+
+def _format_export_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = ', '.join(unicode(item) for item in value)
+    return unicode(value).encode('utf-8')
+
+
 class AssaysAttributes(APIView):
     """
     AttributeOrder Resource.
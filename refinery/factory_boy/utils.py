@@ -1,6 +1,7 @@
 import uuid as uuid_builtin
 
-from core.models import INPUT_CONNECTION, OUTPUT_CONNECTION, Analysis
+from core.models import (INPUT_CONNECTION, OUTPUT_CONNECTION, Analysis,
+                         DataSetSummary)
 from data_set_manager.models import Node
 from factory_boy.django_model_factories import (
     AnalysisFactory, AnalysisNodeConnectionFactory, AnalysisResultFactory,
@@ -141,6 +142,9 @@ def create_dataset_with_necessary_models(
         dataset.set_owner(user)
         dataset.save()
 
+    # the nodes are created after the InvestigationLink
+    DataSetSummary.objects.refresh([dataset.id])
+
     return dataset
 
 
@@ -287,6 +291,9 @@ def create_mock_hg_19_data_set(user=None):
         dataset.set_owner(user)
         dataset.save()
 
+    # the nodes are created after the InvestigationLink
+    DataSetSummary.objects.refresh([dataset.id])
+
     return dataset
 
 
@@ -556,6 +563,9 @@ def create_mock_isatab_9909_data_set(user=None):
         dataset.set_owner(user)
         dataset.save()
 
+    # the nodes are created after the InvestigationLink
+    DataSetSummary.objects.refresh([dataset.id])
+
     return dataset
 
 
@@ -4,7 +4,7 @@ from .models import FileExtension, FileStoreItem, FileType
 
 
 class FileStoreItemAdmin(admin.ModelAdmin):
-    readonly_fields = ('import_task_id',)
+    readonly_fields = ('import_task_id', 'size', 'checksum')
 
     list_display = ['id', 'datafile', 'uuid', 'source', 'filetype',
                     'import_task_id', 'created', 'updated']
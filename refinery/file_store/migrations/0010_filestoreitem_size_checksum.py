@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_store', '0009_xls_filetypes_and_fileextensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filestoreitem',
+            name='size',
+            field=models.BigIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='filestoreitem',
+            name='checksum',
+            field=models.CharField(max_length=32, blank=True),
+        ),
+    ]
@@ -12,6 +12,7 @@ FILE_STORE_DIR setting - main file store directory
 import logging
 import os
 import re
+import uuid
 
 from django.conf import settings
 from django.db import models
@@ -24,7 +25,8 @@ from django_extensions.db.fields import UUIDField
 
 import constants
 import core
-from .utils import (S3MediaStorage, SymlinkedFileSystemStorage, copy_s3_object,
+from .utils import (ChecksumFile, FileChecksum, S3MediaStorage,
+                    SymlinkedFileSystemStorage, copy_s3_object,
                     delete_s3_object, make_dir, move_file)
 
 logger = logging.getLogger(__name__)
@@ -111,6 +113,10 @@ class FileStoreItem(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     # Date updated
     updated = models.DateTimeField(auto_now=True)
+    # size in bytes and MD5 checksum of the datafile recorded when it is
+    # imported (size is null and checksum blank if not known)
+    size = models.BigIntegerField(blank=True, null=True)
+    checksum = models.CharField(blank=True, max_length=32)
 
     def __unicode__(self):
         if self.datafile.name:
@@ -124,21 +130,25 @@ class FileStoreItem(models.Model):
         self.source = _map_source(self.source)
 
         if not self.filetype:
-            # set file type using file extension
-            try:
-                extension = self.get_file_extension()
-            except RuntimeError as exc:
-                logger.warn("Could not assign type to file '%s': %s",
-                            self, exc)
-            else:
-                self.filetype = extension.filetype
+            self._set_filetype()
 
         super(FileStoreItem, self).save(*args, **kwargs)
 
+    def _set_filetype(self, file_extensions=None):
+        """Set file type using file extension"""
+        try:
+            extension = self.get_file_extension(file_extensions)
+        except RuntimeError as exc:
+            logger.warn("Could not assign type to file '%s': %s", self, exc)
+        else:
+            self.filetype = extension.filetype
+
     def get_file_size(self):
         """Return the size of the file in bytes or zero if the file is not
         available
         """
+        if self.datafile and self.size is not None:
+            return self.size
         try:
             return self.datafile.size
         except ValueError:  # no datafile
@@ -149,9 +159,23 @@ class FileStoreItem(models.Model):
             logger.critical("Error getting size for '%s': %s", self, exc)
             return 0
 
-    def get_file_extension(self):
-        """Return FileExtension object based on datafile name or source"""
+    def get_file_extension(self, file_extensions=None):
+        """Return FileExtension object based on datafile name or source
+        :param file_extensions: dict of all FileExtension objects by name to
+        look up the extension in instead of the database
+        """
         extension = self.get_extension()
+        if file_extensions is not None:
+            try:
+                return file_extensions[extension]
+            except KeyError:
+                extension = _get_extension_from_string(extension)
+                try:
+                    return file_extensions[extension]
+                except KeyError:
+                    raise RuntimeError(
+                        "Extension '{}' is not valid".format(extension)
+                    )
         try:
             return FileExtension.objects.get(name=extension)
         except FileExtension.DoesNotExist:
@@ -174,11 +198,24 @@ class FileStoreItem(models.Model):
         else:
             return _get_extension_from_string(self.source)
 
+    def save_datafile(self, name, file_object):
+        """Save the contents of a file object as the datafile and record its
+        size and checksum
+        """
+        checksum = FileChecksum()
+        self.datafile.save(name, ChecksumFile(file_object, checksum),
+                           save=False)
+        self.size = checksum.size
+        self.checksum = checksum.hexdigest()
+        self.save()
+
     def delete_datafile(self, save_instance=True):
         """Delete datafile on disk and cancel file import"""
         self.terminate_file_import_task()
         if self.datafile:
             file_name = self.datafile.name
+            self.size = None
+            self.checksum = ''
             try:
                 self.datafile.delete(save=save_instance)
             except (EnvironmentError, botocore.exceptions.ClientError,
@@ -260,20 +297,56 @@ class FileStoreItem(models.Model):
         data file to
         """
         file_store_item.datafile = self.datafile
+        file_store_item.size = self.size
+        file_store_item.checksum = self.checksum
         file_store_item.save()
         # It's crucial to clear the datafile of the prior
         # FileStoreItem as well. Otherwise there would be two
         # references to the same data file which could cause
         # unintended side-effects
         self.datafile = None
+        self.size = None
+        self.checksum = ''
         self.save()
 
 
+def get_total_file_size(file_store_items):
+    """Return the total size in bytes of the datafiles of a FileStoreItem
+    queryset, looking up only the sizes that were not recorded on import
+    """
+    file_store_items = file_store_items.exclude(datafile='')
+    total = file_store_items.aggregate(total=models.Sum('size'))['total'] or 0
+    return total + sum(item.get_file_size() for item in
+                       file_store_items.filter(size__isnull=True))
+
+
 def get_temp_dir():
     """Return the absolute path to the file store temp dir"""
     return settings.FILE_STORE_TEMP_DIR
 
 
+def bulk_create_file_store_items(sources, batch_size=None):
+    """Create FileStoreItems for a list of sources using bulk inserts instead
+    of saving every item individually
+    :param sources: list of file sources (URLs or file system paths)
+    :returns: list of FileStoreItems in the order of sources
+    """
+    file_extensions = dict(
+        (file_extension.name, file_extension) for file_extension in
+        FileExtension.objects.select_related("filetype")
+    )
+    file_store_items = []
+    for source in sources:
+        # UUIDs are assigned up front so that new items can be referenced
+        # without reading them back from the database
+        file_store_item = FileStoreItem(source=_map_source(source),
+                                        uuid=str(uuid.uuid4()))
+        file_store_item._set_filetype(file_extensions)
+        file_store_items.append(file_store_item)
+    FileStoreItem.objects.bulk_create(file_store_items, batch_size=batch_size)
+    return file_store_items
+
+
 # post_delete is safer than pre_delete
 @receiver(post_delete, sender=FileStoreItem)
 def _delete_datafile(sender, instance, **kwargs):
@@ -6,11 +6,12 @@ import urlparse
 
 from django.conf import settings
 
+import botocore
 import celery
 import requests
 
 from .models import FileStoreItem, get_temp_dir
-from .utils import (S3MediaStorage, SymlinkedFileSystemStorage,
+from .utils import (FileChecksum, S3MediaStorage, SymlinkedFileSystemStorage,
                     copy_file_object, copy_s3_object, delete_file,
                     delete_s3_object, download_file_object, download_s3_object,
                     get_file_size, make_dir, move_file, parse_s3_url,
@@ -58,18 +59,19 @@ class FileImportTask(celery.Task):
         try:
             if settings.REFINERY_S3_USER_DATA:
                 if os.path.isabs(item.source):
-                    file_store_name = self.import_path_to_s3(item.source)
+                    import_method = self.import_path_to_s3
                 elif item.source.startswith('s3://'):
-                    file_store_name = self.import_s3_to_s3(item.source)
+                    import_method = self.import_s3_to_s3
                 else:
-                    file_store_name = self.import_url_to_s3(item.source)
+                    import_method = self.import_url_to_s3
             else:
                 if os.path.isabs(item.source):
-                    file_store_name = self.import_path_to_path(item.source)
+                    import_method = self.import_path_to_path
                 elif item.source.startswith('s3://'):
-                    file_store_name = self.import_s3_to_path(item.source)
+                    import_method = self.import_s3_to_path
                 else:
-                    file_store_name = self.import_url_to_path(item.source)
+                    import_method = self.import_url_to_path
+            file_store_name, checksum = import_method(item.source)
         except (RuntimeError, celery.exceptions.SoftTimeLimitExceeded) as exc:
             logger.error("File import failed: %s", exc)
             self.update_state(state=celery.states.FAILURE,
@@ -77,17 +79,35 @@ class FileImportTask(celery.Task):
             raise celery.exceptions.Ignore()
 
         item.datafile.name = file_store_name
+        if checksum is None:
+            # the data file was moved or transferred without passing through
+            # this task, so only its size is looked up
+            item.checksum = ''
+            try:
+                item.size = item.datafile.size
+            except (EnvironmentError, botocore.exceptions.ClientError,
+                    botocore.exceptions.ParamValidationError) as exc:
+                # left empty to be looked up again by get_file_size()
+                logger.error("Error getting size for '%s': %s",
+                             file_store_name, exc)
+                item.size = None
+        else:
+            item.size = checksum.size
+            item.checksum = checksum.hexdigest()
         item.save()
         logger.info("Imported FileStoreItem with UUID '%s'", item_uuid)
 
     def import_path_to_path(self, source_path, symlink=True):
         """Import file from an absolute file system path into
         FILE_STORE_BASE_DIR
+        :returns: file store name and FileChecksum of the file or None if it
+        was moved or symlinked
         """
         storage = SymlinkedFileSystemStorage()
         file_store_name = storage.get_name(os.path.basename(source_path))
         file_store_path = storage.path(file_store_name)
 
+        checksum = None
         if source_path.startswith((settings.REFINERY_DATA_IMPORT_DIR,
                                    get_temp_dir())):
             move_file(source_path, file_store_path)
@@ -96,6 +116,7 @@ class FileImportTask(celery.Task):
                 symlink_file(source_path, file_store_path)
             else:
                 make_dir(os.path.dirname(file_store_path))
+                checksum = FileChecksum()
                 try:
                     with open(source_path, 'rb') as source, \
                             open(file_store_path, 'wb') as destination:
@@ -103,7 +124,7 @@ class FileImportTask(celery.Task):
                             copy_file_object(source, destination,
                                              ProgressPercentage(
                                                  source_path, self.request.id
-                                             ))
+                                             ), checksum)
                         except RuntimeError:
                             delete_file(file_store_path)
                             raise
@@ -112,7 +133,7 @@ class FileImportTask(celery.Task):
                         source_path, file_store_path, exc
                     ))
 
-        return file_store_name
+        return file_store_name, checksum
 
     def import_path_to_s3(self, source_path):
         """Import file from an absolute file system path into MEDIA_BUCKET"""
@@ -131,7 +152,7 @@ class FileImportTask(celery.Task):
         if source_path.startswith(get_temp_dir()):
             delete_file(source_path)
 
-        return file_store_name
+        return file_store_name, None
 
     def import_s3_to_path(self, source_url):
         """Import S3 object from s3:// URL into FILE_STORE_BASE_DIR"""
@@ -153,7 +174,7 @@ class FileImportTask(celery.Task):
         if source_bucket == settings.UPLOAD_BUCKET:
             delete_s3_object(source_bucket, source_key)
 
-        return file_store_name
+        return file_store_name, None
 
     def import_s3_to_s3(self, source_url):
         """Transfer S3 object from UPLOAD_BUCKET to MEDIA_BUCKET"""
@@ -166,7 +187,7 @@ class FileImportTask(celery.Task):
         if source_bucket == settings.UPLOAD_BUCKET:
             delete_s3_object(source_bucket, source_key)
 
-        return file_store_name
+        return file_store_name, None
 
     def import_url_to_path(self, source_url):
         """Import file from URL into FILE_STORE_BASE_DIR"""
@@ -176,11 +197,13 @@ class FileImportTask(celery.Task):
         except requests.exceptions.RequestException as exc:
             raise RuntimeError("Error downloading from '{}': '{}'".format(
                                source_url, exc))
+        checksum = FileChecksum()
         with NamedTemporaryFile(dir=get_temp_dir(), delete=False) as temp_file:
             try:
                 download_file_object(request_response, temp_file,
                                      ProgressPercentage(source_url,
-                                                        self.request.id))
+                                                        self.request.id),
+                                     checksum)
             except RuntimeError:
                 delete_file(temp_file.name)
                 raise
@@ -191,7 +214,7 @@ class FileImportTask(celery.Task):
         file_store_name = storage.get_name(source_file_name)
         move_file(temp_file.name, storage.path(file_store_name))
 
-        return file_store_name
+        return file_store_name, checksum
 
     def import_url_to_s3(self, source_url):
         """Download file from URL and upload to MEDIA_BUCKET"""
@@ -201,11 +224,12 @@ class FileImportTask(celery.Task):
         except requests.exceptions.RequestException as exc:
             raise RuntimeError("Error downloading from '{}': '{}'".format(
                                source_url, exc))
+        checksum = FileChecksum()
         with NamedTemporaryFile(dir=get_temp_dir()) as temp_file:
             download_file_object(
                 request_response, temp_file, ProgressPercentage(
                     source_url, self.request.id, 0, 50
-                )
+                ), checksum
             )
             temp_file.seek(0)
             storage = S3MediaStorage()
@@ -218,7 +242,7 @@ class FileImportTask(celery.Task):
                 temp_file, settings.MEDIA_BUCKET, file_store_name,
                 ProgressPercentage(temp_file.name, self.request.id, 50, 100)
             )
-        return file_store_name
+        return file_store_name, checksum
 
 
 class ProgressPercentage(object):
@@ -1,4 +1,6 @@
+import hashlib
 import os
+from StringIO import StringIO
 from urlparse import urljoin
 import uuid
 
@@ -12,7 +14,8 @@ from override_storage import override_storage
 
 from .models import (FileExtension, FileStoreItem, FileType,
                      _get_extension_from_string, _map_source,
-                     generate_file_source_translator, get_temp_dir)
+                     generate_file_source_translator, get_temp_dir,
+                     get_total_file_size)
 
 
 class FileStoreModuleTest(TestCase):
@@ -213,6 +216,29 @@ class FileStoreItemLocalFileTest(TestCase):
             file_store_item_to_transfer_data_file_to.datafile.name
         )
 
+    def test_save_datafile_records_size_and_checksum(self):
+        self.item.save_datafile(self.file_name, StringIO('test content'))
+        saved_item = FileStoreItem.objects.get(pk=self.item.pk)
+        self.assertEqual(saved_item.size, len('test content'))
+        self.assertEqual(saved_item.checksum,
+                         hashlib.md5('test content').hexdigest())
+        self.assertEqual(saved_item.datafile.read(), 'test content')
+
+    def test_get_file_size_uses_recorded_size(self):
+        self.item.save_datafile(self.file_name, StringIO('test content'))
+        with mock.patch.object(FieldFile, 'size',
+                               new_callable=mock.PropertyMock) as mock_size:
+            self.assertEqual(self.item.get_file_size(), len('test content'))
+            self.assertFalse(mock_size.called)
+
+    def test_get_total_file_size(self):
+        self.item.save_datafile(self.file_name, StringIO('test content'))
+        unrecorded_item = FileStoreItem()
+        unrecorded_item.datafile.save(self.file_name, ContentFile('content'))
+        FileStoreItem.objects.create()  # no datafile
+        self.assertEqual(get_total_file_size(FileStoreItem.objects.all()),
+                         len('test content') + len('content'))
+
 
 @override_settings(REFINERY_DATA_IMPORT_DIR='/import/path',
                    REFINERY_DEPLOYMENT_PLATFORM='vagrant',
@@ -1,4 +1,6 @@
+import hashlib
 import os
+from StringIO import StringIO
 from urlparse import urljoin
 
 from django.conf import settings
@@ -6,8 +8,9 @@ from django.test import SimpleTestCase
 
 import mock
 
-from .utils import (S3MediaStorage, SymlinkedFileSystemStorage, get_file_size,
-                    parse_s3_url, UNKNOWN_FILE_SIZE)
+from .utils import (ChecksumFile, FileChecksum, S3MediaStorage,
+                    SymlinkedFileSystemStorage, copy_file_object,
+                    get_file_size, parse_s3_url, UNKNOWN_FILE_SIZE)
 
 
 class GetFileSizeTest(SimpleTestCase):
@@ -90,3 +93,43 @@ class SymlinkedFileSystemStorageTest(SimpleTestCase):
         name = ''.join('a' for _ in range(256))
         self.storage.get_available_name(name)
         mock_get_available_name.assert_called_with('80/4c/' + name[-255:])
+
+
+class FileChecksumTest(SimpleTestCase):
+
+    def setUp(self):
+        self.content = 'test content'
+
+    def test_checksum_of_read_file_chunks(self):
+        checksum = FileChecksum()
+        content = ''.join(
+            ChecksumFile(StringIO(self.content), checksum).chunks(5)
+        )
+        self.assertEqual(content, self.content)
+        self.assertEqual(checksum.size, len(self.content))
+        self.assertEqual(checksum.hexdigest(),
+                         hashlib.md5(self.content).hexdigest())
+
+    def test_checksum_is_reset_when_file_is_read_again(self):
+        checksum = FileChecksum()
+        checksum_file = ChecksumFile(StringIO(self.content), checksum)
+        checksum_file.read()
+        checksum_file.seek(0)
+        checksum_file.read()
+        self.assertEqual(checksum.size, len(self.content))
+        self.assertEqual(checksum.hexdigest(),
+                         hashlib.md5(self.content).hexdigest())
+
+    @mock.patch('os.fsync')
+    def test_checksum_of_copied_file_object(self, mock_fsync):
+        source = StringIO(self.content)
+        source.name = 'source'
+        destination = StringIO()
+        destination.name = 'destination'
+        destination.fileno = lambda: None
+        checksum = FileChecksum()
+        copy_file_object(source, destination, checksum=checksum)
+        self.assertEqual(destination.getvalue(), self.content)
+        self.assertEqual(checksum.size, len(self.content))
+        self.assertEqual(checksum.hexdigest(),
+                         hashlib.md5(self.content).hexdigest())
@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import os
 import shutil
@@ -5,6 +6,7 @@ import stat
 import urlparse
 
 from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import FileSystemStorage
 from django.utils.crypto import get_random_string
 from django.utils.deconstruct import deconstructible
@@ -83,14 +85,57 @@ class SymlinkedFileSystemStorage(FileSystemStorage):
         return self.get_available_name(get_valid_filename(name))
 
 
-def copy_file_object(source, destination, progress_report=lambda _: None):
-    """Copy a file object and update progress"""
+class FileChecksum(object):
+    """Size and MD5 checksum of a file computed from its chunks while they
+    are transferred
+    """
+    def __init__(self):
+        self.size = 0
+        self._md5 = hashlib.md5()
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        self._md5.update(chunk)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def reset(self):
+        self.size = 0
+        self._md5 = hashlib.md5()
+
+
+class ChecksumFile(File):
+    """File that updates a FileChecksum with all content read from it, so
+    that storages compute the checksum while they save the file
+    """
+    def __init__(self, file, checksum, name=None):
+        super(ChecksumFile, self).__init__(file, name)
+        self.checksum = checksum
+
+    def read(self, *args, **kwargs):
+        chunk = self.file.read(*args, **kwargs)
+        self.checksum.update(chunk)
+        return chunk
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # storages rewind the file before (re-)reading it
+        if offset == 0 and whence == os.SEEK_SET:
+            self.checksum.reset()
+        return self.file.seek(offset, whence)
+
+
+def copy_file_object(source, destination, progress_report=lambda _: None,
+                     checksum=None):
+    """Copy a file object and update progress and checksum (FileChecksum)"""
     chunk_size = 10 * 1024 * 1024  # 10MB
     logger.debug("Copying '%s' to '%s'", source.name, destination.name)
     try:
         for chunk in iter(lambda: source.read(chunk_size), ''):
             destination.write(chunk)
             progress_report(len(chunk))
+            if checksum is not None:
+                checksum.update(chunk)
         # ensure that all internal buffers are written to disk
         destination.flush()
         os.fsync(destination.fileno())
@@ -148,15 +193,17 @@ def delete_s3_object(bucket, key):
 
 
 def download_file_object(request_response, download_object,
-                         progress_report=lambda _: None):
+                         progress_report=lambda _: None, checksum=None):
     """Download file from request response object to a temporary file and
-    report progress"""
+    report progress and update checksum (FileChecksum)"""
     chunk_size = 10 * 1024 * 1024  # 10MB
     logger.debug("Started downloading from '%s'", request_response.url)
     try:
         for chunk in request_response.iter_content(chunk_size):
             download_object.write(chunk)
             progress_report(len(chunk))
+            if checksum is not None:
+                checksum.update(chunk)
         # ensure that all internal buffers are written to disk
         download_object.flush()
         os.fsync(download_object.fileno())
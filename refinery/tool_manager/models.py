@@ -29,8 +29,8 @@ from analysis_manager.tasks import (_galaxy_file_import, get_taskset_result,
 from analysis_manager.utils import create_analysis, validate_analysis_config
 import constants
 from core.models import (INPUT_CONNECTION, OUTPUT_CONNECTION, Analysis,
-                         AnalysisNodeConnection, DataSet, OwnableResource,
-                         Workflow)
+                         AnalysisNodeConnection, DataSet, DataSetSummary,
+                         OwnableResource, Workflow)
 
 from core.models import Event
 from core.utils import get_absolute_url
@@ -624,6 +624,12 @@ def _visualization_saved(sender, instance, *args, **kwargs):
         )
 
 
+@receiver([post_save, post_delete], sender=VisualizationTool)
+def _visualization_changed(sender, instance, *args, **kwargs):
+    # visualizations change the data set's cleanliness
+    DataSetSummary.objects.refresh_analyses([instance.dataset_id])
+
+
 @receiver(pre_delete, sender=VisualizationTool)
 def remove_tool_container(sender, instance, *args, **kwargs):
     """
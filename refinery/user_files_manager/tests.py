@@ -1,4 +1,3 @@
-import json
 import logging
 from urlparse import urljoin
 
@@ -14,11 +13,13 @@ import requests
 from rest_framework.test import (APIRequestFactory, APITestCase,
                                  force_authenticate)
 
-from data_set_manager.models import Assay
+from core.models import ExtendedGroup
+from data_set_manager.models import Assay, Investigation, Study
 from data_set_manager.search_indexes import NodeIndex
 from factory_boy.utils import create_dataset_with_necessary_models
 
-from .utils import generate_solr_params_for_user
+from .utils import (generate_solr_params_for_user,
+                    get_accessible_assay_uuids)
 from .views import UserFiles, user_files_csv
 
 logger = logging.getLogger(__name__)
@@ -92,20 +93,40 @@ class UserFilesViewTests(TestCase):
             # Doesn't matter if the names are backwards.
         }
         with mock.patch(
-            'user_files_manager.views._get_solr',
-            return_value=json.dumps({
-                'response': {
-                    'docs': [mock_doc]
-                }
-            })
+            'user_files_manager.views._get_solr_docs',
+            return_value=iter([mock_doc])
         ):
             response = user_files_csv(request)
             self.assertEqual(
-                response.content,
+                ''.join(response.streaming_content),
                 'url,filename,fake\r\n'
                 'fake-url,fake-filename,\r\n'
             )
 
+    @mock.patch('django.conf.settings.USER_FILES_COLUMNS', 'filename')
+    def test_user_files_tsv(self):
+        request = RequestFactory().get('/fake-url', {'file_format': 'tsv'})
+        request.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        mock_doc = {
+            NodeIndex.DOWNLOAD_URL: 'fake-url',
+            'filename_Characteristics' + NodeIndex.GENERIC_SUFFIX: 'a,b'
+        }
+        with mock.patch(
+            'user_files_manager.views._get_solr_docs',
+            return_value=iter([mock_doc])
+        ):
+            response = user_files_csv(request)
+        self.assertEqual(response['Content-Type'],
+                         'text/tab-separated-values')
+        self.assertEqual(''.join(response.streaming_content),
+                         'url\tfilename\r\nfake-url\ta,b\r\n')
+
+    def test_user_files_csv_invalid_format(self):
+        request = RequestFactory().get('/fake-url', {'file_format': 'xls'})
+        request.user = get_anonymous_user()
+        self.assertEqual(user_files_csv(request).status_code, 400)
+
 
 class UserFilesUtilsTests(TestCase):
     @override_settings(USER_FILES_FACETS="filetype,organism,technology,"
@@ -183,10 +204,73 @@ class UserFilesUtilsTests(TestCase):
     def test_generate_solr_params_for_user_returns_json_filter(self):
         query = generate_solr_params_for_user(QueryDict({}), self.user.id)
         self.assertListEqual(query.get('json').get('filter'),
-                             ['assay_uuid:({})'.format(self.assay_uuid)]
-                             )
+                             ['assay_uuid:({})'.format(self.assay_uuid)])
 
     def test_generate_solr_params_for_user_returns_json_query(self):
         query = generate_solr_params_for_user(QueryDict({}), self.user.id)
         self.assertEqual(query.get('json').get('query'),
                          'django_ct:data_set_manager.node')
+
+    def test_get_accessible_assay_uuids(self):
+        self.assertEqual(get_accessible_assay_uuids(self.user),
+                         [self.assay_uuid])
+
+    def test_get_accessible_assay_uuids_from_latest_investigation(self):
+        investigation = Investigation.objects.create()
+        study = Study.objects.create(investigation=investigation)
+        assay = Assay.objects.create(study=study)
+        self.dataset.update_investigation(investigation, "new version")
+        self.assertEqual(get_accessible_assay_uuids(self.user), [assay.uuid])
+
+    def test_get_accessible_assay_uuids_without_perms(self):
+        other_user = User.objects.create_user(
+            'otheruser', 'other@example.com', 'password')
+        self.assertEqual(get_accessible_assay_uuids(other_user), [])
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }
+    })
+    def test_get_accessible_assay_uuids_cache_invalidated_on_perm_change(
+            self):
+        other_user = User.objects.create_user(
+            'otheruser', 'other@example.com', 'password')
+        self.assertEqual(get_accessible_assay_uuids(other_user), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_accessible_assay_uuids(other_user), [])
+        self.dataset.set_owner(other_user)
+        self.assertEqual(get_accessible_assay_uuids(other_user),
+                         [self.assay_uuid])
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }
+    })
+    def test_get_accessible_assay_uuids_cache_kept_on_other_users_change(
+            self):
+        other_user = User.objects.create_user(
+            'otheruser', 'other@example.com', 'password')
+        self.assertEqual(get_accessible_assay_uuids(self.user),
+                         [self.assay_uuid])
+        create_dataset_with_necessary_models(user=other_user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_accessible_assay_uuids(self.user),
+                             [self.assay_uuid])
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }
+    })
+    def test_get_accessible_assay_uuids_cache_invalidated_on_group_share(
+            self):
+        other_user = User.objects.create_user(
+            'otheruser', 'other@example.com', 'password')
+        group = ExtendedGroup.objects.create(name="Test Group")
+        group.user_set.add(other_user)
+        self.assertEqual(get_accessible_assay_uuids(other_user), [])
+        self.dataset.share(group)
+        self.assertEqual(get_accessible_assay_uuids(other_user),
+                         [self.assay_uuid])
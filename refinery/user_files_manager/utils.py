@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Max
 
 from guardian.shortcuts import get_objects_for_user
 
-from core.utils import accept_global_perms
-from data_set_manager.models import Assay, Study
+from core.models import InvestigationLink
+from core.utils import accept_global_perms, get_data_set_access_version
+from data_set_manager.models import Assay
 from data_set_manager.utils import generate_solr_params
 
 
@@ -29,6 +33,24 @@ def generate_solr_params_for_user(params, user_id):
     except User.DoesNotExist:
         user = User.get_anonymous()
 
+    return generate_solr_params(params,
+                                assay_uuids=get_accessible_assay_uuids(user),
+                                facets_from_config=True)
+
+
+def get_accessible_assay_uuids(user):
+    """Returns the UUIDs of the assays in the latest investigations of all
+    data sets the user can read, retrieved with a single query and cached
+    per user until the permissions or group memberships of the user or the
+    investigation links of data sets the user can access change
+    """
+    version = get_data_set_access_version(user.id)
+    cache_key = "accessible-assays-{}-{}".format(user.id, version)
+    if version is not None:
+        assay_uuids = cache.get(cache_key)
+        if assay_uuids is not None:
+            return assay_uuids
+
     # will update to allow users to view read_meta datasets then we can
     # update to use get_resources_for_user method in core/utils
     datasets = get_objects_for_user(user,
@@ -36,24 +58,19 @@ def generate_solr_params_for_user(params, user_id):
                                     accept_global_perms=accept_global_perms(
                                         'dataset'
                                     ))
+    # only the assays of the latest investigation link of each data set, links
+    # are created in date order (the same as
+    # DataSet.get_latest_investigation_link())
+    latest_link_ids = InvestigationLink.objects.filter(
+        data_set__in=datasets
+    ).values('data_set_id').annotate(latest_id=Max('id')).values('latest_id')
+    assay_uuids = list(
+        Assay.objects.filter(
+            study__investigation__investigationlink__id__in=latest_link_ids
+        ).values_list('uuid', flat=True).distinct()
+    )
 
-    assay_uuids = []
-    for dataset in datasets:
-        investigation_link = dataset.get_latest_investigation_link()
-        if investigation_link is None:
-            continue
-            # It's not an error not to have data,
-            # but there's nothing more to do here.
-        investigation = investigation_link.investigation
-
-        study_ids = Study.objects.filter(
-            investigation=investigation
-        ).values_list('id', flat=True)
-
-        assay_uuids += Assay.objects.filter(
-            study_id__in=study_ids
-        ).values_list('uuid', flat=True)
-
-    return generate_solr_params(params,
-                                assay_uuids=assay_uuids,
-                                facets_from_config=True)
+    if version is not None:
+        cache.set(cache_key, assay_uuids,
+                  settings.REFINERY_ACCESSIBLE_ASSAYS_CACHE_TIMEOUT)
+    return assay_uuids
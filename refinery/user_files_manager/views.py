@@ -1,9 +1,8 @@
-import csv
-from json import dumps, loads
+from json import dumps
 import logging
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 
@@ -12,7 +11,9 @@ from rest_framework.views import APIView
 from unidecode import unidecode
 
 from data_set_manager.search_indexes import NodeIndex
-from data_set_manager.utils import format_solr_response, search_solr
+from data_set_manager.utils import (EXPORT_FORMATS, format_solr_response,
+                                    iterate_solr_docs, search_solr,
+                                    stream_delimited_rows)
 
 from .utils import generate_solr_params_for_user
 
@@ -25,31 +26,44 @@ def user_files(request):
 
 
 def user_files_csv(request):
-    solr_response = _get_solr(request.GET, request.user.id)
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="user-files.csv"'
+    """Streams the files of a user as CSV (or TSV with file_format=tsv)
+    while they are retrieved from Solr page by page
+    """
+    file_format = request.GET.get('file_format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(
+            "Unsupported file format '{}'".format(file_format)
+        )
+    delimiter, content_type, extension = EXPORT_FORMATS[file_format]
 
     cols = settings.USER_FILES_COLUMNS.split(',')
-
-    writer = csv.writer(response)
-    writer.writerow(['url'] + cols)
     # DOWNLOAD_URL's internal solr name not good for end-user.
+    header = ['url'] + cols
+    rows = (
+        _get_user_file_row(doc, cols)
+        for doc in _get_solr_docs(request.GET, request.user.id)
+    )
+
+    response = StreamingHttpResponse(
+        stream_delimited_rows(header, rows, delimiter),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = \
+        'attachment; filename="user-files.{}"'.format(extension)
+    return response
 
-    docs = loads(solr_response)['response']['docs']
-    for doc in docs:
-        row = [doc.get(NodeIndex.DOWNLOAD_URL) or '']
-        for col in cols:
-            possibly_unicode = (
-                doc.get(col + '_Characteristics_generic_s') or
-                doc.get(col + '_Factor_Value_generic_s') or
-                doc.get(col) or
-                ''
-            )
-            row.append(unidecode(possibly_unicode))
-        writer.writerow(row)
 
-    return response
+def _get_user_file_row(doc, cols):
+    row = [doc.get(NodeIndex.DOWNLOAD_URL) or '']
+    for col in cols:
+        possibly_unicode = (
+            doc.get(col + '_Characteristics_generic_s') or
+            doc.get(col + '_Factor_Value_generic_s') or
+            doc.get(col) or
+            ''
+        )
+        row.append(unidecode(possibly_unicode))
+    return row
 
 
 class UserFiles(APIView):
@@ -73,3 +87,10 @@ def _get_solr(params, user_id):
         })
 
     return search_solr(solr_params, 'data_set_manager')
+
+
+def _get_solr_docs(params, user_id):
+    solr_params = generate_solr_params_for_user(params, user_id=user_id)
+    if solr_params is None:
+        return []
+    return iterate_solr_docs(solr_params, 'data_set_manager')